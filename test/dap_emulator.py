@@ -0,0 +1,1075 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Host side model of the CMSIS-DAP command processor
+
+DapEmulator follows DAP_ProcessCommand in source/daplink/cmsis-dap/DAP.c
+command for command, including posted AP reads, value matching and the
+vendor commands, for an SWD only interface built with the k20dx
+DAP_config.h settings.  The debug port it drives is a SimulatedTarget,
+a DP and MEM-AP in front of a RAM array.
+
+VirtualHidTransport exposes the emulator with the calls of a pyOCD HID
+interface (pyOCD.pyDAPAccess.interface.Interface) and queues responses
+in the same number of packet buffers as the firmware, so host side
+batching can be tried out and benchmarked without a board.  DapClient
+is a thin client for it, and pyocd_round_trip opens pyOCD's own
+CMSIS-DAP link on it.  Besides the host time, the emulator counts the
+SWD bits it would have clocked out and estimates how long that takes at
+the selected clock.
+
+Run this file to benchmark memory transfers with different transfer
+block sizes and numbers of packets in flight, or with --pyocd to check
+a memory round trip through pyOCD.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import sys
+import time
+import struct
+import random
+import argparse
+from collections import deque
+
+# Command IDs
+ID_DAP_INFO = 0x00
+ID_DAP_HOST_STATUS = 0x01
+ID_DAP_CONNECT = 0x02
+ID_DAP_DISCONNECT = 0x03
+ID_DAP_TRANSFER_CONFIGURE = 0x04
+ID_DAP_TRANSFER = 0x05
+ID_DAP_TRANSFER_BLOCK = 0x06
+ID_DAP_TRANSFER_ABORT = 0x07
+ID_DAP_WRITE_ABORT = 0x08
+ID_DAP_DELAY = 0x09
+ID_DAP_RESET_TARGET = 0x0A
+ID_DAP_SWJ_PINS = 0x10
+ID_DAP_SWJ_CLOCK = 0x11
+ID_DAP_SWJ_SEQUENCE = 0x12
+ID_DAP_SWD_CONFIGURE = 0x13
+ID_DAP_JTAG_SEQUENCE = 0x14
+ID_DAP_JTAG_CONFIGURE = 0x15
+ID_DAP_JTAG_IDCODE = 0x16
+ID_DAP_VENDOR0 = 0x80
+ID_DAP_VENDOR31 = 0x9F
+ID_DAP_INVALID = 0xFF
+
+DAP_OK = 0x00
+DAP_ERROR = 0xFF
+
+# DAP_Info IDs
+DAP_ID_VENDOR = 0x01
+DAP_ID_PRODUCT = 0x02
+DAP_ID_SER_NUM = 0x03
+DAP_ID_FW_VER = 0x04
+DAP_ID_DEVICE_VENDOR = 0x05
+DAP_ID_DEVICE_NAME = 0x06
+DAP_ID_CAPABILITIES = 0xF0
+DAP_ID_PACKET_COUNT = 0xFE
+DAP_ID_PACKET_SIZE = 0xFF
+
+DAP_FW_VER = b"1.0"
+
+DAP_PORT_AUTODETECT = 0
+DAP_PORT_DISABLED = 0
+DAP_PORT_SWD = 1
+DAP_PORT_JTAG = 2
+
+# Transfer request bits
+DAP_TRANSFER_APnDP = 1 << 0
+DAP_TRANSFER_RnW = 1 << 1
+DAP_TRANSFER_A2 = 1 << 2
+DAP_TRANSFER_A3 = 1 << 3
+DAP_TRANSFER_MATCH_VALUE = 1 << 4
+DAP_TRANSFER_MATCH_MASK = 1 << 5
+
+# Transfer response bits
+DAP_TRANSFER_OK = 1 << 0
+DAP_TRANSFER_WAIT = 1 << 1
+DAP_TRANSFER_FAULT = 1 << 2
+DAP_TRANSFER_ERROR = 1 << 3
+DAP_TRANSFER_MISMATCH = 1 << 4
+
+# DP registers
+DP_IDCODE = 0x00
+DP_ABORT = 0x00
+DP_CTRL_STAT = 0x04
+DP_SELECT = 0x08
+DP_RDBUFF = 0x0C
+
+# MEM-AP registers
+AP_CSW = 0x00
+AP_TAR = 0x04
+AP_DRW = 0x0C
+AP_BD0 = 0x10
+AP_BASE = 0xF8
+AP_IDR = 0xFC
+
+CSW_SIZE_MASK = 0x7
+CSW_ADDRINC_SINGLE = 0x10
+CSW_ADDRINC_MASK = 0x30
+CSW_VALUE = 0x23000000
+
+CTRL_STAT_STICKYERR = 1 << 5
+CTRL_STAT_CDBGPWRUPREQ = 1 << 28
+CTRL_STAT_CSYSPWRUPREQ = 1 << 30
+ABORT_ERRCLR = 0x1E
+
+# Auto increment of TAR only covers the low 10 bits
+TAR_INC_MASK = 0x3FF
+
+# Settings of the k20dx interface, from its DAP_config.h
+PACKET_SIZE = 64
+PACKET_COUNT = 5
+CPU_CLOCK = 48000000
+IO_PORT_WRITE_CYCLES = 2
+DELAY_SLOW_CYCLES = 3
+DELAY_FAST_CYCLES = 0
+DEFAULT_SWJ_CLOCK = 5000000
+
+DEFAULT_IDCODE = 0x2BA01477
+DEFAULT_AP_IDR = 0x24770011
+DEFAULT_RAM_START = 0x20000000
+DEFAULT_RAM_SIZE = 0x10000
+DEFAULT_UNIQUE_ID = "0240000000000000000000000000000000000000"
+
+# Response header sizes of DAP_TransferBlock and the request header size
+# when writing, which set how many words fit in one packet
+_BLOCK_READ_HEADER = 4
+_BLOCK_WRITE_HEADER = 5
+
+
+def _max_swj_clock(delay_cycles):
+    return CPU_CLOCK // 2 // (IO_PORT_WRITE_CYCLES + delay_cycles)
+
+
+def _u32(data, offset):
+    return struct.unpack_from("<I", bytes(data[offset:offset + 4]))[0]
+
+
+class SimulatedTarget(object):
+    """SWD debug port and MEM-AP in front of a RAM array
+
+    Keyword arguments:
+        ram_start - address of the RAM
+        ram_size - size of the RAM in bytes
+        idcode - value of the DP IDCODE register
+
+    AP reads are posted as on real hardware, so each returns the value
+    of the previous AP read and RDBUFF holds the last.  An access
+    outside the RAM sets the sticky error and is answered with a FAULT,
+    as are all AP accesses until the error is cleared through ABORT.
+    """
+
+    def __init__(self, ram_start=DEFAULT_RAM_START,
+                 ram_size=DEFAULT_RAM_SIZE, idcode=DEFAULT_IDCODE):
+        self.ram_start = ram_start
+        self.memory = bytearray(ram_size)
+        self.idcode = idcode
+        self.access_count = 0
+        self.reset()
+
+    def reset(self):
+        """Return the debug port to its power on state"""
+        self._ctrl_stat = 0
+        self._select = 0
+        self._rdbuff = 0
+        self._csw = 0
+        self._tar = 0
+
+    def transfer(self, request, data=0):
+        """Perform one SWD transfer and return (ack, data)
+
+        request holds the APnDP, RnW and address bits of a DAP transfer
+        request.  data is only used for writes.
+        """
+        self.access_count += 1
+        addr = request & (DAP_TRANSFER_A2 | DAP_TRANSFER_A3)
+        read = request & DAP_TRANSFER_RnW
+        if request & DAP_TRANSFER_APnDP:
+            if self._ctrl_stat & CTRL_STAT_STICKYERR:
+                return DAP_TRANSFER_FAULT, 0
+            addr |= self._select & 0xF0
+            if read:
+                try:
+                    value = self._read_ap(addr)
+                except IndexError:
+                    return self._fault()
+                posted, self._rdbuff = self._rdbuff, value
+                return DAP_TRANSFER_OK, posted
+            try:
+                self._write_ap(addr, data)
+            except IndexError:
+                return self._fault()
+            return DAP_TRANSFER_OK, 0
+        if read:
+            if addr == DP_IDCODE:
+                return DAP_TRANSFER_OK, self.idcode
+            if addr == DP_CTRL_STAT:
+                return DAP_TRANSFER_OK, self._ctrl_stat
+            # RESEND and RDBUFF both give the last AP read
+            return DAP_TRANSFER_OK, self._rdbuff
+        if addr == DP_ABORT:
+            if data & ABORT_ERRCLR:
+                self._ctrl_stat &= ~CTRL_STAT_STICKYERR
+        elif addr == DP_CTRL_STAT:
+            # Power up requests are acknowledged straight away
+            value = data & 0x5FFFFF00
+            self._ctrl_stat = (value | (value & 0x50000000) << 1 |
+                               self._ctrl_stat & CTRL_STAT_STICKYERR)
+        elif addr == DP_SELECT:
+            self._select = data
+        return DAP_TRANSFER_OK, 0
+
+    def _fault(self):
+        self._ctrl_stat |= CTRL_STAT_STICKYERR
+        return DAP_TRANSFER_FAULT, 0
+
+    def _read_ap(self, addr):
+        if self._select >> 24 != 0:
+            return 0
+        if addr == AP_CSW:
+            return self._csw
+        if addr == AP_TAR:
+            return self._tar
+        if addr == AP_DRW:
+            value = self._read_memory(self._tar)
+            self._increment_tar()
+            return value
+        if AP_BD0 <= addr < AP_BD0 + 0x10:
+            return self._read_memory((self._tar & ~0xF) | (addr & 0xC), 2)
+        if addr == AP_BASE:
+            return 0xE00FF003
+        if addr == AP_IDR:
+            return DEFAULT_AP_IDR
+        return 0
+
+    def _write_ap(self, addr, data):
+        if self._select >> 24 != 0:
+            return
+        if addr == AP_CSW:
+            self._csw = data
+        elif addr == AP_TAR:
+            self._tar = data
+        elif addr == AP_DRW:
+            self._write_memory(self._tar, data)
+            self._increment_tar()
+        elif AP_BD0 <= addr < AP_BD0 + 0x10:
+            self._write_memory((self._tar & ~0xF) | (addr & 0xC), data, 2)
+
+    def _get_offset(self, addr, size):
+        offset = addr - self.ram_start
+        if offset < 0 or offset + size > len(self.memory):
+            raise IndexError("0x%08x is outside of RAM" % addr)
+        return offset
+
+    def _read_memory(self, addr, size_code=None):
+        if size_code is None:
+            size_code = self._csw & CSW_SIZE_MASK
+        if size_code == 2:
+            offset = self._get_offset(addr & ~3, 4)
+            return _u32(self.memory, offset)
+        size = 1 << size_code
+        addr &= ~(size - 1)
+        offset = self._get_offset(addr, size)
+        # Narrow accesses use the byte lanes of the addressed bytes
+        value = 0
+        for index in range(size):
+            value |= self.memory[offset + index] << (index * 8)
+        return value << ((addr & 3) * 8)
+
+    def _write_memory(self, addr, data, size_code=None):
+        if size_code is None:
+            size_code = self._csw & CSW_SIZE_MASK
+        size = 1 << min(size_code, 2)
+        addr &= ~(size - 1)
+        offset = self._get_offset(addr, size)
+        data >>= (addr & 3) * 8
+        for index in range(size):
+            self.memory[offset + index] = (data >> (index * 8)) & 0xFF
+
+    def _increment_tar(self):
+        if self._csw & CSW_ADDRINC_MASK != CSW_ADDRINC_SINGLE:
+            return
+        size = 1 << min(self._csw & CSW_SIZE_MASK, 2)
+        self._tar = ((self._tar & ~TAR_INC_MASK) |
+                     ((self._tar + size) & TAR_INC_MASK))
+
+
+class DapEmulator(object):
+    """CMSIS-DAP command processor driving a SimulatedTarget
+
+    Positional arguments:
+        target - SimulatedTarget to debug
+
+    Keyword arguments:
+        unique_id - string returned by the vendor 0 command
+        packet_size - DAP_PACKET_SIZE of the emulated interface
+        packet_count - DAP_PACKET_COUNT of the emulated interface
+    """
+
+    def __init__(self, target, unique_id=DEFAULT_UNIQUE_ID,
+                 packet_size=PACKET_SIZE, packet_count=PACKET_COUNT):
+        assert 64 <= packet_size <= 32768
+        assert 1 <= packet_count <= 255
+        self.target = target
+        self.unique_id = unique_id
+        self.packet_size = packet_size
+        self.packet_count = packet_count
+        self.command_count = 0
+        self.swd_bits = 0
+        self.wire_time = 0.0
+        self.transfer_abort = False
+        self._setup()
+
+    def _setup(self):
+        """Default settings from DAP_Setup"""
+        self.debug_port = DAP_PORT_DISABLED
+        self.fast_clock = False
+        self.clock_delay = (CPU_CLOCK // 2 // DEFAULT_SWJ_CLOCK -
+                            IO_PORT_WRITE_CYCLES)
+        self.idle_cycles = 0
+        self.retry_count = 100
+        self.match_retry = 0
+        self.match_mask = 0
+        self.turnaround = 1
+        self.data_phase = 0
+        self.pins = 0xFF
+
+    @property
+    def swj_clock(self):
+        """SWD clock in Hz for the current clock settings"""
+        if self.fast_clock:
+            return _max_swj_clock(DELAY_FAST_CYCLES)
+        return _max_swj_clock(self.clock_delay * DELAY_SLOW_CYCLES)
+
+    def abort(self):
+        """Handle a DAP_TransferAbort, which has no response"""
+        self.transfer_abort = True
+
+    def process_command(self, request):
+        """Process a command and return the response as a bytearray"""
+        request = bytearray(request)
+        command = request[0]
+        self.command_count += 1
+        if ID_DAP_VENDOR0 <= command <= ID_DAP_VENDOR31:
+            return self._process_vendor_command(request)
+
+        args = request[1:]
+        if command == ID_DAP_INFO:
+            info = self._info(args[0])
+            return bytearray([command, len(info)]) + info
+        elif command == ID_DAP_HOST_STATUS:
+            status = DAP_OK if args[0] in (0, 1) else DAP_ERROR
+            response = bytearray([status])
+        elif command == ID_DAP_CONNECT:
+            port = DAP_PORT_SWD if args[0] == DAP_PORT_AUTODETECT else args[0]
+            if port == DAP_PORT_SWD:
+                self.debug_port = port
+                response = bytearray([port])
+            else:
+                response = bytearray([DAP_PORT_DISABLED])
+        elif command == ID_DAP_DISCONNECT:
+            self.debug_port = DAP_PORT_DISABLED
+            response = bytearray([DAP_OK])
+        elif command == ID_DAP_DELAY:
+            self.wire_time += struct.unpack_from("<H", bytes(args))[0] / 1e6
+            response = bytearray([DAP_OK])
+        elif command == ID_DAP_RESET_TARGET:
+            # No interface specific reset sequence
+            response = bytearray([DAP_OK, 0])
+        elif command == ID_DAP_SWJ_PINS:
+            select = args[1]
+            self.pins = (self.pins & ~select | args[0] & select) & 0xFF
+            response = bytearray([self.pins])
+        elif command == ID_DAP_SWJ_CLOCK:
+            response = bytearray([self._swj_clock(_u32(args, 0))])
+        elif command == ID_DAP_SWJ_SEQUENCE:
+            self._clock_bits(args[0] or 256)
+            response = bytearray([DAP_OK])
+        elif command == ID_DAP_SWD_CONFIGURE:
+            self.turnaround = (args[0] & 0x03) + 1
+            self.data_phase = 1 if args[0] & 0x04 else 0
+            response = bytearray([DAP_OK])
+        elif command in (ID_DAP_JTAG_SEQUENCE, ID_DAP_JTAG_CONFIGURE,
+                         ID_DAP_JTAG_IDCODE):
+            return bytearray([command, DAP_ERROR])
+        elif command == ID_DAP_TRANSFER_CONFIGURE:
+            self.idle_cycles = args[0]
+            self.retry_count, self.match_retry = \
+                struct.unpack_from("<HH", bytes(args[1:5]))
+            response = bytearray([DAP_OK])
+        elif command == ID_DAP_TRANSFER:
+            if self.debug_port == DAP_PORT_SWD:
+                response = self._swd_transfer(args)
+            else:
+                response = bytearray([0, 0])
+        elif command == ID_DAP_TRANSFER_BLOCK:
+            if self.debug_port == DAP_PORT_SWD:
+                response = self._swd_transfer_block(args)
+            else:
+                response = bytearray([0, 0, 0])
+        elif command == ID_DAP_WRITE_ABORT:
+            if self.debug_port != DAP_PORT_SWD:
+                return bytearray([command, DAP_ERROR])
+            self._transfer(DP_ABORT, _u32(args, 1))
+            response = bytearray([DAP_OK])
+        else:
+            return bytearray([ID_DAP_INVALID])
+        return bytearray([command]) + response
+
+    def _process_vendor_command(self, request):
+        """Model of DAP_ProcessVendorCommand in dap_vendor_command.c"""
+        if request[0] == ID_DAP_VENDOR0:
+            id_str = bytearray(self.unique_id.encode("ascii"))
+            return bytearray([ID_DAP_VENDOR0, len(id_str)]) + id_str
+        return bytearray([ID_DAP_INVALID])
+
+    def _info(self, info_id):
+        # The vendor, product and device strings are not configured in
+        # the DAPLink builds, so the firmware returns nothing for them
+        if info_id == DAP_ID_FW_VER:
+            return bytearray(DAP_FW_VER + b"\0")
+        if info_id == DAP_ID_CAPABILITIES:
+            return bytearray([1])
+        if info_id == DAP_ID_PACKET_SIZE:
+            return bytearray(struct.pack("<H", self.packet_size))
+        if info_id == DAP_ID_PACKET_COUNT:
+            return bytearray([self.packet_count])
+        return bytearray()
+
+    def _swj_clock(self, clock):
+        if clock == 0:
+            return DAP_ERROR
+        if clock >= _max_swj_clock(DELAY_FAST_CYCLES):
+            self.fast_clock = True
+            self.clock_delay = 1
+        else:
+            self.fast_clock = False
+            delay = (CPU_CLOCK // 2 + (clock - 1)) // clock
+            if delay > IO_PORT_WRITE_CYCLES:
+                delay -= IO_PORT_WRITE_CYCLES
+                delay = (delay + (DELAY_SLOW_CYCLES - 1)) // DELAY_SLOW_CYCLES
+            else:
+                delay = 1
+            self.clock_delay = delay
+        return DAP_OK
+
+    def _clock_bits(self, count):
+        self.swd_bits += count
+        self.wire_time += count / self.swj_clock
+
+    def _transfer(self, request, data=0):
+        """SWD_Transfer retried on WAIT as the firmware does"""
+        retry = self.retry_count
+        while True:
+            # Request, turnaround, ack, data with parity and turnaround
+            self._clock_bits(46 + 2 * self.turnaround + self.idle_cycles)
+            ack, value = self.target.transfer(request, data)
+            if ack != DAP_TRANSFER_WAIT or retry == 0 or \
+                    self.transfer_abort:
+                return ack, value
+            retry -= 1
+
+    def _swd_transfer(self, request):
+        """Model of DAP_SWD_Transfer"""
+        self.transfer_abort = False
+        data_list = []
+        response_count = 0
+        response_value = 0
+        post_read = False
+        check_write = False
+        request_count = request[1]
+        pos = 2
+        while request_count:
+            request_count -= 1
+            request_value = request[pos]
+            pos += 1
+            if request_value & DAP_TRANSFER_RnW:
+                if post_read:
+                    if request_value & (DAP_TRANSFER_APnDP |
+                                        DAP_TRANSFER_MATCH_VALUE) == \
+                            DAP_TRANSFER_APnDP:
+                        # Read previous AP data and post next AP read
+                        response_value, data = self._transfer(request_value)
+                    else:
+                        response_value, data = self._transfer(
+                            DP_RDBUFF | DAP_TRANSFER_RnW)
+                        post_read = False
+                    if response_value != DAP_TRANSFER_OK:
+                        break
+                    data_list.append(data)
+                if request_value & DAP_TRANSFER_MATCH_VALUE:
+                    match_value = _u32(request, pos)
+                    pos += 4
+                    match_retry = self.match_retry
+                    if request_value & DAP_TRANSFER_APnDP:
+                        response_value, _ = self._transfer(request_value)
+                        if response_value != DAP_TRANSFER_OK:
+                            break
+                    while True:
+                        response_value, data = self._transfer(request_value)
+                        if response_value != DAP_TRANSFER_OK or \
+                                data & self.match_mask == match_value or \
+                                match_retry == 0 or self.transfer_abort:
+                            break
+                        match_retry -= 1
+                    if data & self.match_mask != match_value:
+                        response_value |= DAP_TRANSFER_MISMATCH
+                    if response_value != DAP_TRANSFER_OK:
+                        break
+                elif request_value & DAP_TRANSFER_APnDP:
+                    if not post_read:
+                        response_value, _ = self._transfer(request_value)
+                        if response_value != DAP_TRANSFER_OK:
+                            break
+                        post_read = True
+                else:
+                    response_value, data = self._transfer(request_value)
+                    if response_value != DAP_TRANSFER_OK:
+                        break
+                    data_list.append(data)
+                check_write = False
+            else:
+                if post_read:
+                    response_value, data = self._transfer(
+                        DP_RDBUFF | DAP_TRANSFER_RnW)
+                    if response_value != DAP_TRANSFER_OK:
+                        break
+                    data_list.append(data)
+                    post_read = False
+                data = _u32(request, pos)
+                pos += 4
+                if request_value & DAP_TRANSFER_MATCH_MASK:
+                    self.match_mask = data
+                    response_value = DAP_TRANSFER_OK
+                else:
+                    response_value, _ = self._transfer(request_value, data)
+                    if response_value != DAP_TRANSFER_OK:
+                        break
+                    check_write = True
+            response_count += 1
+            if self.transfer_abort:
+                break
+
+        if response_value == DAP_TRANSFER_OK:
+            if post_read:
+                response_value, data = self._transfer(
+                    DP_RDBUFF | DAP_TRANSFER_RnW)
+                if response_value == DAP_TRANSFER_OK:
+                    data_list.append(data)
+            elif check_write:
+                response_value, _ = self._transfer(
+                    DP_RDBUFF | DAP_TRANSFER_RnW)
+
+        return (bytearray([response_count & 0xFF, response_value]) +
+                bytearray(struct.pack("<%iI" % len(data_list), *data_list)))
+
+    def _swd_transfer_block(self, request):
+        """Model of DAP_SWD_TransferBlock"""
+        self.transfer_abort = False
+        data_list = []
+        response_value = 0
+        request_count = struct.unpack_from("<H", bytes(request[1:3]))[0]
+        write_count = 0
+        if request_count:
+            request_value = request[3]
+            if request_value & DAP_TRANSFER_RnW:
+                data_list, response_value = self._read_block(request_value,
+                                                             request_count)
+            else:
+                write_count, response_value = self._write_block(
+                    request_value, request, request_count)
+        response_count = max(len(data_list), write_count)
+        return (bytearray(struct.pack("<HB", response_count,
+                                      response_value)) +
+                bytearray(struct.pack("<%iI" % len(data_list), *data_list)))
+
+    def _read_block(self, request_value, request_count):
+        data_list = []
+        if request_value & DAP_TRANSFER_APnDP:
+            # Post AP read
+            response_value, _ = self._transfer(request_value)
+            if response_value != DAP_TRANSFER_OK:
+                return data_list, response_value
+        while request_count:
+            request_count -= 1
+            if request_count == 0 and request_value & DAP_TRANSFER_APnDP:
+                # Last AP read
+                request_value = DP_RDBUFF | DAP_TRANSFER_RnW
+            response_value, data = self._transfer(request_value)
+            if response_value != DAP_TRANSFER_OK:
+                break
+            data_list.append(data)
+        return data_list, response_value
+
+    def _write_block(self, request_value, request, request_count):
+        count = 0
+        for offset in range(4, 4 + request_count * 4, 4):
+            response_value, _ = self._transfer(request_value,
+                                               _u32(request, offset))
+            if response_value != DAP_TRANSFER_OK:
+                return count, response_value
+            count += 1
+        # Check last write
+        response_value, _ = self._transfer(DP_RDBUFF | DAP_TRANSFER_RnW)
+        return count, response_value
+
+
+class VirtualHidTransport(object):
+    """HID like transport connected to a DapEmulator
+
+    Has the methods and attributes of a pyOCD HID interface.  Like the
+    firmware, requests sent while all packet buffers hold unread
+    responses are discarded.  Responses are padded to the packet size.
+    The packet count and size set by the host do not change the buffers
+    of the emulator.
+
+    Positional arguments:
+        emulator - DapEmulator processing the commands
+    """
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.vid = 0x0D28
+        self.pid = 0x0204
+        self.vendor_name = "ARM"
+        self.product_name = "DAPLink CMSIS-DAP"
+        self.serial_number = emulator.unique_id
+        self.packet_size = emulator.packet_size
+        self.packet_count = emulator.packet_count
+        self._response_queue = deque()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Clear the packet counts"""
+        self.packets_written = 0
+        self.packets_read = 0
+        self.packets_dropped = 0
+        self.max_in_flight = 0
+
+    def init(self):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        self._response_queue.clear()
+
+    def getInfo(self):
+        return "%s %s (0x%04x, 0x%04x)" % (self.vendor_name,
+                                           self.product_name,
+                                           self.vid, self.pid)
+
+    def getSerialNumber(self):
+        return self.serial_number
+
+    def setPacketCount(self, count):
+        self.packet_count = count
+
+    def getPacketCount(self):
+        return self.packet_count
+
+    def setPacketSize(self, size):
+        self.packet_size = size
+
+    def write(self, data):
+        """Send one request packet"""
+        data = bytearray(data)
+        packet_size = self.emulator.packet_size
+        if len(data) > packet_size:
+            raise Exception("Request of %i bytes exceeds the packet size %i" %
+                            (len(data), packet_size))
+        if not data:
+            return
+        self.packets_written += 1
+        if data[0] == ID_DAP_TRANSFER_ABORT:
+            self.emulator.abort()
+            return
+        if len(self._response_queue) >= self.emulator.packet_count:
+            self.packets_dropped += 1
+            return
+        data.extend(bytearray(packet_size - len(data)))
+        response = self.emulator.process_command(data)
+        response.extend(bytearray(packet_size - len(response)))
+        self._response_queue.append(response)
+        self.max_in_flight = max(self.max_in_flight,
+                                 len(self._response_queue))
+
+    def read(self, size=-1, timeout=-1):
+        """Return the oldest response packet as a list of ints
+
+        Responses are queued as soon as a request is written, so there
+        is nothing to wait for and a read with none pending fails
+        straight away whatever the timeout.
+        """
+        if not self._response_queue:
+            raise Exception("Read with no response pending")
+        self.packets_read += 1
+        return list(self._response_queue.popleft())
+
+
+class DapClient(object):
+    """Minimal CMSIS-DAP host for a VirtualHidTransport or HID interface
+
+    Positional arguments:
+        transport - object with write(data) and read() of single packets
+
+    Keyword arguments:
+        pipeline - most request packets sent before reading responses
+    """
+
+    def __init__(self, transport, pipeline=1):
+        assert 1 <= pipeline <= transport.packet_count
+        self._transport = transport
+        self._packet_size = transport.packet_size
+        self.pipeline = pipeline
+
+    @property
+    def max_block_read(self):
+        """Most words read by one DAP_TransferBlock"""
+        return (self._packet_size - _BLOCK_READ_HEADER) // 4
+
+    @property
+    def max_block_write(self):
+        """Most words written by one DAP_TransferBlock"""
+        return (self._packet_size - _BLOCK_WRITE_HEADER) // 4
+
+    def command(self, request):
+        """Send one command and return its response"""
+        return self.exchange([request])[0]
+
+    def exchange(self, request_list):
+        """Send commands keeping up to pipeline in flight
+
+        The responses are returned in order.
+        """
+        response_list = []
+        in_flight = 0
+        for request in request_list:
+            if in_flight == self.pipeline:
+                response_list.append(self._read())
+                in_flight -= 1
+            self._transport.write(request)
+            in_flight += 1
+        while in_flight:
+            response_list.append(self._read())
+            in_flight -= 1
+        for request, response in zip(request_list, response_list):
+            if response[0] != bytearray(request)[0]:
+                raise Exception("Response 0x%02x to command 0x%02x" %
+                                (response[0], bytearray(request)[0]))
+        return response_list
+
+    def _read(self):
+        return bytearray(self._transport.read())
+
+    def get_info(self, info_id):
+        response = self.command([ID_DAP_INFO, info_id])
+        return response[2:2 + response[1]]
+
+    def get_unique_id(self):
+        response = self.command([ID_DAP_VENDOR0])
+        return bytes(response[2:2 + response[1]]).decode("ascii")
+
+    def connect(self, clock=DEFAULT_SWJ_CLOCK):
+        """Connect, reset the SWD line and power up the debug port"""
+        response_list = self.exchange([
+            [ID_DAP_CONNECT, DAP_PORT_SWD],
+            bytearray([ID_DAP_SWJ_CLOCK]) + struct.pack("<I", clock),
+            [ID_DAP_TRANSFER_CONFIGURE, 0, 100, 0, 0, 0],
+            [ID_DAP_SWJ_SEQUENCE, 51] + [0xFF] * 7,
+        ])
+        if response_list[0][1] != DAP_PORT_SWD:
+            raise Exception("Connect failed")
+        idcode = self.read_dp(DP_IDCODE)
+        self.write_dp(DP_ABORT, ABORT_ERRCLR)
+        self.write_dp(DP_CTRL_STAT,
+                      CTRL_STAT_CSYSPWRUPREQ | CTRL_STAT_CDBGPWRUPREQ)
+        self.write_dp(DP_SELECT, 0)
+        self.write_ap(AP_CSW, CSW_VALUE | CSW_ADDRINC_SINGLE | 2)
+        return idcode
+
+    def disconnect(self):
+        self.command([ID_DAP_DISCONNECT])
+
+    def _transfer(self, transfer_list):
+        """Perform (request, value) transfers and return the read data"""
+        request = bytearray([ID_DAP_TRANSFER, 0, len(transfer_list)])
+        read_count = 0
+        for request_value, value in transfer_list:
+            request.append(request_value)
+            if request_value & DAP_TRANSFER_RnW:
+                read_count += 1
+            else:
+                request.extend(struct.pack("<I", value))
+        response = self.command(request)
+        if response[1] != len(transfer_list) or \
+                response[2] != DAP_TRANSFER_OK:
+            raise Exception("Transfer failed with response 0x%02x after "
+                            "%i transfers" % (response[2], response[1]))
+        return list(struct.unpack_from("<%iI" % read_count,
+                                       bytes(response[3:3 + read_count * 4])))
+
+    def read_dp(self, addr):
+        return self._transfer([(addr | DAP_TRANSFER_RnW, 0)])[0]
+
+    def write_dp(self, addr, value):
+        self._transfer([(addr, value)])
+
+    def read_ap(self, addr):
+        return self._transfer([(addr | DAP_TRANSFER_APnDP |
+                                DAP_TRANSFER_RnW, 0)])[0]
+
+    def write_ap(self, addr, value):
+        self._transfer([(addr | DAP_TRANSFER_APnDP, value)])
+
+    def _get_requests(self, addr, count, block_words, make_block):
+        """Split an access into TAR writes and transfer blocks
+
+        TAR is only written at the start and where auto increment wraps
+        at a 1KB boundary.
+        """
+        assert addr % 4 == 0
+        request_list = []
+        index = 0
+        while index < count:
+            tar = addr + index * 4
+            page_words = min((TAR_INC_MASK + 1 - (tar & TAR_INC_MASK)) // 4,
+                             count - index)
+            request = bytearray([ID_DAP_TRANSFER, 0, 1,
+                                 AP_TAR | DAP_TRANSFER_APnDP])
+            request.extend(struct.pack("<I", tar))
+            request_list.append(request)
+            for start in range(index, index + page_words, block_words):
+                words = min(block_words, index + page_words - start)
+                request_list.append(make_block(start, words))
+            index += page_words
+        return request_list
+
+    def read_memory32(self, addr, count, block_words=None):
+        """Read count words from addr with block_words per transfer block"""
+        if block_words is None:
+            block_words = self.max_block_read
+        assert 1 <= block_words <= self.max_block_read
+
+        def make_block(start, words):
+            return bytearray([ID_DAP_TRANSFER_BLOCK, 0]) + \
+                struct.pack("<HB", words, AP_DRW | DAP_TRANSFER_APnDP |
+                            DAP_TRANSFER_RnW)
+        request_list = self._get_requests(addr, count, block_words,
+                                          make_block)
+        word_list = []
+        for request, response in zip(request_list,
+                                     self.exchange(request_list)):
+            self._check_response(request, response)
+            if request[0] == ID_DAP_TRANSFER_BLOCK:
+                words = struct.unpack_from("<H", bytes(response[1:3]))[0]
+                word_list.extend(struct.unpack_from(
+                    "<%iI" % words, bytes(response[4:4 + words * 4])))
+        return word_list
+
+    def write_memory32(self, addr, word_list, block_words=None):
+        """Write words to addr with block_words per transfer block"""
+        if block_words is None:
+            block_words = self.max_block_write
+        assert 1 <= block_words <= self.max_block_write
+
+        def make_block(start, words):
+            return bytearray([ID_DAP_TRANSFER_BLOCK, 0]) + \
+                struct.pack("<HB%iI" % words, words,
+                            AP_DRW | DAP_TRANSFER_APnDP,
+                            *word_list[start:start + words])
+        request_list = self._get_requests(addr, len(word_list), block_words,
+                                          make_block)
+        for request, response in zip(request_list,
+                                     self.exchange(request_list)):
+            self._check_response(request, response)
+
+    def _check_response(self, request, response):
+        if request[0] == ID_DAP_TRANSFER:
+            ok = response[1] == request[2] and \
+                response[2] == DAP_TRANSFER_OK
+        else:
+            ok = response[1:3] == request[2:4] and \
+                response[3] == DAP_TRANSFER_OK
+        if not ok:
+            raise Exception("Memory transfer failed: %s" %
+                            " ".join("%02x" % value for value in
+                                     response[0:4]))
+
+
+def benchmark_batching(test_info, size=0x10000, clock=DEFAULT_SWJ_CLOCK,
+                       block_list=None, pipeline_list=None, seed=0):
+    """Time writing and reading back size bytes with each batching setting
+
+    Every combination of words per transfer block and packets in flight
+    is run against a fresh emulator.  The number of packets, most
+    responses queued at once, host time and estimated SWD wire time of
+    each is added to test_info.
+    """
+    target = SimulatedTarget(ram_size=size)
+    emulator = DapEmulator(target)
+    transport = VirtualHidTransport(emulator)
+    client = DapClient(transport)
+    if block_list is None:
+        block_list = [1, 4, 8, client.max_block_write]
+    if pipeline_list is None:
+        pipeline_list = [1, 2, transport.packet_count]
+    rand = random.Random(seed)
+    word_list = [rand.getrandbits(32) for _ in range(size // 4)]
+
+    test_info.info("Batching benchmark of 0x%x bytes at %i Hz" %
+                   (size, clock))
+    test_info.info("  words/block  in flight  queued  packets  host s  "
+                   "wire s  KB/s (wire)")
+    for block_words in block_list:
+        for pipeline in pipeline_list:
+            target.memory[:] = bytearray(size)
+            emulator = DapEmulator(target)
+            transport = VirtualHidTransport(emulator)
+            client = DapClient(transport, pipeline)
+            client.connect(clock)
+            transport.reset_stats()
+            emulator.wire_time = 0.0
+            start = time.time()
+            client.write_memory32(target.ram_start, word_list, block_words)
+            read_list = client.read_memory32(
+                target.ram_start, len(word_list),
+                min(block_words, client.max_block_read))
+            host_time = time.time() - start
+            if read_list != word_list:
+                test_info.failure("Data read back differs with %i words "
+                                  "per block" % block_words)
+            if transport.packets_dropped:
+                test_info.failure("%i packets dropped" %
+                                  transport.packets_dropped)
+            test_info.info("  %11i  %9i  %6i  %7i  %6.3f  %6.3f  %11.1f" %
+                           (block_words, pipeline, transport.max_in_flight,
+                            transport.packets_written, host_time,
+                            emulator.wire_time,
+                            2 * size / 1024 / max(emulator.wire_time, 1e-9)))
+
+
+def pyocd_round_trip(test_info, size=0x1000, clock=DEFAULT_SWJ_CLOCK,
+                     seed=0):
+    """Write and read back size bytes through pyOCD's CMSIS-DAP link
+
+    pyOCD is given a VirtualHidTransport in place of the HID devices it
+    would find, opens a DAPAccessCMSISDAP link on it by unique ID and
+    drives the MEM-AP with its own deferred transfers.
+    """
+    from pyOCD.pyDAPAccess import DAPAccess
+    from pyOCD.pyDAPAccess import dap_access_cmsis_dap
+
+    target = SimulatedTarget(ram_size=size)
+    emulator = DapEmulator(target)
+    transport = VirtualHidTransport(emulator)
+    rand = random.Random(seed)
+    word_list = [rand.getrandbits(32) for _ in range(size // 4)]
+    page_words = (TAR_INC_MASK + 1) // 4
+
+    get_interfaces = dap_access_cmsis_dap._get_interfaces
+    dap_access_cmsis_dap._get_interfaces = lambda: [transport]
+    try:
+        link = dap_access_cmsis_dap.DAPAccessCMSISDAP(
+            transport.getSerialNumber())
+        link.open()
+        try:
+            link.set_clock(clock)
+            link.connect()
+            idcode = link.read_reg(DAPAccess.REG.DP_0x0)
+            test_info.info("pyOCD connected to IDCODE 0x%08x with %i "
+                           "packets of %i bytes" %
+                           (idcode, transport.getPacketCount(),
+                            transport.packet_size))
+            link.write_reg(DAPAccess.REG.DP_0x0, ABORT_ERRCLR)
+            link.write_reg(DAPAccess.REG.DP_0x4, CTRL_STAT_CSYSPWRUPREQ |
+                           CTRL_STAT_CDBGPWRUPREQ)
+            link.write_reg(DAPAccess.REG.DP_0x8, 0)
+            link.write_reg(DAPAccess.REG.AP_0x0,
+                           CSW_VALUE | CSW_ADDRINC_SINGLE | 2)
+            transport.reset_stats()
+            start = time.time()
+            for index in range(0, len(word_list), page_words):
+                page = word_list[index:index + page_words]
+                link.write_reg(DAPAccess.REG.AP_0x4,
+                               target.ram_start + index * 4)
+                link.reg_write_repeat(len(page), DAPAccess.REG.AP_0xC, page)
+            read_list = []
+            for index in range(0, len(word_list), page_words):
+                link.write_reg(DAPAccess.REG.AP_0x4,
+                               target.ram_start + index * 4)
+                read_list.extend(link.reg_read_repeat(
+                    min(page_words, len(word_list) - index),
+                    DAPAccess.REG.AP_0xC))
+            link.flush()
+            host_time = time.time() - start
+        finally:
+            link.close()
+    finally:
+        dap_access_cmsis_dap._get_interfaces = get_interfaces
+
+    if list(read_list) != word_list:
+        test_info.failure("Data read back through pyOCD differs")
+    if transport.packets_dropped:
+        test_info.failure("pyOCD overran the packet buffers: %i packets "
+                          "dropped" % transport.packets_dropped)
+    test_info.info("pyOCD round trip of 0x%x bytes: %i packets, at most "
+                   "%i queued, %.3f s host time" %
+                   (size, transport.packets_written,
+                    transport.max_in_flight, host_time))
+
+
+def main():
+    from test_info import TestInfo
+
+    parser = argparse.ArgumentParser(description='Benchmark CMSIS-DAP '
+                                     'batching against an emulated '
+                                     'interface')
+    parser.add_argument('--size', type=lambda x: int(x, 0), default=0x10000,
+                        help='Bytes written and read back for each setting')
+    parser.add_argument('--clock', type=int, default=DEFAULT_SWJ_CLOCK,
+                        help='SWD clock in Hz')
+    parser.add_argument('--blocks', type=int, nargs='+', default=None,
+                        help='Words per transfer block to try')
+    parser.add_argument('--inflight', type=int, nargs='+', default=None,
+                        help='Packets in flight to try, at most %i' %
+                        PACKET_COUNT)
+    parser.add_argument('--pyocd', action='store_true', default=False,
+                        help='Check a memory round trip through pyOCD '
+                        'instead of benchmarking')
+    args = parser.parse_args()
+
+    test_info = TestInfo('CMSIS-DAP emulator')
+    if args.pyocd:
+        pyocd_round_trip(test_info, args.size, args.clock)
+    else:
+        benchmark_batching(test_info, args.size, args.clock, args.blocks,
+                           args.inflight)
+    print('')
+    test_info.print_msg(TestInfo.INFO, None)
+    sys.exit(-1 if test_info.get_failed() else 0)
+
+
+if __name__ == "__main__":
+    main()
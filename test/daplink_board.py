@@ -29,8 +29,10 @@ import mbed_lstools
 import info
 import test_daplink
 from test_info import TestInfoStub
+from timing import (Timeline, TimingStats, PHASE_UNMOUNT_WAIT,
+                    PHASE_MOUNT_WAIT, PHASE_TEST_FS, PHASE_TEST_FS_CONTENTS)
 from intelhex import IntelHex
-from pyOCD.board import MbedBoard
+from session_pool import SessionPool
 
 FILE_IGNORE_PATTERN_LIST = [
     re.compile("\\._\\.Trashes")
@@ -216,6 +218,11 @@ class DaplinkBoard(object):
         self._assert = None
         self._check_fs_on_remount = False
         self._manage_assert = False
+        # Phase timing of every mass storage load on this board
+        self.load_timing = TimingStats()
+        self.serial_reset_timing = TimingStats()
+        # pyOCD session shared by everything that debugs the target
+        self.session_pool = SessionPool(unique_id)
         self._update_board_info()
 
     def __str__(self):
@@ -242,9 +249,32 @@ class DaplinkBoard(object):
     def get_serial_port(self):
         return self.serial_port
 
+    def send_serial_break(self, sp):
+        """Reset the target by sending a break on the open serial port sp"""
+        sp.sendBreak()
+
     def get_mount_point(self):
         return self.mount_point
 
+    def get_block_device(self):
+        """Return the block device the drive is mounted from or None
+
+        Currently only supported on Linux.
+        """
+        if not sys.platform.startswith("linux"):
+            return None
+        mount_point = os.path.realpath(self.mount_point)
+        with open('/proc/mounts', 'r') as file_handle:
+            for line in file_handle:
+                fields = line.split()
+                if len(fields) < 2:
+                    continue
+                # Spaces in the path are escaped as \040
+                path = fields[1].replace('\\040', ' ')
+                if os.path.realpath(path) == mount_point:
+                    return fields[0]
+        return None
+
     def get_connected(self):
         """Check if the board is connected"""
         return os.path.isdir(self.mount_point)
@@ -289,6 +319,7 @@ class DaplinkBoard(object):
             # No mode change needed
             return
 
+        self.session_pool.release()
         if mode is self.MODE_BL:
             test_info.info("changing mode IF -> BL")
             # Create file to enter BL mode
@@ -323,6 +354,9 @@ class DaplinkBoard(object):
         self._check_fs_on_remount = enabled
         self.set_assert_auto_manage(enabled)
 
+    def get_assert_auto_manage(self):
+        return self._manage_assert
+
     def set_assert_auto_manage(self, enabled):
         assert isinstance(enabled, bool)
         self.clear_assert()
@@ -331,6 +365,7 @@ class DaplinkBoard(object):
     def clear_assert(self):
         assert_path = self.get_file_path("ASSERT.TXT")
         if os.path.isfile(assert_path):
+            self.session_pool.release()
             os.remove(assert_path)
             self.wait_for_remount(TestInfoStub())
 
@@ -339,9 +374,10 @@ class DaplinkBoard(object):
 
     def read_target_memory(self, addr, size, resume=True):
         assert self.get_mode() == self.MODE_IF
-        with MbedBoard.chooseBoard(board_id=self.get_unique_id()) as board:
+        with self.session_pool.session() as board:
             data = board.target.readBlockMemoryUnaligned8(addr, size)
-            board.uninit(resume)
+            if resume:
+                board.target.resume()
         return bytearray(data)
 
     def test_fs(self, parent_test):
@@ -422,6 +458,7 @@ class DaplinkBoard(object):
         with open(filepath, 'rb') as firmware_file:
             data = firmware_file.read()
         out_file = self.get_file_path(filename)
+        self.session_pool.release()
         start = time.time()
         with open(out_file, 'wb') as firmware_file:
             firmware_file.write(data)
@@ -454,6 +491,7 @@ class DaplinkBoard(object):
         with open(filepath, 'rb') as firmware_file:
             data = firmware_file.read()
         out_file = self.get_file_path(filename)
+        self.session_pool.release()
         start = time.time()
         with open(out_file, 'wb') as firmware_file:
             firmware_file.write(data)
@@ -471,7 +509,16 @@ class DaplinkBoard(object):
         if data_crc != details_crc:
             test_info.failure("Bootloader CRC is wrong")
 
-    def wait_for_remount(self, parent_test, wait_time=120):
+    def wait_for_remount(self, parent_test, wait_time=120, timeline=None):
+        """Wait for the drive to unmount and mount again
+
+        If a Timeline is given the unmount and mount wait times and any
+        filesystem checks are recorded to it.
+        """
+        if timeline is None:
+            timeline = Timeline()
+        # Any open session is lost when the board re-enumerates
+        self.session_pool.release()
         test_info = parent_test.create_subtest('wait_for_remount')
         elapsed = 0
         start = time.time()
@@ -481,6 +528,7 @@ class DaplinkBoard(object):
             time.sleep(0.1)
             elapsed += 0.1
         stop = time.time()
+        timeline.add(PHASE_UNMOUNT_WAIT, stop - start)
         test_info.info("unmount took %s s" % (stop - start))
         start = time.time()
         while True:
@@ -492,12 +540,15 @@ class DaplinkBoard(object):
             time.sleep(0.1)
             elapsed += 0.1
         stop = time.time()
+        timeline.add(PHASE_MOUNT_WAIT, stop - start)
         test_info.info("mount took %s s" % (stop - start))
 
         # If enabled check the filesystem
         if self._check_fs_on_remount:
-            self.test_fs(parent_test)
-            self.test_fs_contents(parent_test)
+            with timeline.phase(PHASE_TEST_FS):
+                self.test_fs(parent_test)
+            with timeline.phase(PHASE_TEST_FS_CONTENTS):
+                self.test_fs_contents(parent_test)
             self.test_details_txt(parent_test)
             if self._manage_assert:
                 if self._assert is not None:
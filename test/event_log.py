@@ -0,0 +1,275 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Streaming log of TestInfo events and conversion to JUnit XML
+
+A JsonLinesSink set on a TestInfo with set_event_sink writes one JSON
+object per line, flushed as it happens, for the start and end of every
+subtest and for every info, warning and failure.  A run that dies part
+way still leaves a readable log.  Every event has the host time, the
+event type and the id of its test:
+
+    {"time": 1478000000.5, "event": "start", "id": 2, "parent": 1,
+     "name": "HID test"}
+    {"time": 1478000001.2, "event": "failure", "id": 2, "msg": "..."}
+    {"time": 1478000003.0, "event": "end", "id": 2, "result": "Failure",
+     "failures": 1, "warnings": 0}
+
+Tests have no explicit end, so a test ends when an entry is next added
+to one of its parents or to another tree, or when the sink is closed.
+Subtrees added with TestInfo.add_subtest, such as those from other
+processes, are replayed when added and their events marked "replayed".
+
+Run this file to convert a log to JUnit XML.  Each test added to a root
+TestInfo becomes a test case holding the messages of all its subtests.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import json
+import time
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from test_info import TestInfo
+
+EVENT_START = "start"
+EVENT_END = "end"
+EVENT_INFO = "info"
+EVENT_WARNING = "warning"
+EVENT_FAILURE = "failure"
+
+_LEVEL_TO_EVENT = {
+    TestInfo.INFO: EVENT_INFO,
+    TestInfo.WARNING: EVENT_WARNING,
+    TestInfo.FAILURE: EVENT_FAILURE,
+}
+
+
+def _get_result(test_info):
+    if test_info.get_failed():
+        return 'Failure'
+    if test_info.get_warning():
+        return 'Warning'
+    return 'Pass'
+
+
+class JsonLinesSink(object):
+    """Write TestInfo events to a file as JSON Lines
+
+    Positional arguments:
+        path - file to write, overwritten if it exists
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "w")
+        self._lock = threading.Lock()
+        self._test_to_id = {}
+        self._open_list = []    # Tests started and not ended, outermost first
+        self._replaying = False
+
+    def start_test(self, test_info):
+        """Add the start of a test and replay entries it already has"""
+        with self._lock:
+            self._start(test_info)
+
+    def add_entry(self, test_info, entry_type, msg):
+        """Add an entry added to test_info"""
+        with self._lock:
+            self._end_unrelated(test_info)
+            if entry_type == TestInfo.SUBTEST:
+                self._start(msg)
+            else:
+                self._write(_LEVEL_TO_EVENT[entry_type], test_info,
+                            msg=msg)
+
+    def close(self):
+        """End all open tests and close the file"""
+        with self._lock:
+            while self._open_list:
+                self._end(self._open_list.pop())
+            self._file.close()
+
+    def _start(self, test_info):
+        self._end_unrelated(test_info._parent)
+        self._test_to_id[test_info] = len(self._test_to_id) + 1
+        parent = self._test_to_id.get(test_info._parent)
+        self._write(EVENT_START, test_info, parent=parent,
+                    name=test_info.name)
+        self._open_list.append(test_info)
+        replaying = self._replaying
+        self._replaying = True
+        for entry_type, msg in test_info.get_entries():
+            if entry_type == TestInfo.SUBTEST:
+                self._start(msg)
+            else:
+                self._end_unrelated(test_info)
+                self._write(_LEVEL_TO_EVENT[entry_type], test_info, msg=msg)
+        self._replaying = replaying
+
+    def _end_unrelated(self, test_info):
+        """End open tests that test_info is not part of"""
+        ancestor_set = set()
+        while test_info is not None:
+            ancestor_set.add(test_info)
+            test_info = test_info._parent
+        while self._open_list and self._open_list[-1] not in ancestor_set:
+            self._end(self._open_list.pop())
+
+    def _end(self, test_info):
+        failures, warnings, _ = test_info.get_counts()
+        self._write(EVENT_END, test_info, result=_get_result(test_info),
+                    failures=failures, warnings=warnings)
+
+    def _write(self, event, test_info, **fields):
+        fields["time"] = time.time()
+        fields["event"] = event
+        fields["id"] = self._test_to_id[test_info]
+        if self._replaying:
+            fields["replayed"] = True
+        self._file.write(json.dumps(fields, sort_keys=True) + "\n")
+        self._file.flush()
+
+
+def read_events(path):
+    """Return the list of events in a JSON Lines log
+
+    A line cut short by the run stopping is ignored.
+    """
+    event_list = []
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                event_list.append(json.loads(line))
+            except ValueError:
+                continue
+    return event_list
+
+
+class _LogTest(object):
+    """Test rebuilt from the events of a log"""
+
+    def __init__(self, event):
+        self.name = event["name"]
+        self.parent = event.get("parent")
+        self.start = event["time"]
+        self.end = None
+        self.child_list = []
+        self.msg_list = []      # (event, msg) in order
+
+    def get_messages(self, prefix=""):
+        """Return (event, text) for this test and its subtests in order"""
+        msg_list = []
+        for event, item in self.msg_list:
+            if event == EVENT_START:
+                msg_list.extend(item.get_messages(prefix + item.name + ": "))
+            else:
+                msg_list.append((event, prefix + item))
+        return msg_list
+
+
+def write_junit(event_list, path):
+    """Write the tests in event_list to path as JUnit XML
+
+    Each root test becomes a test suite and each of its subtests a test
+    case.  Warnings and infos go to the system-out of the test case.  A
+    test case with no end event, from a run that stopped, is an error.
+    """
+    id_to_test = {}
+    root_list = []
+    for event in event_list:
+        if event["event"] == EVENT_START:
+            test = _LogTest(event)
+            id_to_test[event["id"]] = test
+            parent = id_to_test.get(test.parent)
+            if parent is None:
+                root_list.append(test)
+            else:
+                parent.child_list.append(test)
+                parent.msg_list.append((EVENT_START, test))
+        elif event["id"] in id_to_test:
+            test = id_to_test[event["id"]]
+            if event["event"] == EVENT_END:
+                test.end = event["time"]
+            else:
+                test.msg_list.append((event["event"], event["msg"]))
+    last_time = event_list[-1]["time"] if event_list else 0.0
+
+    suites = ET.Element("testsuites")
+    for root in root_list:
+        suite = ET.SubElement(suites, "testsuite", name=root.name)
+        case_list = []
+        root_out = []
+        for event, item in root.msg_list:
+            if event == EVENT_START:
+                case_list.append(item)
+            else:
+                root_out.append((event, item))
+        if any(event == EVENT_FAILURE for event, _ in root_out):
+            # Failures outside of any subtest get a case of their own
+            top = _LogTest({"name": root.name, "time": root.start})
+            top.end = root.end
+            top.msg_list = root_out
+            case_list.insert(0, top)
+        failures = errors = 0
+        for test in case_list:
+            case = ET.SubElement(suite, "testcase", classname=root.name,
+                                 name=test.name)
+            end = test.end if test.end is not None else last_time
+            case.set("time", "%.3f" % max(end - test.start, 0.0))
+            msg_list = test.get_messages()
+            failure_list = [text for event, text in msg_list
+                            if event == EVENT_FAILURE]
+            if failure_list:
+                failures += 1
+                failure = ET.SubElement(case, "failure",
+                                        message=failure_list[0])
+                failure.text = "\n".join(failure_list)
+            if test.end is None:
+                errors += 1
+                ET.SubElement(case, "error", message="Test did not end")
+            out = ET.SubElement(case, "system-out")
+            out.text = "\n".join("%s: %s" % (event.capitalize(), text)
+                                 for event, text in msg_list)
+        suite.set("tests", str(len(case_list)))
+        suite.set("failures", str(failures))
+        suite.set("errors", str(errors))
+        end = root.end if root.end is not None else last_time
+        suite.set("time", "%.3f" % max(end - root.start, 0.0))
+        out = ET.SubElement(suite, "system-out")
+        out.text = "\n".join("%s: %s" % (event.capitalize(), text)
+                             for event, text in root_out)
+    ET.ElementTree(suites).write(path, encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a JSON Lines '
+                                     'test event log to JUnit XML')
+    parser.add_argument('log', help='JSON Lines event log')
+    parser.add_argument('junit', help='JUnit XML file to write')
+    args = parser.parse_args()
+    event_list = read_events(args.log)
+    write_junit(event_list, args.junit)
+    print("Wrote %i events to %s" % (len(event_list), args.junit))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Fast intel hex encoding of binary data
+
+Output is identical to intelhex.IntelHex.tofile for a single contiguous
+region, but records are built directly from a memoryview of the data
+rather than through a per-byte address dictionary.
+"""
+
+from __future__ import absolute_import
+import binascii
+import hashlib
+from collections import OrderedDict
+
+# Number of data bytes in each record
+HEX_RECORD_SIZE = 16
+
+HEX_EOF_RECORD = b':00000001FF\n'
+
+_TYPE_DATA = 0x00
+_TYPE_EXT_LINEAR_ADDR = 0x04
+
+
+def _iter_spans(addr, size, record_size, upper_addr):
+    """Yield (record type, address, data offset, length) for each record"""
+    offset = 0
+    while offset < size:
+        cur_addr = addr + offset
+        if cur_addr >> 16 != upper_addr:
+            upper_addr = cur_addr >> 16
+            yield _TYPE_EXT_LINEAR_ADDR, upper_addr, None, 2
+        # Records must not cross a 64KB boundary
+        length = min(record_size, size - offset,
+                     0x10000 - (cur_addr & 0xFFFF))
+        yield _TYPE_DATA, cur_addr & 0xFFFF, offset, length
+        offset += length
+
+
+def encoded_size(addr, size, record_size=HEX_RECORD_SIZE, upper_addr=None):
+    """Return the length of encode_records for data of the given size"""
+    total = 0
+    for _, _, _, length in _iter_spans(addr, size, record_size, upper_addr):
+        # ':' + 2 * (5 + data bytes) + '\n'
+        total += 12 + 2 * length
+    return total
+
+
+def encode_records(addr, data, record_size=HEX_RECORD_SIZE, upper_addr=None):
+    """Return the hex records for data located at addr as bytes
+
+    An extended linear address record is emitted whenever the upper 16
+    bits of the address differ from upper_addr, so passing the upper
+    address of the previous call allows data to be encoded in pieces.
+    No end of file record is added.
+    """
+    assert 0 < record_size <= 0xFF
+    view = memoryview(data)
+    hex_data = binascii.hexlify(view.tobytes()).upper()
+    lines = []
+    for record_type, record_addr, offset, length in \
+            _iter_spans(addr, len(view), record_size, upper_addr):
+        if record_type == _TYPE_DATA:
+            payload = bytearray(view[offset:offset + length].tobytes())
+            payload_hex = hex_data[offset * 2:(offset + length) * 2]
+            addr_field = record_addr
+        else:
+            payload = bytearray([(record_addr >> 8) & 0xFF,
+                                 record_addr & 0xFF])
+            payload_hex = binascii.hexlify(bytes(payload)).upper()
+            addr_field = 0
+        header = bytearray([length, (addr_field >> 8) & 0xFF,
+                            addr_field & 0xFF, record_type])
+        checksum = (-(sum(header) + sum(payload))) & 0xFF
+        lines.append(b':' + binascii.hexlify(bytes(header)).upper() +
+                     payload_hex + (b'%02X\n' % checksum))
+    return b''.join(lines)
+
+
+def bin_to_hex(addr, data, record_size=HEX_RECORD_SIZE):
+    """Return data located at addr as the contents of an intel hex file"""
+    # Like intelhex, only use extended address records when needed
+    upper_addr = 0 if addr + len(data) <= 0x10000 else None
+    hex_data = bytearray(encode_records(addr, data, record_size, upper_addr))
+    hex_data.extend(HEX_EOF_RECORD)
+    return hex_data
+
+
+class HexCache(object):
+    """Least recently used cache of encoded hex files
+
+    Entries are keyed by the content of the data, so equal images
+    built separately share an entry.
+    """
+
+    def __init__(self, max_entries=16):
+        assert max_entries > 0
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def bin_to_hex(self, addr, data, record_size=HEX_RECORD_SIZE):
+        """Cached version of bin_to_hex
+
+        A new bytearray is returned on every call so callers are free
+        to modify it.
+        """
+        digest = hashlib.sha1(memoryview(data).tobytes()).digest()
+        key = (addr, record_size, len(data), digest)
+        if key in self._entries:
+            self.hits += 1
+            hex_data = self._entries.pop(key)
+        else:
+            self.misses += 1
+            hex_data = bytes(bin_to_hex(addr, data, record_size))
+            if len(self._entries) >= self._max_entries:
+                self._entries.popitem(last=False)
+        self._entries[key] = hex_data
+        return bytearray(hex_data)
+
+    def clear(self):
+        self._entries.clear()
@@ -17,105 +17,112 @@
 #
  
 from __future__ import absolute_import
+from __future__ import division
 
+import time
 from time import sleep
-from random import randrange
+from random import randrange, Random
 import math
 
 from pyOCD.board import MbedBoard
+from pyOCD.pyDAPAccess import DAPAccess
 from pyOCD.utility.conversion import float32beToU32be
+import info
+from target_memory import get_target_memory
+from memory_pattern import (PATTERN_LIST, PATTERN_RANDOM, make_pattern,
+                            find_mismatch_ranges, report_mismatches)
+from msd_test import MassStorageTester
+from timing import (percentile, PHASE_HOST_WRITE, PHASE_UNMOUNT_WAIT,
+                    PHASE_MOUNT_WAIT)
 
 # TODO - make a dedicated test
 # TODO - test all DapLink commands
-# TODO - test various clock speeds
-# TODO - test turnaround settings
-# TODO - test HID speed
-# TODO - test ram/rom transfer speeds
+
+# Shortest time spent timing each transfer size
+_MIN_BENCH_TIME = 0.2
+
+# Most flash read by the throughput benchmark
+_MAX_FLASH_READ_SIZE = 0x40000
+
+# SWD clock frequencies stepped through by the clock sweep
+SWD_CLOCK_LIST = [100000, 500000, 1000000, 2000000, 4000000, 8000000,
+                  12000000, 16000000, 24000000]
+
+# SWD turnaround periods, in clock cycles, tried at each clock
+SWD_TURNAROUND_LIST = [1, 2, 3, 4]
+
+# Workload run at each step of the sweep
+_SWEEP_BLOCK_SIZE = 0x1000
+_SWEEP_REPEAT = 4
+
+# Selecting bank 1 of DP register 0x4 gives DLCR, where bits 9:8 hold
+# the turnaround period minus 1 and bit 6 must be written as 1
+_DP_SELECT_DLCR = 0x1
+_DLCR_RES1 = 0x40
+_DLCR_TURNAROUND_SHIFT = 8
+
+# Pages erased and programmed by the flash benchmark
+_FLASH_BENCH_PAGES = 16
+
+# Fractions of a page programmed by the flash benchmark
+_FLASH_BENCH_DIVISORS = (1, 2, 4, 8)
+
+# Percentiles reported for latency measurements
+_LATENCY_PERCENTILES = (50, 90, 99)
+
+# Name used when attaching debug latency statistics to a TestInfo
+DEBUG_LATENCY_ATTACHMENT = "debug latency"
+
+# Phases of a mass storage load that include programming the target
+_MSD_PROGRAM_PHASES = (PHASE_HOST_WRITE, PHASE_UNMOUNT_WAIT,
+                       PHASE_MOUNT_WAIT)
+
+
+def _get_bench_sizes(max_size):
+    """Return sizes from 4 bytes growing by 4x and ending at max_size"""
+    size_list = []
+    size = 4
+    while size < max_size:
+        size_list.append(size)
+        size *= 4
+    size_list.append(max_size)
+    return size_list
+
+
+def _time_repeated(function, min_time=_MIN_BENCH_TIME):
+    """Call function until min_time has passed and return the average time
+
+    function is always called at least once.
+    """
+    count = 0
+    start = time.time()
+    while True:
+        function()
+        count += 1
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            return elapsed / count
+
+
+def _kb_per_s(size, seconds):
+    return size / 1024 / max(seconds, 1e-9)
 
 
 def test_hid(workspace, parent_test):
     test_info = parent_test.create_subtest("HID test")
     board = workspace.board
-    with MbedBoard.chooseBoard(board_id=board.get_unique_id()) as mbed_board:
-        addr = 0
-        size = 0
-
+    with board.session_pool.session() as mbed_board:
         target_type = mbed_board.getTargetType()
         binary_file = workspace.target.bin_path
 
-        addr_bin = 0x00000000
-
-        if target_type == "lpc1768":
-            addr = 0x10000001
-            size = 0x1102
-            addr_flash = 0x10000
-        elif target_type == "lpc11u24":
-            addr = 0x10000001
-            size = 0x502
-            addr_flash = 0x4000
-        elif target_type == "kl25z":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "kl28z":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "k64f":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "k22f":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "k20d50m":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "kl46z":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "kl05z":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x6000
-        elif target_type == "lpc800":
-            addr = 0x10000001
-            size = 0x502
-            addr_flash = 0x2000
-        elif target_type == "lpc11xx_32":
-            addr = 0x10000001
-            size = 0x502
-            addr_flash = 0x4000
-        elif target_type == "nrf51":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x20000
-        elif target_type == "lpc4330":
-            addr = 0x10000001
-            size = 0x1102
-            addr_flash = 0x14010000
-            addr_bin = 0x14000000
-        elif target_type == "maxwsnenv":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "max32600mbed":
-            addr = 0x20000001
-            size = 0x502
-            addr_flash = 0x10000
-        elif target_type == "w7500":
-            addr = 0x20000001
-            size = 0x1102
-            addr_flash = 0x00000000
-        elif target_type == "lpc824":
-            addr = 0x10000001
-            size = 0x502
-            addr_flash = 0x4000
-        else:
+        memory = get_target_memory(target_type)
+        if memory is None:
             raise Exception("A board is not supported by this test script.")
+        addr = memory.test_addr
+        size = memory.block_size
+        addr_flash = memory.flash_test_addr
+        addr_bin = memory.bin_addr
+        test_info.info("Memory map %s" % memory)
 
         target = mbed_board.target
         flash = mbed_board.flash
@@ -226,14 +233,12 @@ def test_hid(workspace, parent_test):
         data = [randrange(1, 50) for _ in range(size)]
         target.writeBlockMemoryUnaligned8(addr, data)
         block = target.readBlockMemoryUnaligned8(addr, size)
-        error = False
-        for i in range(len(block)):
-            if (block[i] != data[i]):
-                error = True
-                test_info.info("ERROR: 0x%X, 0x%X, 0x%X!!!" %
-                               ((addr + i), block[i], data[i]))
-        if error:
-            test_info.failure("TEST FAILED")
+        range_list = find_mismatch_ranges(bytearray(data), bytearray(block),
+                                          addr)
+        if range_list:
+            report_mismatches(test_info, range_list, "Block read back")
+            # report_mismatches has already added the failure
+            test_info.info("TEST FAILED")
         else:
             test_info.info("TEST PASSED")
 
@@ -276,3 +281,465 @@ def test_hid(workspace, parent_test):
 
         target.reset()
         test_info.info("HID test complete")
+
+
+def test_hid_throughput(workspace, parent_test):
+    """Measure CMSIS-DAP memory transfer speed over HID
+
+    Blocks from 4 bytes up to the whole RAM test region are written and
+    read back with the target halted, both word aligned and one byte
+    past word alignment.  Flash is read the same way.
+    """
+    test_info = parent_test.create_subtest("HID throughput")
+    board = workspace.board
+    with board.session_pool.session() as mbed_board:
+        target_type = mbed_board.getTargetType()
+        memory = get_target_memory(target_type)
+        if memory is None:
+            test_info.warning("No memory map for target %s" % target_type)
+            return
+        target = mbed_board.target
+        target.halt()
+        rand = Random(0)
+
+        test_info.info("RAM transfers at 0x%x in KB/s, +1 is unaligned" %
+                       memory.test_ram_start)
+        test_info.info("%10s %10s %10s %10s %10s" %
+                       ("Size", "Write", "Write +1", "Read", "Read +1"))
+        peak_write = 0
+        peak_read = 0
+        for size in _get_bench_sizes(memory.test_ram_size - 1):
+            write_list = []
+            read_list = []
+            for offset in (0, 1):
+                addr = memory.test_ram_start + offset
+                data = [rand.randrange(0, 0x100) for _ in range(size)]
+                result = [None]
+
+                def write():
+                    target.writeBlockMemoryUnaligned8(addr, data)
+
+                def read():
+                    result[0] = target.readBlockMemoryUnaligned8(addr, size)
+
+                write_list.append(_kb_per_s(size, _time_repeated(write)))
+                read_list.append(_kb_per_s(size, _time_repeated(read)))
+                if list(result[0]) != data:
+                    test_info.failure("Data read back from 0x%x differs "
+                                      "from the %i bytes written" %
+                                      (addr, size))
+            peak_write = max(peak_write, max(write_list))
+            peak_read = max(peak_read, max(read_list))
+            test_info.info("%10i %10.1f %10.1f %10.1f %10.1f" %
+                           ((size,) + tuple(write_list) + tuple(read_list)))
+
+        flash_size = min(memory.flash_end - memory.flash_start,
+                         _MAX_FLASH_READ_SIZE)
+        test_info.info("Flash reads at 0x%x in KB/s" % memory.flash_start)
+        peak_flash = 0
+        for size in _get_bench_sizes(flash_size):
+            def read_flash():
+                target.readBlockMemoryUnaligned8(memory.flash_start, size)
+
+            speed = _kb_per_s(size, _time_repeated(read_flash))
+            peak_flash = max(peak_flash, speed)
+            test_info.info("%10i %10.1f" % (size, speed))
+
+        target.reset()
+        test_info.info("Board %s target %s: RAM write %.1f KB/s, RAM read "
+                       "%.1f KB/s, flash read %.1f KB/s" %
+                       (board.name, target_type, peak_write, peak_read,
+                        peak_flash))
+
+
+def _set_turnaround(mbed_board, cycles):
+    """Set the SWD turnaround period of both the probe and the target
+
+    Return False if the target's debug port has no DLCR register, or
+    pyOCD gives no way to configure the probe, in which case only a
+    turnaround of 1 cycle is supported.  The target must be halted and
+    the last AP access must have been to bank 0 of AP 0, since the DP
+    select register is left at 0.
+    """
+    assert 1 <= cycles <= 4
+    link = mbed_board.link
+    swd_configure = _get_swd_configure(link)
+    if swd_configure is None:
+        return cycles == 1
+    idcode = link.read_reg(DAPAccess.REG.DP_0x0)
+    if (idcode >> 12) & 0xF < 1:
+        return cycles == 1
+    # The target switches as soon as DLCR is written, then the probe
+    link.write_reg(DAPAccess.REG.DP_0x8, _DP_SELECT_DLCR)
+    link.write_reg(DAPAccess.REG.DP_0x4, _DLCR_RES1 |
+                   ((cycles - 1) << _DLCR_TURNAROUND_SHIFT))
+    # Transfers are deferred, so the DLCR write must be sent at the old
+    # turnaround before the probe is switched
+    link.flush()
+    swd_configure(cycles - 1)
+    link.write_reg(DAPAccess.REG.DP_0x8, 0)
+    return True
+
+
+def _get_swd_configure(link):
+    """Return pyOCD's DAP_SWD_Configure call, or None if it has none
+
+    pyOCD has no public call for it, so the private protocol object of
+    the link is used if present.
+    """
+    protocol = getattr(link, '_protocol', None)
+    return getattr(protocol, 'swdConfigure', None)
+
+
+def _run_sweep_workload(target, addr, data_list):
+    """Write, read back and verify each block in data_list
+
+    Return the bytes transferred, the time taken and the number of
+    blocks that failed with an error or did not match.
+    """
+    total = 0
+    elapsed = 0
+    errors = 0
+    for data in data_list:
+        start = time.time()
+        try:
+            target.writeBlockMemoryUnaligned8(addr, data)
+            result = target.readBlockMemoryUnaligned8(addr, len(data))
+        except Exception:
+            errors += 1
+            continue
+        finally:
+            elapsed += time.time() - start
+        total += 2 * len(data)
+        if list(result) != data:
+            errors += 1
+    return total, elapsed, errors
+
+
+def test_swd_sweep(workspace, parent_test, clock_list=SWD_CLOCK_LIST,
+                   turnaround_list=SWD_TURNAROUND_LIST):
+    """Run a fixed workload at each SWD clock and turnaround setting
+
+    A new session is opened for every step.  A clock is reliable if
+    the workload ran without errors at it and at every slower clock.
+    Turnaround is set back to 1 cycle at the slowest clock after each
+    step, so a target left with a longer turnaround by a failed step
+    needs to be power cycled.
+    """
+    test_info = parent_test.create_subtest("SWD clock sweep")
+    board = workspace.board
+    # Each step needs its own session at a different clock
+    board.session_pool.release()
+    clock_list = sorted(clock_list)
+    rand = Random(0)
+    results = {}        # (clock, turnaround) to (KB/s, errors)
+    target_type = None
+    configure_missing = False
+    for turnaround in turnaround_list:
+        supported = True
+        for clock in clock_list:
+            try:
+                with MbedBoard.chooseBoard(board_id=board.get_unique_id(),
+                                           frequency=clock) as mbed_board:
+                    target_type = mbed_board.getTargetType()
+                    memory = get_target_memory(target_type)
+                    if memory is None:
+                        test_info.warning("No memory map for target %s" %
+                                          target_type)
+                        return
+                    target = mbed_board.target
+                    addr = memory.test_ram_start
+                    size = min(_SWEEP_BLOCK_SIZE, memory.test_ram_size)
+                    data_list = [[rand.randrange(0, 0x100)
+                                  for _ in range(size)]
+                                 for _ in range(_SWEEP_REPEAT)]
+                    if turnaround != 1 and \
+                            _get_swd_configure(mbed_board.link) is None:
+                        configure_missing = True
+                        break
+                    target.halt()
+                    target.readMemory(addr)
+                    if not _set_turnaround(mbed_board, turnaround):
+                        supported = False
+                        break
+                    try:
+                        total, elapsed, errors = \
+                            _run_sweep_workload(target, addr, data_list)
+                    finally:
+                        mbed_board.link.set_clock(clock_list[0])
+                        _set_turnaround(mbed_board, 1)
+                    results[clock, turnaround] = (_kb_per_s(total, elapsed),
+                                                  errors)
+            except Exception as exception:
+                test_info.info("Clock %i Hz, turnaround %i: %s" %
+                               (clock, turnaround, exception))
+                results[clock, turnaround] = (0.0, _SWEEP_REPEAT)
+        if configure_missing:
+            break
+        if not supported:
+            test_info.info("Target %s does not support a turnaround of %i "
+                           "cycles" % (target_type, turnaround))
+    if configure_missing:
+        test_info.warning("This pyOCD version has no call to configure the "
+                          "probe's SWD turnaround, so turnarounds above 1 "
+                          "cycle were skipped")
+    turnaround_list = [turnaround for turnaround in turnaround_list
+                       if (clock_list[0], turnaround) in results]
+    if not turnaround_list:
+        test_info.failure("No SWD sweep steps completed")
+        return
+
+    test_info.info("KB/s (blocks with errors) for each turnaround period")
+    test_info.info("%10s" % "Clock" +
+                   "".join("%16s" % ("turnaround %i" % cycles)
+                           for cycles in turnaround_list))
+    for clock in clock_list:
+        line = "%10i" % clock
+        for turnaround in turnaround_list:
+            speed, errors = results[clock, turnaround]
+            line += "%16s" % ("%.1f (%i)" % (speed, errors))
+        test_info.info(line)
+
+    fastest = None
+    for turnaround in turnaround_list:
+        reliable = None
+        for clock in clock_list:
+            if results[clock, turnaround][1] != 0:
+                break
+            reliable = clock
+        if reliable is None:
+            test_info.info("No reliable clock with a turnaround of %i" %
+                           turnaround)
+            continue
+        test_info.info("Fastest reliable clock with a turnaround of %i: "
+                       "%i Hz at %.1f KB/s" %
+                       (turnaround, reliable,
+                        results[reliable, turnaround][0]))
+        if fastest is None or reliable > fastest[0]:
+            fastest = (reliable, turnaround)
+    if fastest is None:
+        test_info.failure("No reliable SWD clock for board %s target %s" %
+                          (board.name, target_type))
+    else:
+        test_info.info("Board %s target %s: fastest reliable SWD clock %i Hz "
+                       "with a turnaround of %i" %
+                       (board.name, target_type, fastest[0], fastest[1]))
+
+
+def _report_latency(test_info, name, duration_list, size=None):
+    """Add a line of latency statistics in ms, and speed if size is set
+
+    Return a dictionary of the statistics in seconds.
+    """
+    duration_list = sorted(duration_list)
+    stats = {
+        'count': len(duration_list),
+        'avg': sum(duration_list) / len(duration_list),
+        'min': duration_list[0],
+        'max': duration_list[-1],
+    }
+    for percent in _LATENCY_PERCENTILES:
+        stats['p%i' % percent] = percentile(duration_list, percent)
+    line = "%s: count %i, avg %.2fms, min %.2fms, " % \
+        (name, stats['count'], stats['avg'] * 1000, stats['min'] * 1000)
+    line += "".join("p%i %.2fms, " % (percent, stats['p%i' % percent] * 1000)
+                    for percent in _LATENCY_PERCENTILES)
+    line += "max %.2fms" % (stats['max'] * 1000)
+    if size is not None:
+        line += ", %.1f KB/s" % _kb_per_s(size * len(duration_list),
+                                          sum(duration_list))
+    test_info.info(line)
+    return stats
+
+
+def test_flash_benchmark(workspace, parent_test):
+    """Compare CMSIS-DAP and mass storage programming speed
+
+    erasePage and programPage are timed on up to _FLASH_BENCH_PAGES
+    pages from the flash test address, programming whole pages and
+    fractions of a page.  The target image is then loaded once with
+    flashBinary and once by copying it to the drive, and the times are
+    compared.  The image is left loaded.
+    """
+    test_info = parent_test.create_subtest("Flash benchmark")
+    board = workspace.board
+    target_image = workspace.target
+    bad_vector_table = target_image.name in \
+        info.TARGET_WITH_BAD_VECTOR_TABLE_LIST
+    rand = Random(0)
+    with board.session_pool.session() as mbed_board:
+        target_type = mbed_board.getTargetType()
+        memory = get_target_memory(target_type)
+        if memory is None:
+            test_info.warning("No memory map for target %s" % target_type)
+            return
+        target = mbed_board.target
+        flash = mbed_board.flash
+
+        target.halt()
+        flash.init()
+        page_list = []
+        addr = memory.flash_test_addr
+        while len(page_list) < _FLASH_BENCH_PAGES:
+            page_size = flash.getPageInfo(addr).size
+            if addr + page_size > memory.flash_end:
+                break
+            page_list.append((addr, page_size))
+            addr += page_size
+        test_info.info("Timing %i pages from 0x%x" %
+                       (len(page_list), memory.flash_test_addr))
+        erase_list = []
+        size_to_program_list = {}
+        for divisor in _FLASH_BENCH_DIVISORS:
+            for addr, page_size in page_list:
+                size = page_size // divisor
+                data = [rand.randrange(0, 0x100) for _ in range(size)]
+                start = time.time()
+                flash.erasePage(addr)
+                erase_list.append(time.time() - start)
+                start = time.time()
+                flash.programPage(addr, data)
+                elapsed = time.time() - start
+                size_to_program_list.setdefault(size, []).append(elapsed)
+                result = target.readBlockMemoryUnaligned8(addr, size)
+                if list(result) != data:
+                    test_info.failure("Page at 0x%x programmed incorrectly" %
+                                      addr)
+        if erase_list:
+            _report_latency(test_info, "erasePage", erase_list)
+        for size in sorted(size_to_program_list, reverse=True):
+            _report_latency(test_info, "programPage %i bytes" % size,
+                            size_to_program_list[size], size)
+
+        start = time.time()
+        flash.flashBinary(target_image.bin_path, memory.bin_addr)
+        dap_time = time.time() - start
+        target.reset()
+
+    if bad_vector_table:
+        image_path = target_image.hex_path
+    else:
+        image_path = target_image.bin_path
+    test = MassStorageTester(board, test_info, "Benchmark load")
+    test.set_shutils_copy(image_path)
+    with open(target_image.bin_path, 'rb') as bin_file:
+        bin_data = bytearray(bin_file.read())
+    test.set_expected_data(bin_data)
+    test.run()
+    msd_time = sum(duration for phase, duration in
+                   test.get_timeline().get_totals()
+                   if phase in _MSD_PROGRAM_PHASES)
+
+    test_info.info("Image of %i bytes: flashBinary %.2fs (%.1f KB/s), "
+                   "drag and drop %.2fs (%.1f KB/s)" %
+                   (len(bin_data), dap_time,
+                    _kb_per_s(len(bin_data), dap_time), msd_time,
+                    _kb_per_s(len(bin_data), msd_time)))
+    faster = "CMSIS-DAP" if dap_time < msd_time else "drag and drop"
+    test_info.info("Board %s target %s: %s programming is %.1fx faster" %
+                   (board.name, target_type, faster,
+                    max(dap_time, msd_time) / max(min(dap_time, msd_time),
+                                                  1e-6)))
+
+
+def test_hid_memory(workspace, parent_test, seed=0):
+    """Fill the whole RAM test region with each pattern and read it back
+
+    The word patterns are written word aligned.  The random pattern is
+    also written one byte past alignment.
+    """
+    test_info = parent_test.create_subtest("HID memory patterns")
+    board = workspace.board
+    with board.session_pool.session() as mbed_board:
+        target_type = mbed_board.getTargetType()
+        memory = get_target_memory(target_type)
+        if memory is None:
+            test_info.warning("No memory map for target %s" % target_type)
+            return
+        target = mbed_board.target
+        target.halt()
+        test_list = [(pattern, memory.test_ram_start) for pattern
+                     in PATTERN_LIST]
+        test_list.append((PATTERN_RANDOM, memory.test_addr))
+        for pattern, addr in test_list:
+            size = memory.ram_end - addr
+            data = make_pattern(pattern, addr, size, seed)
+            start = time.time()
+            target.writeBlockMemoryUnaligned8(addr, list(data))
+            block = bytearray(target.readBlockMemoryUnaligned8(addr, size))
+            elapsed = time.time() - start
+            name = "%s at 0x%x" % (pattern, addr)
+            range_list = find_mismatch_ranges(data, block, addr)
+            if range_list:
+                report_mismatches(test_info, range_list, name)
+            else:
+                test_info.info("%s: %i bytes passed in %.2fs" %
+                               (name, size, elapsed))
+        target.reset()
+
+
+def _time_call(duration_list, function, *args):
+    """Call function, adding the time it took to duration_list"""
+    start = time.time()
+    result = function(*args)
+    duration_list.append(time.time() - start)
+    return result
+
+
+def test_debug_latency(workspace, parent_test, count=1000):
+    """Time core debug operations count times each
+
+    Halt, resume, single step and core register read and write
+    latencies are reported as percentiles, and attached to the test
+    keyed by operation so they can be compared between interface chips.
+    """
+    test_info = parent_test.create_subtest("Debug latency")
+    board = workspace.board
+    hic_name = info.get_hic_name(board.hic_id)
+    with board.session_pool.session() as mbed_board:
+        target = mbed_board.target
+        target_type = mbed_board.getTargetType()
+        op_to_durations = {}
+        op_list = ["halt", "resume", "step", "read register",
+                   "write register"]
+        for op in op_list:
+            op_to_durations[op] = []
+
+        # Resume is only timed from the halted state
+        target.halt()
+        for _ in range(count):
+            _time_call(op_to_durations["resume"], target.resume)
+            _time_call(op_to_durations["halt"], target.halt)
+
+        target.resetStopOnReset()
+        for _ in range(count):
+            _time_call(op_to_durations["step"], target.step)
+
+        errors = 0
+        original = target.readCoreRegister('r0')
+        for index in range(count):
+            value = (index * 0x01010101) & 0xFFFFFFFF
+            _time_call(op_to_durations["write register"],
+                       target.writeCoreRegister, 'r0', value)
+            result = _time_call(op_to_durations["read register"],
+                                target.readCoreRegister, 'r0')
+            if result != value:
+                errors += 1
+        target.writeCoreRegister('r0', original)
+        if errors:
+            test_info.failure("%i of %i register writes did not read back" %
+                              (errors, count))
+        target.reset()
+
+    op_to_stats = {}
+    for op in op_list:
+        op_to_stats[op] = _report_latency(test_info, op, op_to_durations[op])
+    test_info.attach(DEBUG_LATENCY_ATTACHMENT,
+                     {'hic': hic_name, 'target': target_type,
+                      'stats': op_to_stats})
+    test_info.info("HIC %s target %s: halt p90 %.2fms, step p90 %.2fms, "
+                   "register read p90 %.2fms" %
+                   (hic_name, target_type,
+                    op_to_stats["halt"]["p90"] * 1000,
+                    op_to_stats["step"]["p90"] * 1000,
+                    op_to_stats["read register"]["p90"] * 1000))
@@ -0,0 +1,329 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Corrupt and edge case variants of a good image
+
+ImageMutator takes a known good image and produces a family of
+variants, each declaring the contents of FAIL.TXT it should cause.
+Variants are generated one at a time and duplicates are dropped by
+content hash, so large matrices can be run without keeping every
+image in memory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import hashlib
+from hex_encoder import bin_to_hex, encode_records, HEX_EOF_RECORD
+
+# Messages written to FAIL.TXT - see source/daplink/error.c
+MSG_HEX_CKSUM = ("The hex file cannot be decoded. Checksum calculation "
+                 "failure occurred.\r\n")
+MSG_INTERNAL = "An internal error has occurred\r\n"
+MSG_SECURITY_BITS = ("The interface firmware ABORTED programming. Image is "
+                     "trying to set security bits\r\n")
+MSG_IAP_INCOMPLETE = ("In application programming failed because the "
+                      "update sent was incomplete.\r\n")
+MSG_TRANSFER_TIMEOUT = "The transfer timed out.\r\n"
+
+# Kinetis flash configuration field security byte and the end of the
+# word holding it
+FSEC_ADDR = 0x40C
+FSEC_WORD_END = 0x410
+
+# FSEC values and whether DAPLink refuses to program them
+FSEC_PATTERN_LIST = [
+    ("unsecured", 0xFE, False),
+    ("secured", 0xFC, True),
+    ("erased secure", 0xFF, True),
+    ("mass erase disabled", 0xEE, True),
+    ("all zero", 0x00, True),
+]
+
+# Size of a sector on the virtual drive
+SECTOR_SIZE = 0x200
+
+_HEX_TYPE_DATA = 0x00
+
+
+class ImageVariant(object):
+    """A mutated image and the outcome it is expected to produce"""
+
+    def __init__(self, name, file_type, data, expected_failure_msg,
+                 expected_data, causes_assert=False):
+        assert file_type in ('bin', 'hex')
+        assert type(data) is bytearray
+        assert expected_failure_msg is None or type(expected_failure_msg) is str
+        self.name = name
+        self.file_type = file_type
+        self.data = data
+        self.expected_failure_msg = expected_failure_msg
+        self.expected_data = expected_data
+        self.causes_assert = causes_assert
+        self._digest = None
+
+    @property
+    def file_name(self):
+        return 'image.' + self.file_type
+
+    @property
+    def digest(self):
+        """SHA1 hex digest of the image contents"""
+        if self._digest is None:
+            self._digest = hashlib.sha1(bytes(self.data)).hexdigest()
+        return self._digest
+
+    def __str__(self):
+        return "%s (%s)" % (self.name, self.file_type)
+
+
+class ImageMutator(object):
+    """Generate corrupt and edge case variants of a good image
+
+    Positional arguments:
+        bin_data - bytearray of the good image
+        start_addr - address the image is located at
+
+    Keyword arguments:
+        incomplete_msg - message for an image that ends early, or None
+            if the data sent so far is programmed without error
+        security_bits_checked - True if DAPLink checks the Kinetis
+            flash configuration field of this target
+    """
+
+    def __init__(self, bin_data, start_addr=0, incomplete_msg=None,
+                 security_bits_checked=False):
+        assert type(bin_data) is bytearray
+        self._bin_data = bin_data
+        self._start_addr = start_addr
+        self._incomplete_msg = incomplete_msg
+        self._security_bits_checked = security_bits_checked
+        self._hex_lines = None
+
+    def iter_variants(self, file_type, max_truncations=4,
+                      max_bad_checksums=4,
+                      padding_sizes=(SECTOR_SIZE, 0x1000)):
+        """Yield each unique variant for the given file type
+
+        Set max_truncations or max_bad_checksums to None to produce a
+        variant for every record boundary or record.
+        """
+        assert file_type in ('bin', 'hex')
+        generator_list = [
+            self.iter_truncated(file_type, max_truncations),
+            self.iter_padded(file_type, padding_sizes),
+        ]
+        if self._security_bits_checked:
+            generator_list.append(self.iter_security_bits(file_type))
+        if file_type == 'hex':
+            generator_list.extend([
+                self.iter_missing_eof(),
+                self.iter_bad_checksums(max_bad_checksums),
+                self.iter_out_of_order(),
+                self.iter_extended_address(),
+            ])
+        seen = set()
+        for generator in generator_list:
+            for variant in generator:
+                if variant.digest in seen:
+                    continue
+                seen.add(variant.digest)
+                yield variant
+
+    def iter_truncated(self, file_type, max_count=None):
+        """Images cut off at record boundaries, or sectors for binaries
+
+        A truncated hex file is the start of the image encoded with its
+        own EOF record.  When the security bits are checked, images cut
+        off before the end of the FSEC word are left out, since the
+        erased FSEC byte left behind would lock the part.
+        """
+        if file_type == 'bin':
+            size_list = list(range(SECTOR_SIZE, len(self._bin_data),
+                                   SECTOR_SIZE))
+        else:
+            size_list = []
+            record_end = 0
+            for _, data_size in self._get_hex_lines():
+                record_end += data_size
+                if data_size and record_end < len(self._bin_data):
+                    size_list.append(record_end)
+        if self._security_bits_checked:
+            min_size = FSEC_WORD_END - self._start_addr
+            size_list = [end for end in size_list if end >= min_size]
+        for size in _select(size_list, max_count):
+            bin_data = self._bin_data[0:size]
+            if file_type == 'bin':
+                data = bin_data
+            else:
+                data = bin_to_hex(self._start_addr, bin_data)
+            if self._incomplete_msg is None:
+                expected_data = bin_data
+            else:
+                expected_data = None
+            yield ImageVariant('Truncated to 0x%x bytes' % size,
+                               file_type, data, self._incomplete_msg,
+                               expected_data)
+
+    def iter_missing_eof(self):
+        """Hex image without its EOF record
+
+        DAPLink never sees the end of the stream, so the transfer times
+        out.
+        """
+        data = bytearray().join(line for line, _ in
+                                self._get_hex_lines()[:-1])
+        yield ImageVariant('Missing EOF record', 'hex', data,
+                           MSG_TRANSFER_TIMEOUT, None)
+
+    def iter_padded(self, file_type, padding_sizes):
+        """Images followed by 0xFF padding"""
+        for size in padding_sizes:
+            data = self._get_file_data(file_type)
+            data.extend(bytearray([0xFF]) * size)
+            yield ImageVariant('Padded by 0x%x bytes' % size, file_type,
+                               data, None, self._bin_data)
+
+    def iter_security_bits(self, file_type):
+        """Images with each FSEC pattern in the flash configuration field"""
+        offset = FSEC_ADDR - self._start_addr
+        if offset < 0 or offset >= len(self._bin_data):
+            return
+        for name, fsec, rejected in FSEC_PATTERN_LIST:
+            bin_data = bytearray(self._bin_data)
+            bin_data[offset] = fsec
+            if file_type == 'bin':
+                data = bin_data
+            else:
+                data = bin_to_hex(self._start_addr, bin_data)
+            if rejected:
+                yield ImageVariant('Security bits %s (0x%02x)' % (name, fsec),
+                                   file_type, data, MSG_SECURITY_BITS, None)
+            else:
+                yield ImageVariant('Security bits %s (0x%02x)' % (name, fsec),
+                                   file_type, data, None, bin_data)
+
+    def iter_bad_checksums(self, max_count=None):
+        """Hex images with one record's checksum corrupted"""
+        lines = self._get_hex_lines()
+        for index in _select(range(len(lines)), max_count):
+            line = bytearray(lines[index][0])
+            # The checksum is the last two characters before the newline
+            line[-3:-1] = b'%02X' % ((int(bytes(line[-3:-1]), 16) + 1) & 0xFF)
+            data = bytearray().join(other for other, _ in lines[0:index])
+            data.extend(line)
+            data.extend(bytearray().join(other for other, _ in
+                                         lines[index + 1:]))
+            yield ImageVariant('Bad checksum on record %i' % index, 'hex',
+                               data, MSG_HEX_CKSUM, None)
+
+    def iter_out_of_order(self):
+        """Hex image with two data records in the middle swapped
+
+        Flash programming only supports increasing addresses, so
+        this trips an assert in the interface firmware.
+        """
+        lines = [line for line, _ in self._get_hex_lines()]
+        data_index_list = [index for index, (_, size) in
+                           enumerate(self._get_hex_lines()) if size]
+        if len(data_index_list) < 2:
+            return
+        pos = len(data_index_list) // 2
+        first, second = data_index_list[pos - 1], data_index_list[pos]
+        if second != first + 1:
+            # An address record sits between them
+            return
+        lines[first], lines[second] = lines[second], lines[first]
+        yield ImageVariant('Records out of order', 'hex',
+                           bytearray().join(lines), MSG_INTERNAL, None,
+                           causes_assert=True)
+
+    def iter_extended_address(self):
+        """Valid hex images using extra extended linear address records"""
+        # An address record before every 64KB segment, even the first
+        data = bytearray(encode_records(self._start_addr, self._bin_data))
+        data.extend(HEX_EOF_RECORD)
+        yield ImageVariant('Explicit extended address', 'hex', data,
+                           None, self._bin_data)
+
+        # An address record before every data record
+        data = bytearray()
+        for offset in range(0, len(self._bin_data), 0x10):
+            chunk = self._bin_data[offset:offset + 0x10]
+            data.extend(encode_records(self._start_addr + offset, chunk))
+        data.extend(HEX_EOF_RECORD)
+        yield ImageVariant('Extended address per record', 'hex', data,
+                           None, self._bin_data)
+
+    def _get_file_data(self, file_type):
+        if file_type == 'bin':
+            return bytearray(self._bin_data)
+        return bytearray().join(line for line, _ in self._get_hex_lines())
+
+    def _get_hex_lines(self):
+        """Return a list of (record line, data byte count) tuples"""
+        if self._hex_lines is None:
+            hex_data = bytes(bin_to_hex(self._start_addr, self._bin_data))
+            hex_lines = []
+            for line in hex_data.splitlines(True):
+                line = bytearray(line)
+                record_type = int(bytes(line[7:9]), 16)
+                data_size = 0
+                if record_type == _HEX_TYPE_DATA:
+                    data_size = int(bytes(line[1:3]), 16)
+                hex_lines.append((line, data_size))
+            self._hex_lines = hex_lines
+        return self._hex_lines
+
+
+def _select(item_list, max_count):
+    """Return up to max_count items evenly spread through item_list"""
+    item_list = list(item_list)
+    if max_count is None or len(item_list) <= max_count:
+        return item_list
+    if max_count <= 0:
+        return []
+    step = len(item_list) / max_count
+    return [item_list[int(step * (i + 1)) - 1] for i in range(max_count)]
+
+
+def run_variants(board, parent_test, variant_iter, tester_factory):
+    """Load each variant and check for its expected outcome
+
+    Positional arguments:
+        board - DaplinkBoard to load the images on
+        parent_test - TestInfo to add results to
+        variant_iter - iterable of ImageVariant
+        tester_factory - function taking (parent_test, test_name) and
+            returning a new MassStorageTester
+    """
+    for variant in variant_iter:
+        test = tester_factory(parent_test, str(variant))
+        test.set_programming_data(variant.data, variant.file_name)
+        test.set_expected_failure_msg(variant.expected_failure_msg)
+        test.set_expected_data(variant.expected_data)
+        if variant.causes_assert:
+            manage_assert = board.get_assert_auto_manage()
+            board.set_assert_auto_manage(False)
+            try:
+                test.run()
+            finally:
+                # Changing the setting clears the expected assert
+                board.set_assert_auto_manage(manage_assert)
+        else:
+            test.run()
@@ -120,3 +120,10 @@ TARGET_WITH_BAD_VECTOR_TABLE_LIST = [
 ]
 
 BOARD_ID_TO_BUILD_TARGET = {v: k for k, v in TARGET_NAME_TO_BOARD_ID.items()}
+
+HIC_ID_TO_STRING = {v: k for k, v in HIC_STRING_TO_ID.items()}
+
+
+def get_hic_name(hic_id):
+    """Return the name of a HIC ID, or the ID in hex if it is unknown"""
+    return HIC_ID_TO_STRING.get(hic_id, "0x%08x" % hic_id)
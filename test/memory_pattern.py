@@ -0,0 +1,150 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Bulk memory test patterns and range based comparison
+
+Patterns are generated as bytearrays in a few bulk operations rather
+than a byte at a time, so patterns covering all of a target's RAM are
+cheap to build.  Read back data is compared with slice comparisons,
+which only narrow down to single bytes in the regions that differ, and
+differences are reported as address ranges rather than byte by byte.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import struct
+import random
+import binascii
+
+PATTERN_WALKING_ONES = "walking ones"
+PATTERN_ADDRESS = "address in address"
+PATTERN_RANDOM = "random"
+PATTERN_LIST = [PATTERN_WALKING_ONES, PATTERN_ADDRESS, PATTERN_RANDOM]
+
+# Regions at most this size are compared byte by byte
+_MIN_SPLIT_SIZE = 32
+
+# Most mismatched ranges listed individually in a report
+_MAX_REPORTED_RANGES = 16
+
+
+def _pack_words(word_list):
+    return bytearray(struct.pack("<%iI" % len(word_list), *word_list))
+
+
+def make_pattern(pattern, addr, size, seed=0):
+    """Return size bytes of pattern for memory starting at addr
+
+    Positional arguments:
+        pattern - one of PATTERN_LIST
+        addr - address the data is written to
+        size - size of the data in bytes
+
+    Keyword arguments:
+        seed - value selecting the random data, or the starting bit of
+            the walking ones
+
+    The word patterns are aligned to the word boundaries of memory, so
+    they can be written at unaligned addresses.
+    """
+    assert size >= 0
+    first_word = addr // 4
+    word_count = (addr + size + 3) // 4 - first_word
+    if pattern == PATTERN_WALKING_ONES:
+        word_list = [1 << ((first_word + index + seed) % 32)
+                     for index in range(word_count)]
+        words = _pack_words(word_list)
+    elif pattern == PATTERN_ADDRESS:
+        word_list = [((first_word + index) * 4) & 0xFFFFFFFF
+                     for index in range(word_count)]
+        words = _pack_words(word_list)
+    elif pattern == PATTERN_RANDOM:
+        rand = random.Random(seed)
+        if size == 0:
+            return bytearray()
+        return bytearray(binascii.unhexlify('%0*x' %
+                                            (size * 2,
+                                             rand.getrandbits(size * 8))))
+    else:
+        raise Exception("Unknown memory pattern %s" % pattern)
+    start = addr - first_word * 4
+    return words[start:start + size]
+
+
+def find_mismatch_ranges(expected, actual, base=0):
+    """Return a list of (start, end) address ranges where the data differs
+
+    Positional arguments:
+        expected - bytearray of the data written
+        actual - bytearray of the data read back
+
+    Keyword arguments:
+        base - address of the first byte
+
+    Ranges are half open and sorted.  Bytes missing from the end of
+    actual count as differences.
+    """
+    if expected == actual:
+        return []
+    size = min(len(expected), len(actual))
+    offset_list = []
+    pending = [(0, size)]
+    while pending:
+        start, end = pending.pop()
+        if expected[start:end] == actual[start:end]:
+            continue
+        if end - start <= _MIN_SPLIT_SIZE:
+            offset_list.extend(offset for offset in range(start, end)
+                               if expected[offset] != actual[offset])
+            continue
+        middle = (start + end) // 2
+        # Push the upper half first so regions are found in order
+        pending.append((middle, end))
+        pending.append((start, middle))
+
+    range_list = []
+    for offset in offset_list:
+        if range_list and range_list[-1][1] == base + offset:
+            range_list[-1][1] += 1
+        else:
+            range_list.append([base + offset, base + offset + 1])
+    if len(expected) > size:
+        if range_list and range_list[-1][1] == base + size:
+            range_list[-1][1] = base + len(expected)
+        else:
+            range_list.append([base + size, base + len(expected)])
+    return [tuple(mismatch) for mismatch in range_list]
+
+
+def report_mismatches(test_info, range_list, name):
+    """Add a failure and the mismatched ranges to test_info
+
+    Nothing is added if range_list is empty.
+    """
+    if not range_list:
+        return
+    total = sum(end - start for start, end in range_list)
+    test_info.failure("%s: %i bytes differ in %i ranges" %
+                      (name, total, len(range_list)))
+    for start, end in range_list[0:_MAX_REPORTED_RANGES]:
+        test_info.info("    0x%08x-0x%08x (%i bytes)" %
+                       (start, end - 1, end - start))
+    if len(range_list) > _MAX_REPORTED_RANGES:
+        test_info.info("    %i more ranges not shown" %
+                       (len(range_list) - _MAX_REPORTED_RANGES))
@@ -23,6 +23,13 @@ import time
 import shutil
 import six
 import info
+from synthetic_image import (SyntheticImage, SyntheticHexImage, iter_chunks,
+                             compare)
+from image_mutation import ImageMutator, run_variants
+from msd_write_pattern import RawFileWriter, WRITE_PATTERN_LIST
+from timing import (Timeline, TIMELINE_ATTACHMENT, PHASE_MOCK_FILES,
+                    PHASE_HOST_WRITE, PHASE_TEST_FS, PHASE_FAILURE_MSG,
+                    PHASE_VERIFY)
 
 
 def _same(d1, d2):
@@ -78,6 +85,9 @@ class MassStorageTester(object):
         self._mock_file_list_after = []
         self._mock_dir_list_after = []
         self._programming_file_name = None
+        self._write_pattern = None
+        self._check_outcome = True
+        self._timeline = Timeline()
 
     def set_shutils_copy(self, source_file_name):
         """
@@ -95,9 +105,11 @@ class MassStorageTester(object):
         Set data to program over mass storage
 
         Data should be the conetents of the hex or binary file
-        being loaded. This option cannot be used with set_shutils_copy.
+        being loaded, either as a bytearray or as an image source from
+        synthetic_image. This option cannot be used with set_shutils_copy.
         """
-        assert type(data) is bytearray
+        assert (type(data) is bytearray or
+                isinstance(data, (SyntheticImage, SyntheticHexImage)))
         assert type(file_name) is str
         assert(self._load_with_shutils is False or
                self._load_with_shutils is None)
@@ -105,6 +117,25 @@ class MassStorageTester(object):
         self._programming_data = data
         self._programming_file_name = file_name
 
+    def set_write_pattern(self, pattern):
+        """
+        Write the file as raw sectors in the order of a WritePattern
+
+        The sectors are written directly to the drive's block device.
+        This option requires programming data set as a bytearray.
+        """
+        self._write_pattern = pattern
+
+    def set_check_outcome(self, check):
+        """
+        Set to False to report the outcome of the load without checking it
+
+        Use this when the correct outcome is not known, such as for
+        write patterns that depend on firmware internals.
+        """
+        assert isinstance(check, bool)
+        self._check_outcome = check
+
     def set_flush_size(self, size):
         """Set the block size to simulate a flush of"""
         assert isinstance(size, six.integer_types)
@@ -112,7 +143,8 @@ class MassStorageTester(object):
 
     def set_expected_data(self, data):
         """Data that should have been written to the device"""
-        assert data is None or type(data) is bytearray
+        assert (data is None or type(data) is bytearray or
+                isinstance(data, SyntheticImage))
         self._expected_data = data
 
     def set_expected_failure_msg(self, msg):
@@ -138,24 +170,48 @@ class MassStorageTester(object):
 
     def _check_data_correct(self, expected_data, test_info):
         """Return True if the actual data written matches the expected"""
+        if isinstance(expected_data, SyntheticImage):
+            # Verify in chunks so the image is never fully in memory
+            offset = compare(expected_data, self.board.read_target_memory)
+            if offset is not None:
+                test_info.info('First mismatch at offset 0x%x' % offset)
+            return offset is None
         data_len = len(expected_data)
         data_loaded = self.board.read_target_memory(0, data_len)
         return _same(expected_data, data_loaded)
 
+    def get_timeline(self):
+        """Return the Timeline of the phases of this load"""
+        return self._timeline
+
     def run(self):
         # Expected data must be set, even if to None
         assert hasattr(self, '_expected_data')
         test_info = self.parent_test.create_subtest(self.test_name)
+        try:
+            self._run(test_info)
+        finally:
+            timeline = self._timeline
+            test_info.info('Timing: %s' % timeline)
+            test_info.attach(TIMELINE_ATTACHMENT, timeline)
+            self.board.load_timing.add_timeline(timeline)
+
+    def _run(self, test_info):
+        timeline = self._timeline
+
+        # The board re-enumerates after the load
+        self.board.session_pool.release()
 
         # Copy mock files before test
         self._mock_file_list = []
-        for dir_name in self._mock_dir_list:
-            dir_path = self.board.get_file_path(dir_name)
-            os.mkdir(dir_path)
-        for file_name, file_contents in self._mock_file_list:
-            file_path = self.board.get_file_path(file_name)
-            with open(file_path, 'wb') as file_handle:
-                file_handle.write(file_contents)
+        with timeline.phase(PHASE_MOCK_FILES):
+            for dir_name in self._mock_dir_list:
+                dir_path = self.board.get_file_path(dir_name)
+                os.mkdir(dir_path)
+            for file_name, file_contents in self._mock_file_list:
+                file_path = self.board.get_file_path(file_name)
+                with open(file_path, 'wb') as file_handle:
+                    file_handle.write(file_contents)
 
         programming_file_name = None
         if self._programming_file_name is not None:
@@ -167,6 +223,12 @@ class MassStorageTester(object):
         if self._load_with_shutils:
             # Copy with shutils
             shutil.copy(self._source_file_name, self.board.get_mount_point())
+        elif self._write_pattern is not None:
+            # Replay a host write pattern with raw sector writes
+            assert type(self._programming_data) is bytearray
+            writer = RawFileWriter(self.board.get_block_device())
+            writer.write_file(self._programming_file_name,
+                              self._programming_data, self._write_pattern)
         elif self._flush_size is not None:
             # Simulate flushes during the file transfer
             # Note - The file is explicitly opened and closed to more
@@ -174,18 +236,23 @@ class MassStorageTester(object):
             #        cause.  On Windows flushing a file causes the data to be
             #        written out immediately, but only sometimes causes the
             #        filesize to get updated.
-            size = len(self._programming_data)
-            for addr in range(0, size, self._flush_size):
-                data = self._programming_data[addr:addr + self._flush_size]
+            for _, data in iter_chunks(self._programming_data,
+                                       self._flush_size):
                 with open(programming_file_name, 'ab') as file_handle:
                     file_handle.write(data)
                 time.sleep(self._flush_time)
+        elif type(self._programming_data) is not bytearray:
+            # Stream a generated image to the file
+            with open(programming_file_name, 'wb') as load_file:
+                for _, data in iter_chunks(self._programming_data):
+                    load_file.write(data)
         else:
             # Perform a normal copy
             with open(programming_file_name, 'wb') as load_file:
                 load_file.write(self._programming_data)
         stop = time.time()
         diff = stop - start
+        timeline.add(PHASE_HOST_WRITE, diff)
         test_info.info('Loading took %ss' % diff)
         if self._expected_data is not None:
             test_info.info('Programming rate %sB/s' %
@@ -196,21 +263,27 @@ class MassStorageTester(object):
 
         # Copy mock files after loading
         self._mock_file_list = []
-        for dir_name in self._mock_dir_list_after:
-            dir_path = self.board.get_file_path(dir_name)
-            os.mkdir(dir_path)
-        for file_name, file_contents in self._mock_file_list_after:
-            file_path = self.board.get_file_path(file_name)
-            with open(file_path, 'wb') as file_handle:
-                file_handle.write(file_contents)
+        with timeline.phase(PHASE_MOCK_FILES):
+            for dir_name in self._mock_dir_list_after:
+                dir_path = self.board.get_file_path(dir_name)
+                os.mkdir(dir_path)
+            for file_name, file_contents in self._mock_file_list_after:
+                file_path = self.board.get_file_path(file_name)
+                with open(file_path, 'wb') as file_handle:
+                    file_handle.write(file_contents)
 
-        self.board.wait_for_remount(test_info)
+        self.board.wait_for_remount(test_info, timeline=timeline)
 
         # Verify the disk is still valid
-        self.board.test_fs(test_info)
+        with timeline.phase(PHASE_TEST_FS):
+            self.board.test_fs(test_info)
 
         # Check various failure cases
-        msg = self.board.get_failure_message()
+        with timeline.phase(PHASE_FAILURE_MSG):
+            msg = self.board.get_failure_message()
+        if not self._check_outcome:
+            self._report_outcome(msg, test_info)
+            return
         failure_expected = self._expected_failure_msg is not None
         failure_occured = msg is not None
         if failure_occured and not failure_expected:
@@ -234,11 +307,31 @@ class MassStorageTester(object):
 
         # If there is expected data then compare
         if self._expected_data:
-            if self._check_data_correct(self._expected_data, test_info):
+            with timeline.phase(PHASE_VERIFY):
+                data_correct = self._check_data_correct(self._expected_data,
+                                                        test_info)
+            if data_correct:
                 test_info.info("Data matches")
             else:
                 test_info.failure('Data does not match')
 
+    def _report_outcome(self, msg, test_info):
+        """Log the outcome of a load without treating it as pass or fail"""
+        if msg is not None:
+            test_info.info('Outcome: device reported "%s"' % msg.strip())
+            return
+        if not self._expected_data:
+            test_info.info('Outcome: no failure reported')
+            return
+        with self._timeline.phase(PHASE_VERIFY):
+            data_correct = self._check_data_correct(self._expected_data,
+                                                    test_info)
+        if data_correct:
+            test_info.info('Outcome: no failure reported and data matches')
+        else:
+            test_info.info('Outcome: no failure reported but data does '
+                           'not match')
+
 
 def test_mass_storage(workspace, parent_test):
     """Test the mass storage endpoint
@@ -325,6 +418,39 @@ def test_mass_storage(workspace, parent_test):
             test.set_expected_data(vectors_and_pad)
         test.run()
 
+    # Test loading generated images streamed to the drive.  Random data
+    #    can set security bits so skip devices that lock when erased.
+    if not bad_vector_table and not locked_when_erased:
+        synthetic_bin = SyntheticImage(len(bin_file_contents),
+                                       vector_table=bin_file_contents[0:32])
+        test = MassStorageTester(board, test_info, "Load synthetic binary")
+        test.set_programming_data(synthetic_bin, 'image.bin')
+        test.set_expected_data(synthetic_bin)
+        test.run()
+
+        synthetic_bin = SyntheticImage(len(bin_file_contents), seed=1,
+                                       vector_table=bin_file_contents[0:32])
+        test = MassStorageTester(board, test_info, "Load synthetic hex")
+        test.set_programming_data(SyntheticHexImage(synthetic_bin),
+                                  'image.hex')
+        test.set_expected_data(synthetic_bin)
+        test.run()
+
+    # Test corrupt and edge case variants of the image
+    def tester_factory(parent_test, test_name):
+        return MassStorageTester(board, parent_test, test_name)
+    mutator = ImageMutator(bin_file_contents,
+                           security_bits_checked=locked_when_erased)
+    variant_test = test_info.create_subtest("Image variants")
+    run_variants(board, variant_test, mutator.iter_variants('hex'),
+                 tester_factory)
+    if not bad_vector_table:
+        run_variants(board, variant_test, mutator.iter_variants('bin'),
+                     tester_factory)
+
+    # Test the orders different host OSes write the file in
+    test_write_patterns(board, test_info, hex_file_contents, bin_file_contents)
+
     # Test a normal load with dummy files created beforehand
     test = MassStorageTester(board, test_info, "Extra Files")
     test.set_programming_data(hex_file_contents, 'image.hex')
@@ -356,3 +482,32 @@ def test_mass_storage(workspace, parent_test):
     # -change file extension
     # -Change size (make smaller)
     # -change starting address
+
+
+def test_write_patterns(board, parent_test, hex_data, bin_data):
+    """Load a hex file with each raw sector write pattern
+
+    Only supported on Linux, where the drive's block device is known.
+    The time and outcome of each pattern are logged.
+    """
+    test_info = parent_test.create_subtest('test_write_patterns')
+    device = board.get_block_device()
+    if device is None or not os.access(device, os.R_OK | os.W_OK):
+        test_info.info('Skipping - no read/write access to the block '
+                       'device of %s' % board.get_mount_point())
+        return
+
+    summary_list = []
+    for pattern in WRITE_PATTERN_LIST:
+        test = MassStorageTester(board, test_info,
+                                 'Write pattern "%s"' % pattern)
+        test.set_programming_data(hex_data, 'image.hex')
+        test.set_write_pattern(pattern)
+        test.set_expected_data(bin_data)
+        test.set_check_outcome(pattern.outcome_known)
+        test.run()
+        summary_list.append((pattern, test.get_timeline()))
+
+    for pattern, timeline in summary_list:
+        test_info.info('%s: total %.3fs - %s' % (pattern, timeline.total,
+                                                 timeline))
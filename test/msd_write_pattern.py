@@ -0,0 +1,274 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Replay host OS write patterns with raw sector writes
+
+The order a host writes FAT metadata and file data to the drive varies
+between operating systems, and vfs_manager.c and file_stream.c behave
+differently depending on that order.  This module lays a file out on the
+drive's FAT filesystem itself and writes the sectors straight to the
+block device in a scripted order.
+
+Writing to the block device requires read/write access to it, which on
+Linux usually means running as root or as a member of the disk group.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import os
+import random
+import struct
+
+# Steps a write pattern is built from
+STEP_DIR_EMPTY = "dir_empty"    # Directory entry with no size or cluster
+STEP_DIR = "dir"                # Complete directory entry
+STEP_FAT = "fat"                # Cluster chain in every FAT copy
+STEP_DATA = "data"              # File contents
+
+# Order file data sectors are written in
+ORDER_SEQUENTIAL = "sequential"
+ORDER_REVERSED = "reversed"
+ORDER_SHUFFLED = "shuffled"
+
+_DIR_ENTRY_SIZE = 32
+_ATTR_ARCHIVE = 0x20
+
+
+class WritePattern(object):
+    """A scripted order of raw writes used to create a file
+
+    Positional arguments:
+        name - description of the pattern
+        step_list - list of STEP_* values in the order they are written
+
+    Keyword arguments:
+        data_order - one of the ORDER_* values
+        outcome_known - False if the outcome depends on firmware
+            internals, so it should be reported rather than checked
+    """
+
+    def __init__(self, name, step_list, data_order=ORDER_SEQUENTIAL,
+                 outcome_known=True):
+        assert STEP_DATA in step_list
+        assert data_order in (ORDER_SEQUENTIAL, ORDER_REVERSED, ORDER_SHUFFLED)
+        self.name = name
+        self.step_list = step_list
+        self.data_order = data_order
+        self.outcome_known = outcome_known
+
+    def __str__(self):
+        return self.name
+
+
+# The Windows, macOS and Linux patterns are modelled on the order these
+# hosts typically write a new file to a FAT drive.  They are not taken
+# from recorded USB traces, and none are included here.
+WRITE_PATTERN_LIST = [
+    WritePattern("Directory entry first", [STEP_DIR, STEP_FAT, STEP_DATA]),
+    WritePattern("Directory entry last", [STEP_DATA, STEP_FAT, STEP_DIR]),
+    WritePattern("FAT last", [STEP_DIR, STEP_DATA, STEP_FAT]),
+    WritePattern("Windows style", [STEP_DIR_EMPTY, STEP_FAT, STEP_DATA,
+                                   STEP_DIR]),
+    WritePattern("macOS style", [STEP_DIR_EMPTY, STEP_DATA, STEP_FAT,
+                                 STEP_DIR, STEP_DIR]),
+    WritePattern("Linux style", [STEP_DIR_EMPTY, STEP_DATA, STEP_FAT,
+                                 STEP_DIR]),
+    WritePattern("Data reversed", [STEP_DIR, STEP_FAT, STEP_DATA],
+                 data_order=ORDER_REVERSED, outcome_known=False),
+    WritePattern("Data shuffled", [STEP_DIR, STEP_FAT, STEP_DATA],
+                 data_order=ORDER_SHUFFLED, outcome_known=False),
+]
+
+
+class FatLayout(object):
+    """Layout of a FAT12 or FAT16 filesystem read from its boot sector"""
+
+    def __init__(self, boot_sector):
+        (self.bytes_per_sector, self.sectors_per_cluster,
+         self.reserved_sectors, self.num_fats, self.root_entries,
+         total_sectors_16, _, self.sectors_per_fat) = \
+            struct.unpack_from("<HBHBHHBH", bytes(boot_sector), 11)
+        total_sectors_32 = struct.unpack_from("<I", bytes(boot_sector), 32)[0]
+        self.total_sectors = total_sectors_16 or total_sectors_32
+        assert self.bytes_per_sector > 0 and self.sectors_per_cluster > 0
+
+        self.fat_start = self.reserved_sectors
+        self.root_start = self.fat_start + self.num_fats * self.sectors_per_fat
+        root_bytes = self.root_entries * _DIR_ENTRY_SIZE
+        self.root_sectors = ((root_bytes + self.bytes_per_sector - 1) //
+                             self.bytes_per_sector)
+        self.data_start = self.root_start + self.root_sectors
+        self.cluster_count = ((self.total_sectors - self.data_start) //
+                              self.sectors_per_cluster)
+        self.fat_bits = 12 if self.cluster_count < 4085 else 16
+
+    @property
+    def cluster_size(self):
+        return self.bytes_per_sector * self.sectors_per_cluster
+
+    def cluster_to_sector(self, cluster):
+        return self.data_start + (cluster - 2) * self.sectors_per_cluster
+
+    def get_fat_entry(self, fat, cluster):
+        if self.fat_bits == 16:
+            return struct.unpack_from("<H", bytes(fat), cluster * 2)[0]
+        offset = cluster + cluster // 2
+        value = fat[offset] | (fat[offset + 1] << 8)
+        return value >> 4 if cluster & 1 else value & 0xFFF
+
+    def set_fat_entry(self, fat, cluster, value):
+        if self.fat_bits == 16:
+            struct.pack_into("<H", fat, cluster * 2, value)
+            return
+        offset = cluster + cluster // 2
+        old = fat[offset] | (fat[offset + 1] << 8)
+        if cluster & 1:
+            new = (old & 0x000F) | ((value & 0xFFF) << 4)
+        else:
+            new = (old & 0xF000) | (value & 0xFFF)
+        fat[offset] = new & 0xFF
+        fat[offset + 1] = (new >> 8) & 0xFF
+
+
+def _short_name(file_name):
+    """Return the 11 character 8.3 directory name for file_name"""
+    base, ext = os.path.splitext(file_name.upper())
+    ext = ext[1:]
+    assert 0 < len(base) <= 8 and len(ext) <= 3, \
+        'File name "%s" is not a valid 8.3 name' % file_name
+    return (base.ljust(8) + ext.ljust(3)).encode('ascii')
+
+
+def _dir_entry(file_name, cluster, size):
+    return struct.pack("<11sB10xHHHI", _short_name(file_name), _ATTR_ARCHIVE,
+                       0, 0, cluster, size)
+
+
+class RawFileWriter(object):
+    """Create a file on a FAT block device with a given write pattern"""
+
+    def __init__(self, device_path):
+        self._device_path = device_path
+        self._fd = None
+        self._layout = None
+
+    def write_file(self, file_name, data, pattern, seed=0):
+        """Write data to a new file named file_name using pattern"""
+        self._fd = os.open(self._device_path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._write_file(file_name, data, pattern, seed)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def _write_file(self, file_name, data, pattern, seed):
+        layout = FatLayout(self._read_sectors(0, 1))
+        self._layout = layout
+        sector_size = layout.bytes_per_sector
+
+        # Find a free directory entry and free clusters
+        root = self._read_sectors(layout.root_start, layout.root_sectors)
+        entry_offset = None
+        for offset in range(0, len(root), _DIR_ENTRY_SIZE):
+            if root[offset] in (0x00, 0xE5):
+                entry_offset = offset
+                break
+        if entry_offset is None:
+            raise Exception("No free root directory entry")
+        fat = self._read_sectors(layout.fat_start, layout.sectors_per_fat)
+        cluster_count = max(1, ((len(data) + layout.cluster_size - 1) //
+                                layout.cluster_size))
+        cluster_list = []
+        for cluster in range(2, layout.cluster_count + 2):
+            if layout.get_fat_entry(fat, cluster) == 0:
+                cluster_list.append(cluster)
+                if len(cluster_list) == cluster_count:
+                    break
+        if len(cluster_list) < cluster_count:
+            raise Exception("Not enough free clusters for %i bytes" %
+                            len(data))
+
+        # Build the new FAT and directory contents
+        new_fat = bytearray(fat)
+        end_of_chain = 0xFFF if layout.fat_bits == 12 else 0xFFFF
+        for index, cluster in enumerate(cluster_list):
+            if index + 1 < len(cluster_list):
+                next_cluster = cluster_list[index + 1]
+            else:
+                next_cluster = end_of_chain
+            layout.set_fat_entry(new_fat, cluster, next_cluster)
+        entry_sector = layout.root_start + entry_offset // sector_size
+        entry_pos = entry_offset % sector_size
+        sector_start = (entry_sector - layout.root_start) * sector_size
+        dir_sector = bytearray(root[sector_start:sector_start + sector_size])
+
+        def dir_step(cluster, size):
+            dir_sector[entry_pos:entry_pos + _DIR_ENTRY_SIZE] = \
+                _dir_entry(file_name, cluster, size)
+            return [(entry_sector, bytearray(dir_sector))]
+
+        # Only FAT sectors that changed need to be written
+        fat_writes = []
+        for index in range(layout.sectors_per_fat):
+            start = index * sector_size
+            new_sector = new_fat[start:start + sector_size]
+            if new_sector == fat[start:start + sector_size]:
+                continue
+            for fat_index in range(layout.num_fats):
+                sector = (layout.fat_start + fat_index *
+                          layout.sectors_per_fat + index)
+                fat_writes.append((sector, new_sector))
+
+        data_writes = []
+        for offset in range(0, len(data), sector_size):
+            cluster_index = offset // layout.cluster_size
+            sector = (layout.cluster_to_sector(cluster_list[cluster_index]) +
+                      (offset % layout.cluster_size) // sector_size)
+            sector_data = bytearray(data[offset:offset + sector_size])
+            sector_data.extend(bytearray(sector_size - len(sector_data)))
+            data_writes.append((sector, sector_data))
+        if pattern.data_order == ORDER_REVERSED:
+            data_writes.reverse()
+        elif pattern.data_order == ORDER_SHUFFLED:
+            random.Random(seed).shuffle(data_writes)
+
+        for step in pattern.step_list:
+            if step == STEP_DIR_EMPTY:
+                write_list = dir_step(0, 0)
+            elif step == STEP_DIR:
+                write_list = dir_step(cluster_list[0], len(data))
+            elif step == STEP_FAT:
+                write_list = fat_writes
+            elif step == STEP_DATA:
+                write_list = data_writes
+            else:
+                assert False, 'Unknown step "%s"' % step
+            for sector, sector_data in write_list:
+                self._write_sector(sector, sector_data)
+
+    def _read_sectors(self, sector, count):
+        sector_size = 512 if self._layout is None else \
+            self._layout.bytes_per_sector
+        os.lseek(self._fd, sector * sector_size, os.SEEK_SET)
+        return bytearray(os.read(self._fd, count * sector_size))
+
+    def _write_sector(self, sector, data):
+        os.lseek(self._fd, sector * self._layout.bytes_per_sector,
+                 os.SEEK_SET)
+        os.write(self._fd, bytes(data))
@@ -0,0 +1,122 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Run the HID tests of many boards at once, one process per board
+
+pyOCD does most of its work in Python, so the HID tests of different
+boards cannot overlap in threads.  Each board is given its own process
+instead, which opens its own pyOCD session, runs the HID test functions
+in turn and sends back the TestInfo tree they filled in.  The trees are
+added to the TestInfo of each configuration in the parent.
+
+Test configurations are passed to the processes when they start, so on
+systems without fork they must be picklable.  Everything attached to a
+TestInfo by the HID tests must be picklable.
+"""
+
+from __future__ import absolute_import
+import pickle
+import traceback
+import multiprocessing
+from six.moves import queue
+from test_info import TestInfo
+
+# Seconds between checks that the test processes are still running
+_POLL_INTERVAL = 1.0
+
+
+def _run_suites(index, test_configuration, suite_list, result_queue):
+    """Process entry point running suite_list on one board"""
+    board = test_configuration.board
+    test_info = TestInfo("HID tests on %s" % board.get_unique_id())
+    try:
+        for function, args in suite_list:
+            function(test_configuration, test_info, *args)
+    except Exception:
+        test_info.failure("Exception in HID tests:\n%s" %
+                          traceback.format_exc())
+    finally:
+        board.session_pool.release()
+    try:
+        data = pickle.dumps(test_info, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        # Send the messages even if an attachment cannot be pickled
+        test_info = _strip_attachments(test_info)
+        data = pickle.dumps(test_info, pickle.HIGHEST_PROTOCOL)
+    result_queue.put((index, data))
+
+
+def _strip_attachments(test_info):
+    test_info._attachments = {}
+    for entry_type, msg in test_info._all:
+        if entry_type == TestInfo.SUBTEST:
+            _strip_attachments(msg)
+    return test_info
+
+
+def run_parallel_hid(configuration_list, suite_list):
+    """Run suite_list on the board of each configuration at once
+
+    Positional arguments:
+        configuration_list - test configurations, each on its own board
+        suite_list - list of (function, args) where each function is
+            called as function(test_configuration, test_info, *args)
+
+    The results of each board are added as a subtest of the test_info
+    of its configuration.  A board whose process exits without sending
+    results is given a failure instead.
+    """
+    board_set = set(conf.board.get_unique_id() for conf in configuration_list)
+    assert len(board_set) == len(configuration_list), \
+        "Each configuration must be on a different board"
+
+    # Sessions held by this process would keep the HID devices busy
+    for test_configuration in configuration_list:
+        test_configuration.board.session_pool.release()
+
+    result_queue = multiprocessing.Queue()
+    process_list = []
+    for index, test_configuration in enumerate(configuration_list):
+        process = multiprocessing.Process(
+            target=_run_suites,
+            args=(index, test_configuration, suite_list, result_queue))
+        process.start()
+        process_list.append(process)
+
+    index_to_result = {}
+    while len(index_to_result) < len(process_list):
+        try:
+            index, data = result_queue.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            # A process has flushed its result before it exits
+            if any(process.is_alive() for process in process_list):
+                continue
+            break
+        index_to_result[index] = pickle.loads(data)
+    for process in process_list:
+        process.join()
+
+    for index, test_configuration in enumerate(configuration_list):
+        if index in index_to_result:
+            test_configuration.test_info.add_subtest(index_to_result[index])
+        else:
+            test_configuration.test_info.failure(
+                "HID test process for %s exited with code %s and no "
+                "results" % (test_configuration.board.get_unique_id(),
+                             process_list[index].exitcode))
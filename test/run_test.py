@@ -66,9 +66,15 @@ import shutil
 import argparse
 import subprocess
 from enum import Enum
-from hid_test import test_hid
-from serial_test import test_serial
+from hid_test import (test_hid, test_hid_throughput, test_swd_sweep,
+                      test_flash_benchmark, test_hid_memory,
+                      test_debug_latency)
+from serial_test import (test_serial, test_serial_throughput,
+                         test_serial_latency, test_serial_baud_matrix,
+                         test_serial_reset, standard_baud, baud_matrix)
 from msd_test import test_mass_storage
+from parallel_hid import run_parallel_hid
+from event_log import JsonLinesSink, read_events, write_junit
 from daplink_board import get_all_attached_daplink_boards
 from project_generator.generate import Generator
 from test_info import TestInfo
@@ -86,14 +92,37 @@ VERB_ALL = 'All'            # All errors
 VERB_LEVELS = [VERB_MINIMAL, VERB_NORMAL, VERB_VERBOSE, VERB_ALL]
 
 
-def test_endpoints(workspace, parent_test):
-    """Run tests to validate DAPLINK fimrware"""
+def test_endpoints(workspace, parent_test, hid=True):
+    """Run tests to validate DAPLINK fimrware
+
+    The HID test is skipped if hid is False, for when it is run along
+    with the other HID tests in a separate process.
+    """
     test_info = parent_test.create_subtest('test_endpoints')
-    test_hid(workspace, test_info)
+    if hid:
+        test_hid(workspace, test_info)
     test_serial(workspace, test_info)
     test_mass_storage(workspace, test_info)
 
 
+def _group_by_board(test_configuration_list):
+    """Split configurations into rounds using each board at most once
+
+    The configurations of each board stay in their original order.
+    """
+    round_list = []
+    for test_configuration in test_configuration_list:
+        unique_id = test_configuration.board.get_unique_id()
+        for round_conf_list in round_list:
+            if all(conf.board.get_unique_id() != unique_id
+                   for conf in round_conf_list):
+                round_conf_list.append(test_configuration)
+                break
+        else:
+            round_list.append([test_configuration])
+    return round_list
+
+
 class TestConfiguration(object):
     """Wrap all the resources needed to run a test"""
     def __init__(self, name):
@@ -139,6 +168,19 @@ class TestManager(object):
         self._load_bl = True
         self._test_daplink = True
         self._test_ep = True
+        self._serial_bench_duration = None
+        self._serial_latency_count = None
+        self._serial_matrix = False
+        self._serial_reset_count = None
+        self._serial_extra_baud_list = []
+        self._hid_benchmark = False
+        self._swd_sweep = False
+        self._flash_benchmark = False
+        self._hid_memory_seed = None
+        self._debug_latency_count = None
+        self._parallel_hid = False
+        self._event_log_path = None
+        self._info_budget = None
 
         # Internal state
         self._state = self._STATE.INIT
@@ -146,6 +188,7 @@ class TestManager(object):
         self._all_tests_pass = None
         self._firmware_filter = None
         self._untested_firmware = None
+        self._event_sink = None
 
     @property
     def all_tests_pass(self):
@@ -182,6 +225,81 @@ class TestManager(object):
         assert self._state is self._STATE.INIT
         self._test_ep = run_test
 
+    def set_serial_benchmark(self, duration):
+        """Benchmark serial throughput for duration seconds per baud"""
+        assert duration is None or duration > 0
+        assert self._state is self._STATE.INIT
+        self._serial_bench_duration = duration
+
+    def set_serial_latency(self, count):
+        """Measure count serial round trips per payload size and baud"""
+        assert count is None or count > 0
+        assert self._state is self._STATE.INIT
+        self._serial_latency_count = count
+
+    def set_serial_matrix(self, run_test):
+        """Test serial echo over the extended baud matrix"""
+        assert isinstance(run_test, bool)
+        assert self._state is self._STATE.INIT
+        self._serial_matrix = run_test
+
+    def set_serial_reset(self, count):
+        """Time count resets of the target through the serial port"""
+        assert count is None or count > 0
+        assert self._state is self._STATE.INIT
+        self._serial_reset_count = count
+
+    def set_hid_benchmark(self, run_test):
+        """Benchmark memory transfer speed over HID"""
+        assert isinstance(run_test, bool)
+        assert self._state is self._STATE.INIT
+        self._hid_benchmark = run_test
+
+    def set_swd_sweep(self, run_test):
+        """Find the fastest reliable SWD clock and turnaround"""
+        assert isinstance(run_test, bool)
+        assert self._state is self._STATE.INIT
+        self._swd_sweep = run_test
+
+    def set_flash_benchmark(self, run_test):
+        """Compare CMSIS-DAP and drag and drop programming speed"""
+        assert isinstance(run_test, bool)
+        assert self._state is self._STATE.INIT
+        self._flash_benchmark = run_test
+
+    def set_hid_memory_test(self, seed):
+        """Test all target RAM with patterns generated from seed"""
+        assert self._state is self._STATE.INIT
+        self._hid_memory_seed = seed
+
+    def set_debug_latency(self, count):
+        """Time count halts, steps and register accesses"""
+        assert count is None or count > 0
+        assert self._state is self._STATE.INIT
+        self._debug_latency_count = count
+
+    def set_parallel_hid(self, parallel):
+        """Run the HID tests of all boards at once in separate processes"""
+        assert isinstance(parallel, bool)
+        assert self._state is self._STATE.INIT
+        self._parallel_hid = parallel
+
+    def set_event_log(self, path):
+        """Stream test events to path as JSON Lines while tests run"""
+        assert self._state is self._STATE.INIT
+        self._event_log_path = path
+
+    def set_info_budget(self, count):
+        """Keep at most count info messages per configuration in memory"""
+        assert count is None or count >= 0
+        assert self._state is self._STATE.INIT
+        self._info_budget = count
+
+    def add_serial_baud(self, baud_list):
+        """Add non-standard baud rates to the serial benchmarks"""
+        assert self._state is self._STATE.INIT
+        self._serial_extra_baud_list.extend(baud_list)
+
     def add_firmware(self, firmware_list):
         """Add firmware to be tested"""
         assert self._state is self._STATE.INIT
@@ -209,40 +327,127 @@ class TestManager(object):
         assert self._state is self._STATE.CONFIGURED
         self._state = self._STATE.COMPLETE
 
-        all_tests_pass = True
-        for test_configuration in self._test_configuration_list:
-            board = test_configuration.board
-            test_info = TestInfo(test_configuration.name)
-            test_configuration.test_info = test_info
-
-            test_info.info("Board: %s" % test_configuration.board)
-            test_info.info("Application: %s" %
-                           test_configuration.if_firmware)
-            test_info.info("Bootloader: %s" %
-                           test_configuration.bl_firmware)
-            test_info.info("Target: %s" % test_configuration.target)
-
-            if self._load_if:
-                if_path = test_configuration.if_firmware.hex_path
-                board.load_interface(if_path, test_info)
-
-            valid_bl = test_configuration.bl_firmware is not None
-            if self._load_bl and valid_bl:
-                bl_path = test_configuration.bl_firmware.hex_path
-                board.load_bootloader(bl_path, test_info)
-
-            board.set_check_fs_on_remount(True)
-
-            if self._test_daplink:
-                daplink_test(test_configuration, test_info)
+        if self._event_log_path is not None:
+            self._event_sink = JsonLinesSink(self._event_log_path)
+        try:
+            self._all_tests_pass = self._run_rounds()
+        finally:
+            if self._event_sink is not None:
+                self._event_sink.close()
 
-            if self._test_ep:
-                test_endpoints(test_configuration, test_info)
-
-            if test_info.get_failed():
-                all_tests_pass = False
-
-        self._all_tests_pass = all_tests_pass
+    def _run_rounds(self):
+        """Run the configurations and return True if all passed"""
+        all_tests_pass = True
+        if self._parallel_hid:
+            round_list = _group_by_board(self._test_configuration_list)
+        else:
+            round_list = [[test_configuration] for test_configuration
+                          in self._test_configuration_list]
+        for round_conf_list in round_list:
+            for test_configuration in round_conf_list:
+                self._run_configuration(test_configuration)
+            if self._parallel_hid and self._test_ep:
+                run_parallel_hid(round_conf_list,
+                                 [(test_hid, ())] +
+                                 self._get_hid_suite_list())
+            for test_configuration in round_conf_list:
+                self._report_configuration(test_configuration)
+                if test_configuration.test_info.get_failed():
+                    all_tests_pass = False
+        return all_tests_pass
+
+    def _get_hid_suite_list(self):
+        """Return (function, args) for each HID benchmark selected"""
+        suite_list = []
+        if self._hid_benchmark:
+            suite_list.append((test_hid_throughput, ()))
+        if self._swd_sweep:
+            suite_list.append((test_swd_sweep, ()))
+        if self._flash_benchmark:
+            suite_list.append((test_flash_benchmark, ()))
+        if self._hid_memory_seed is not None:
+            suite_list.append((test_hid_memory, (self._hid_memory_seed,)))
+        if self._debug_latency_count is not None:
+            suite_list.append((test_debug_latency,
+                               (self._debug_latency_count,)))
+        return suite_list
+
+    def _run_configuration(self, test_configuration):
+        """Load the firmware of a configuration and run its tests
+
+        When HID tests are run in parallel they are left out.
+        """
+        board = test_configuration.board
+        test_info = TestInfo(test_configuration.name)
+        test_configuration.test_info = test_info
+        if self._event_sink is not None:
+            test_info.set_event_sink(self._event_sink)
+        if self._info_budget is not None:
+            test_info.set_info_budget(self._info_budget)
+
+        test_info.info("Board: %s" % test_configuration.board)
+        test_info.info("Application: %s" %
+                       test_configuration.if_firmware)
+        test_info.info("Bootloader: %s" %
+                       test_configuration.bl_firmware)
+        test_info.info("Target: %s" % test_configuration.target)
+
+        # Only aggregate timing for this configuration
+        board.load_timing.reset()
+        board.serial_reset_timing.reset()
+        board.session_pool.reset_stats()
+
+        if self._load_if:
+            if_path = test_configuration.if_firmware.hex_path
+            board.load_interface(if_path, test_info)
+
+        valid_bl = test_configuration.bl_firmware is not None
+        if self._load_bl and valid_bl:
+            bl_path = test_configuration.bl_firmware.hex_path
+            board.load_bootloader(bl_path, test_info)
+
+        board.set_check_fs_on_remount(True)
+
+        if self._test_daplink:
+            daplink_test(test_configuration, test_info)
+
+        if self._test_ep:
+            test_endpoints(test_configuration, test_info,
+                           not self._parallel_hid)
+            if not self._parallel_hid:
+                for function, args in self._get_hid_suite_list():
+                    function(test_configuration, test_info, *args)
+            if self._serial_bench_duration is not None:
+                test_serial_throughput(test_configuration, test_info,
+                                       self._serial_bench_duration,
+                                       standard_baud +
+                                       self._serial_extra_baud_list)
+            if self._serial_matrix:
+                baud_list = baud_matrix + self._serial_extra_baud_list
+                test_serial_baud_matrix(test_configuration, test_info,
+                                        sorted(set(baud_list)))
+            if self._serial_reset_count is not None:
+                test_serial_reset(test_configuration, test_info,
+                                  self._serial_reset_count)
+            if self._serial_latency_count is not None:
+                test_serial_latency(test_configuration, test_info,
+                                    self._serial_latency_count,
+                                    extra_baud_list=
+                                    self._serial_extra_baud_list)
+
+    def _report_configuration(self, test_configuration):
+        """Add the timing collected for a configuration to its results"""
+        board = test_configuration.board
+        test_info = test_configuration.test_info
+        board.session_pool.release()
+        board.load_timing.report(test_info, 'MSD load timing for %s' %
+                                 board.get_unique_id())
+        board.session_pool.report(test_info, 'pyOCD sessions for %s' %
+                                  board.get_unique_id())
+        if board.serial_reset_timing.get_phase_stats():
+            board.serial_reset_timing.report(test_info,
+                                             'Serial reset timing for %s' %
+                                             board.get_unique_id())
 
     def print_results(self, info_level):
         assert self._state is self._STATE.COMPLETE
@@ -563,6 +768,50 @@ def main():
                         default=False, action='store_true')
     parser.add_argument('--verbose', help='Verbose output',
                         choices=VERB_LEVELS, default=VERB_NORMAL)
+    parser.add_argument('--serialbench', type=float, default=None,
+                        help='Benchmark serial throughput for this many '
+                        'seconds at each baud rate')
+    parser.add_argument('--seriallatency', type=int, default=None,
+                        help='Measure serial round-trip latency with this '
+                        'many round trips per payload size and baud rate')
+    parser.add_argument('--serialmatrix', default=False,
+                        action='store_true',
+                        help='Test serial echo at high and non-standard '
+                        'baud rates')
+    parser.add_argument('--serialreset', type=int, default=None,
+                        help='Time this many target resets through a break '
+                        'on the serial port')
+    parser.add_argument('--serialbaud', type=int, default=[],
+                        action='append',
+                        help='Extra baud rate for the serial benchmarks '
+                        'and baud matrix. Can be repeated.')
+    parser.add_argument('--hidbench', default=False, action='store_true',
+                        help='Benchmark target memory transfer speed over '
+                        'HID')
+    parser.add_argument('--swdsweep', default=False, action='store_true',
+                        help='Sweep the SWD clock and turnaround to find '
+                        'the fastest reliable settings')
+    parser.add_argument('--flashbench', default=False, action='store_true',
+                        help='Time flash page erase and program over '
+                        'CMSIS-DAP and compare with drag and drop')
+    parser.add_argument('--hidmemtest', type=int, default=None,
+                        help='Test all target RAM over HID with walking '
+                        'ones, address and random patterns from this seed')
+    parser.add_argument('--debuglatency', type=int, default=None,
+                        help='Time this many halts, resumes, steps and '
+                        'core register reads and writes')
+    parser.add_argument('--parallelhid', default=False, action='store_true',
+                        help='Run the HID tests and benchmarks of all '
+                        'boards at once, one process per board')
+    parser.add_argument('--eventlog', default=None,
+                        help='Stream test events to this file as JSON Lines')
+    parser.add_argument('--junit', default=None,
+                        help='Write results to this file as JUnit XML, '
+                        'requires --eventlog')
+    parser.add_argument('--infobudget', type=int, default=None,
+                        help='Keep at most this many info messages per '
+                        'configuration in memory and write the rest to a '
+                        'temporary file until the results are written')
     parser.add_argument('--dryrun', default=False, action='store_true',
                         help='Print info on configurations but dont '
                         'actually run tests.')
@@ -585,6 +834,11 @@ def main():
             print("  the compile API.")
             exit(-1)
 
+    if args.junit is not None and args.eventlog is None:
+        print("JUnit output is made from the event log, so '--eventlog'")
+        print("must be specified with '--junit'")
+        exit(-1)
+
     firmware_explicitly_specified = len(args.firmware) != 0
     test_info = TestInfo('DAPLink')
     if args.targetdir is not None:
@@ -645,6 +899,19 @@ def main():
     tester.set_test_ep(not args.notestendpt)
     tester.set_load_bl(args.loadbl)
     tester.set_test_daplink(args.testdl)
+    tester.set_serial_benchmark(args.serialbench)
+    tester.set_serial_latency(args.seriallatency)
+    tester.set_serial_matrix(args.serialmatrix)
+    tester.set_serial_reset(args.serialreset)
+    tester.add_serial_baud(args.serialbaud)
+    tester.set_hid_benchmark(args.hidbench)
+    tester.set_swd_sweep(args.swdsweep)
+    tester.set_flash_benchmark(args.flashbench)
+    tester.set_hid_memory_test(args.hidmemtest)
+    tester.set_debug_latency(args.debuglatency)
+    tester.set_parallel_hid(args.parallelhid)
+    tester.set_event_log(args.eventlog)
+    tester.set_info_budget(args.infobudget)
 
     # Build test configurations
     tester.build_test_configurations(test_info)
@@ -686,6 +953,8 @@ def main():
     tester.write_test_results(args.logdir,
                               git_sha=git_sha,
                               local_changes=local_changes)
+    if args.junit is not None:
+        write_junit(read_events(args.eventlog), args.junit)
 
     # Warn about untested boards
     print('')
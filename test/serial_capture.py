@@ -0,0 +1,207 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Timestamped capture of serial traffic in a bounded ring buffer file
+
+Every chunk read from or written to a port is stored with the host time
+in a fixed size memory mapped file, so captures of long soak runs keep
+only the most recent traffic and never grow.  The file is made of
+fixed size slots, which lets the tail be read back, even by another
+process, without parsing from the start.
+
+When a test wrapped with capture_failures fails, the traffic captured
+while it ran is attached to its TestInfo.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import os
+import mmap
+import struct
+import time
+import threading
+import tempfile
+import datetime
+from contextlib import contextmanager
+import serial
+
+DIR_RX = 0
+DIR_TX = 1
+_DIR_TO_NAME = {DIR_RX: "RX", DIR_TX: "TX"}
+
+DEFAULT_CAPTURE_SIZE = 0x100000
+
+# Name used when attaching captured records to a TestInfo
+CAPTURE_ATTACHMENT = "serial capture"
+
+_MAGIC = b"DLSERCAP"
+_HEADER_FMT = "<8sQI"           # Magic, slots written, slot count
+_HEADER_SIZE = 64
+_SLOT_FMT = "<dBB"              # Timestamp, direction, data length
+_SLOT_SIZE = 64
+_SLOT_HEADER_SIZE = struct.calcsize(_SLOT_FMT)
+_SLOT_DATA_SIZE = _SLOT_SIZE - _SLOT_HEADER_SIZE
+
+# Most records attached to a failing test
+_MAX_ATTACHED_RECORDS = 256
+
+# Ring buffer for each port, kept for the life of the process
+_port_to_ring = {}
+
+
+class CaptureRing(object):
+    """Fixed size ring of timestamped serial data backed by a file
+
+    Positional arguments:
+        path - file to hold the capture, overwritten if it exists
+
+    Keyword arguments:
+        size - size of the file in bytes
+    """
+
+    def __init__(self, path, size=DEFAULT_CAPTURE_SIZE):
+        assert size >= _HEADER_SIZE + _SLOT_SIZE
+        self._path = path
+        self._slot_count = (size - _HEADER_SIZE) // _SLOT_SIZE
+        self._count = 0
+        self._lock = threading.Lock()
+        length = _HEADER_SIZE + self._slot_count * _SLOT_SIZE
+        self._file = open(path, "w+b")
+        self._file.truncate(length)
+        self._mmap = mmap.mmap(self._file.fileno(), length)
+        self._write_header()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def count(self):
+        """Number of records written since the ring was created"""
+        return self._count
+
+    def record(self, direction, data, now):
+        """Add data sent or received at time now"""
+        assert direction in _DIR_TO_NAME
+        data = bytes(data)
+        with self._lock:
+            for offset in range(0, len(data), _SLOT_DATA_SIZE):
+                piece = data[offset:offset + _SLOT_DATA_SIZE]
+                pos = self._get_slot_pos(self._count)
+                slot = struct.pack(_SLOT_FMT, now, direction,
+                                   len(piece)) + piece
+                self._mmap[pos:pos + len(slot)] = slot
+                self._count += 1
+            self._write_header()
+
+    def get_records(self, start=0):
+        """Return (index, time, direction, data) for records from start
+
+        Records that have already been overwritten are skipped.
+        """
+        record_list = []
+        with self._lock:
+            first = max(start, self._count - self._slot_count, 0)
+            for index in range(first, self._count):
+                pos = self._get_slot_pos(index)
+                now, direction, length = struct.unpack(
+                    _SLOT_FMT, self._mmap[pos:pos + _SLOT_HEADER_SIZE])
+                data = bytearray(self._mmap[pos + _SLOT_HEADER_SIZE:
+                                            pos + _SLOT_HEADER_SIZE + length])
+                record_list.append((index, now, direction, data))
+        return record_list
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def _get_slot_pos(self, index):
+        return _HEADER_SIZE + (index % self._slot_count) * _SLOT_SIZE
+
+    def _write_header(self):
+        self._mmap[0:struct.calcsize(_HEADER_FMT)] = \
+            struct.pack(_HEADER_FMT, _MAGIC, self._count, self._slot_count)
+
+
+def format_record(record):
+    """Return a record from CaptureRing.get_records as a line of text"""
+    _, now, direction, data = record
+    time_str = datetime.datetime.fromtimestamp(now).strftime("%H:%M:%S.%f")
+    return "%s %s %s" % (time_str, _DIR_TO_NAME[direction],
+                         " ".join("%02x" % value for value in data))
+
+
+def get_capture_ring(port, directory=None, size=DEFAULT_CAPTURE_SIZE):
+    """Return the capture ring for port, creating it on first use
+
+    The file is created in directory, or in the temporary directory if
+    directory is None.
+    """
+    if port not in _port_to_ring:
+        if directory is None:
+            directory = tempfile.gettempdir()
+        name = "serial_capture_%s.bin" % os.path.basename(port)
+        _port_to_ring[port] = CaptureRing(os.path.join(directory, name), size)
+    return _port_to_ring[port]
+
+
+class CapturingSerial(serial.Serial):
+    """serial.Serial that records all traffic to a CaptureRing
+
+    Takes the same arguments as serial.Serial plus the keyword argument
+    capture, the CaptureRing to record to.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.capture = kwargs.pop("capture")
+        super(CapturingSerial, self).__init__(*args, **kwargs)
+
+    def read(self, size=1):
+        data = super(CapturingSerial, self).read(size)
+        if data:
+            self.capture.record(DIR_RX, data, time.time())
+        return data
+
+    def write(self, data):
+        self.capture.record(DIR_TX, data, time.time())
+        return super(CapturingSerial, self).write(data)
+
+
+@contextmanager
+def capture_failures(ring, test_info):
+    """Attach traffic captured during the block to test_info on failure"""
+    start = ring.count
+    try:
+        yield
+    except Exception:
+        attach_capture(ring, start, test_info)
+        raise
+    if test_info.get_failed():
+        attach_capture(ring, start, test_info)
+
+
+def attach_capture(ring, start, test_info):
+    """Attach the records from start onwards to test_info"""
+    record_list = ring.get_records(start)
+    if len(record_list) > _MAX_ATTACHED_RECORDS:
+        record_list = record_list[-_MAX_ATTACHED_RECORDS:]
+    test_info.attach(CAPTURE_ATTACHMENT,
+                     [format_record(record) for record in record_list])
+    test_info.info("Attached last %i serial records, full capture in %s" %
+                   (len(record_list), ring.path))
@@ -0,0 +1,390 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Loopback emulator for the daplink-validation serial protocol
+
+The emulator listens on the master side of a Linux pseudo-terminal and
+behaves like a target running daplink-validation behind a DAPLink CDC
+port.  After a reset it sends "{init}", echoes a "{baud:N}" command,
+waits for the host to change baud, sends "{change}" and echoes all
+other data.  The line rate, receive buffer size, flow control and
+dropped bytes can be configured so the serial tests can be developed and benchmarked
+without a board.
+
+A pseudo-terminal cannot carry a break, so the host side resets the
+emulated target with EmulatorBoard.send_serial_break.
+
+Run this file to execute test_serial against the emulator.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import os
+import re
+import sys
+import time
+import tty
+import errno
+import argparse
+import select
+import random
+import termios
+import threading
+from timing import TimingStats
+
+INIT_RESPONSE = b"{init}"
+CHANGE_RESPONSE = b"{change}"
+BAUD_COMMAND_RE = re.compile(b"{baud:([0-9]+)}")
+
+# Baud the emulated target starts at after a reset
+DEFAULT_BAUD = 115200
+
+# Bits sent on the wire for each byte - start, 8 data and stop bit
+BITS_PER_BYTE = 10
+
+# Longest time output may fall behind the line rate and still catch up
+_MAX_TX_LAG = 0.01
+
+_SPEED_TO_BAUD = dict((getattr(termios, name), int(name[1:])) for name in
+                      dir(termios) if re.match("^B[0-9]+$", name))
+
+
+class SerialEmulator(object):
+    """Emulated daplink-validation target on a pseudo-terminal
+
+    Keyword arguments:
+        byte_delay - seconds per byte sent back to the host, or None to
+            pace output at the line rate of the current baud
+        buffer_size - bytes the target can buffer
+        flow_control - stop accepting data while the buffer is full,
+            like DAPLink holding off the USB endpoint, rather than
+            dropping it
+        drop_rate - probability that each received byte is dropped
+        drop_offsets - offsets of received bytes to drop after each
+            reset
+        reset_delay - seconds between a break and "{init}"
+        seed - seed for the random drops
+    """
+
+    def __init__(self, byte_delay=None, buffer_size=4096, flow_control=True,
+                 drop_rate=0.0, drop_offsets=(), reset_delay=0.01, seed=0):
+        assert buffer_size > 0
+        assert 0.0 <= drop_rate <= 1.0
+        self._byte_delay = byte_delay
+        self._buffer_size = buffer_size
+        self._flow_control = flow_control
+        self._drop_rate = drop_rate
+        self._drop_offsets = set(drop_offsets)
+        self._reset_delay = reset_delay
+        self._random = random.Random(seed)
+
+        self._master_fd = None
+        self._slave_fd = None
+        self._port = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._break = threading.Event()
+
+        # State of the emulated target
+        self._baud = DEFAULT_BAUD
+        self._rx_offset = 0
+        self._tx_buf = bytearray()
+        self._cmd_buf = bytearray()
+        self._pending_baud = None
+        self._pending_baud_deadline = None
+        self._next_tx_time = 0
+
+        # Statistics
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self.overflows = 0
+
+    @property
+    def port(self):
+        """Path of the serial port for the host to open"""
+        return self._port
+
+    def start(self):
+        assert self._thread is None
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+        self._port = os.ttyname(self._slave_fd)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        os.close(self._master_fd)
+        os.close(self._slave_fd)
+        self._master_fd = None
+        self._slave_fd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, value, traceback):
+        self.stop()
+
+    def send_break(self):
+        """Reset the emulated target as a break on the CDC port would"""
+        self._break.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._break.is_set():
+                self._break.clear()
+                self._reset()
+            if self._pending_baud is not None:
+                self._check_baud_change()
+
+            write_fds = []
+            timeout = 0.01
+            if self._tx_buf:
+                delay = self._next_tx_time - time.time()
+                if delay <= 0:
+                    write_fds = [self._master_fd]
+                else:
+                    timeout = min(timeout, delay)
+            read_fds = [self._master_fd]
+            if self._flow_control and len(self._tx_buf) >= self._buffer_size:
+                read_fds = []
+            readable, writable, _ = select.select(read_fds, write_fds, [],
+                                                  timeout)
+            if readable:
+                self._receive()
+            if writable:
+                self._transmit()
+
+    def _reset(self):
+        self._baud = DEFAULT_BAUD
+        self._rx_offset = 0
+        self._tx_buf = bytearray()
+        self._cmd_buf = bytearray()
+        self._pending_baud = None
+        # Discard anything the host sent while the target was resetting
+        termios.tcflush(self._master_fd, termios.TCIFLUSH)
+        time.sleep(self._reset_delay)
+        self._next_tx_time = time.time()
+        self._tx_buf.extend(INIT_RESPONSE)
+
+    def _receive(self):
+        try:
+            size = 4096
+            if self._flow_control:
+                size = self._buffer_size - len(self._tx_buf)
+            data = bytearray(os.read(self._master_fd, size))
+        except OSError as exception:
+            if exception.errno == errno.EIO:
+                # Host side is closed
+                time.sleep(0.01)
+                return
+            raise
+        for value in data:
+            offset = self._rx_offset
+            self._rx_offset += 1
+            self.bytes_received += 1
+            if offset in self._drop_offsets or \
+                    self._random.random() < self._drop_rate:
+                self.bytes_dropped += 1
+                continue
+            if len(self._tx_buf) >= self._buffer_size:
+                self.bytes_dropped += 1
+                self.overflows += 1
+                continue
+            if not self._tx_buf:
+                self._next_tx_time = max(self._next_tx_time, time.time())
+            self._tx_buf.append(value)
+            self._parse_command(value)
+
+    def _parse_command(self, value):
+        if value == ord(b"{"):
+            self._cmd_buf = bytearray()
+        self._cmd_buf.append(value)
+        if value != ord(b"}"):
+            del self._cmd_buf[:-16]
+            return
+        match = BAUD_COMMAND_RE.match(bytes(self._cmd_buf))
+        self._cmd_buf = bytearray()
+        if match is not None:
+            # Switch once the echo has been sent and the host has
+            # changed its baud
+            self._pending_baud = int(match.group(1))
+            self._pending_baud_deadline = None
+
+    def _check_baud_change(self):
+        if self._tx_buf:
+            return
+        now = time.time()
+        if self._pending_baud_deadline is None:
+            self._pending_baud_deadline = now + 1.0
+        host_baud = self._get_host_baud()
+        if host_baud != self._pending_baud and \
+                host_baud is not None and now < self._pending_baud_deadline:
+            return
+        self._baud = self._pending_baud
+        self._pending_baud = None
+        self._next_tx_time = now
+        self._tx_buf.extend(CHANGE_RESPONSE)
+
+    def _get_host_baud(self):
+        """Return the baud the host has set the port to or None"""
+        speed = termios.tcgetattr(self._slave_fd)[5]
+        return _SPEED_TO_BAUD.get(speed)
+
+    def _get_byte_delay(self):
+        if self._byte_delay is not None:
+            return self._byte_delay
+        return BITS_PER_BYTE / self._baud
+
+    def _transmit(self):
+        byte_delay = self._get_byte_delay()
+        now = time.time()
+        if byte_delay > 0:
+            # Send everything that would have gone out on the wire by now
+            count = int((now - self._next_tx_time) / byte_delay) + 1
+        else:
+            count = len(self._tx_buf)
+        count = min(count, len(self._tx_buf))
+        written = os.write(self._master_fd, bytes(self._tx_buf[0:count]))
+        del self._tx_buf[0:written]
+        self.bytes_sent += written
+        # Catch up after the thread runs late, but never send more than
+        # a short burst faster than the line rate
+        self._next_tx_time = max(self._next_tx_time, now - _MAX_TX_LAG) + \
+            written * byte_delay
+
+
+class EmulatorBoard(object):
+    """Minimal board exposing an emulator's serial port to the tests"""
+
+    def __init__(self, emulator):
+        self._emulator = emulator
+        self.serial_reset_timing = TimingStats()
+
+    @property
+    def name(self):
+        return "Serial emulator"
+
+    @property
+    def hic_id(self):
+        return 0
+
+    def get_serial_port(self):
+        return self._emulator.port
+
+    def send_serial_break(self, sp):
+        """Reset the target the way a break would"""
+        sp.flushInput()
+        self._emulator.send_break()
+
+
+class EmulatorWorkspace(object):
+    """Test configuration containing only an emulator board"""
+
+    def __init__(self, emulator):
+        self.board = EmulatorBoard(emulator)
+        self.target = None
+        self.if_firmware = None
+        self.bl_firmware = None
+
+
+def main():
+    from serial_test import (test_serial, test_serial_throughput,
+                             test_serial_soak, test_serial_latency,
+                             test_serial_baud_matrix, test_serial_reset)
+    from test_info import TestInfo
+
+    parser = argparse.ArgumentParser(description='Run the serial tests '
+                                     'against an emulated target')
+    parser.add_argument('--throughput', type=float, default=None,
+                        help='Also benchmark throughput for this many '
+                        'seconds at each baud rate')
+    parser.add_argument('--matrix', default=False, action='store_true',
+                        help='Also test the extended baud matrix')
+    parser.add_argument('--reset', type=int, default=None,
+                        help='Also time this many target resets')
+    parser.add_argument('--latency', type=int, default=None,
+                        help='Also measure this many round trips per '
+                        'payload size and baud rate')
+    parser.add_argument('--soak', type=int, default=None,
+                        help='Also echo this many bytes through every '
+                        'emulated port at once')
+    parser.add_argument('--ports', type=int, default=1,
+                        help='Number of emulated targets')
+    parser.add_argument('--droprate', type=float, default=0.0,
+                        help='Probability of the target dropping a byte')
+    parser.add_argument('--buffersize', type=int, default=4096,
+                        help='Size of the target receive buffer')
+    parser.add_argument('--noflowcontrol', default=False,
+                        action='store_true',
+                        help='Drop data when the target buffer is full')
+    args = parser.parse_args()
+
+    if not sys.platform.startswith("linux"):
+        print("Error - the serial emulator requires Linux")
+        exit(-1)
+    test_info = TestInfo('Serial emulator')
+    emulator_list = []
+    try:
+        for _ in range(args.ports):
+            emulator = SerialEmulator(buffer_size=args.buffersize,
+                                      flow_control=not args.noflowcontrol,
+                                      drop_rate=args.droprate)
+            emulator.start()
+            emulator_list.append(emulator)
+        workspace = EmulatorWorkspace(emulator_list[0])
+        test_serial(workspace, test_info)
+        if args.throughput is not None:
+            test_serial_throughput(workspace, test_info, args.throughput)
+        if args.matrix:
+            test_serial_baud_matrix(workspace, test_info)
+        if args.reset is not None:
+            test_serial_reset(workspace, test_info, args.reset)
+        if args.latency is not None:
+            test_serial_latency(workspace, test_info, args.latency)
+        if args.soak is not None:
+            test_serial_soak([EmulatorBoard(port_emulator)
+                              for port_emulator in emulator_list],
+                             test_info, size=args.soak)
+        workspace.board.serial_reset_timing.report(test_info,
+                                                   'Serial reset timing')
+    finally:
+        for emulator in emulator_list:
+            emulator.stop()
+    for emulator in emulator_list:
+        test_info.info("Emulator on %s received %i bytes, sent %i, "
+                       "dropped %i" % (emulator.port, emulator.bytes_received,
+                                       emulator.bytes_sent,
+                                       emulator.bytes_dropped))
+    print('')
+    test_info.print_msg(TestInfo.INFO, None)
+    exit(-1 if test_info.get_failed() else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Single threaded full-duplex serial transfers on many ports
+
+SerialEngine drives any number of open serial ports from one select()
+loop.  Each port sends its data while reading the echo at the same time.
+Only a window of data is in flight at once, so a slow port holds off
+its own writes without blocking the others.  Incoming data is checked
+by a StreamVerifier as it arrives, so a port stops as soon as its echo
+goes wrong.
+
+select() only works on serial ports on POSIX systems.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import os
+import errno
+import select
+import time
+from serial_capture import DIR_RX, DIR_TX
+
+
+def _get_data(data, offset, size):
+    """Return size bytes at offset from a bytearray or an image source"""
+    if type(data) is bytearray:
+        return data[offset:offset + size]
+    return data.read(offset, size)
+
+
+def _to_hex(data):
+    return " ".join("%02x" % value for value in bytearray(data))
+
+
+class StreamVerifier(object):
+    """Compare data against the expected data as it arrives
+
+    Data must arrive in order, so the first byte that differs is known
+    as soon as it is received.  The arrival time of each chunk is kept
+    to show where the data stalled.
+
+    Positional arguments:
+        expected - bytearray or image source of the data expected
+
+    Keyword arguments:
+        context - bytes to keep either side of the first difference
+    """
+
+    def __init__(self, expected, context=16):
+        self._expected = expected
+        self._size = len(expected)
+        self._context = context
+        self._tail = bytearray()
+        self.bytes_received = 0
+        self.mismatch_offset = None
+        self.expected_context = None
+        self.received_context = None
+        self.arrival_list = []      # (time, offset, size) of each chunk
+
+    @property
+    def remaining(self):
+        return max(self._size - self.bytes_received, 0)
+
+    @property
+    def done(self):
+        return (self.mismatch_offset is not None or
+                self.bytes_received >= self._size)
+
+    @property
+    def passed(self):
+        return (self.mismatch_offset is None and
+                self.bytes_received == self._size)
+
+    def add(self, data, now=None):
+        """Check the next chunk of data received"""
+        if now is None:
+            now = time.time()
+        data = bytearray(data)
+        offset = self.bytes_received
+        self.arrival_list.append((now, offset, len(data)))
+        self.bytes_received += len(data)
+        if self.mismatch_offset is not None:
+            return
+        expected = _get_data(self._expected, offset, len(data))
+        if data == expected:
+            self._tail = (self._tail + data)[-self._context:]
+            return
+        for i in range(min(len(data), len(expected))):
+            if data[i] != expected[i]:
+                break
+        else:
+            i = min(len(data), len(expected))
+        self.mismatch_offset = offset + i
+        start = max(self.mismatch_offset - self._context, 0)
+        # The tail holds the matching bytes received before this chunk
+        received = self._tail + data[0:i + self._context]
+        self.received_context = received[len(self._tail) + i -
+                                         (self.mismatch_offset - start):]
+        self.expected_context = _get_data(self._expected, start,
+                                          self.mismatch_offset - start +
+                                          self._context)
+
+    def get_longest_gap(self):
+        """Return (seconds, offset) of the longest wait for data
+
+        The wait is measured from the previous chunk, or from the first
+        chunk if only one arrived.  None is returned if nothing arrived.
+        """
+        if not self.arrival_list:
+            return None
+        longest = (0.0, 0)
+        prev_time = self.arrival_list[0][0]
+        for arrival_time, offset, _ in self.arrival_list:
+            if arrival_time - prev_time > longest[0]:
+                longest = (arrival_time - prev_time, offset)
+            prev_time = arrival_time
+        return longest
+
+    def report(self, test_info):
+        """Add details of any difference and of stalls to test_info"""
+        if self.mismatch_offset is not None:
+            start = max(self.mismatch_offset - self._context, 0)
+            test_info.failure("Data differs at offset 0x%x" %
+                              self.mismatch_offset)
+            test_info.info("    Expected from 0x%x: %s" %
+                           (start, _to_hex(self.expected_context)))
+            test_info.info("    Received from 0x%x: %s" %
+                           (start, _to_hex(self.received_context)))
+        elif self.bytes_received < self._size:
+            test_info.failure("Received %i of %i bytes" %
+                              (self.bytes_received, self._size))
+        elif self.bytes_received > self._size:
+            test_info.failure("Received %i bytes but expected %i" %
+                              (self.bytes_received, self._size))
+        gap = self.get_longest_gap()
+        if gap is not None:
+            test_info.info("%i chunks, longest gap %.3fs before offset 0x%x" %
+                           (len(self.arrival_list), gap[0], gap[1]))
+
+
+class SerialStream(object):
+    """Echo transfer of data through one open serial port
+
+    Positional arguments:
+        sp - open serial.Serial instance
+        data - bytearray or image source, such as a SyntheticImage, to
+            send and expect back
+
+    Keyword arguments:
+        window - most bytes sent but not yet echoed back
+        chunk_size - most bytes written at once
+    """
+
+    def __init__(self, sp, data, window=1024, chunk_size=256):
+        assert window > 0 and chunk_size > 0
+        self._sp = sp
+        self._data = data
+        self._size = len(data)
+        self._window = window
+        self._chunk_size = chunk_size
+        self._verifier = StreamVerifier(data)
+        # Ports opened with serial_capture record their traffic
+        self._capture = getattr(sp, "capture", None)
+        self.bytes_written = 0
+        self.timed_out = False
+        self.start_time = None
+        self.end_time = None
+        self.last_rx_time = None
+
+    def fileno(self):
+        return self._sp.fileno()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def verifier(self):
+        return self._verifier
+
+    @property
+    def bytes_read(self):
+        return self._verifier.bytes_received
+
+    @property
+    def done(self):
+        return self._verifier.done or self.timed_out
+
+    @property
+    def passed(self):
+        return self._verifier.passed and not self.timed_out
+
+    def want_write(self):
+        """Return True if there is data to send and room in the window"""
+        return (not self.done and self.bytes_written < self._size and
+                self.bytes_written - self.bytes_read < self._window)
+
+    def handle_write(self):
+        size = min(self._chunk_size, self._size - self.bytes_written,
+                   self._window - (self.bytes_written - self.bytes_read))
+        chunk = _get_data(self._data, self.bytes_written, size)
+        try:
+            written = os.write(self.fileno(), bytes(chunk))
+        except OSError as exception:
+            if exception.errno != errno.EAGAIN:
+                raise
+            return
+        if self._capture is not None:
+            self._capture.record(DIR_TX, chunk[0:written], time.time())
+        self.bytes_written += written
+
+    def handle_read(self, now):
+        try:
+            data = os.read(self.fileno(), 4096)
+        except OSError as exception:
+            if exception.errno == errno.EAGAIN:
+                return
+            raise
+        if not data:
+            return
+        self.last_rx_time = now
+        if self._capture is not None:
+            self._capture.record(DIR_RX, data, now)
+        self._verifier.add(data, now)
+
+    def report(self, test_info):
+        """Add the result of the transfer to test_info"""
+        if self.passed:
+            elapsed = self.end_time - self.start_time
+            test_info.info("Echoed %i bytes in %.2fs (%i bytes/s)" %
+                           (self._size, elapsed,
+                            self._size / max(elapsed, 1e-6)))
+        self._verifier.report(test_info)
+
+
+class SerialEngine(object):
+    """Run SerialStreams on many ports at once from a single thread"""
+
+    def __init__(self):
+        if os.name != 'posix':
+            raise Exception("SerialEngine requires a POSIX system")
+        self._stream_list = []
+
+    def add_stream(self, stream):
+        self._stream_list.append(stream)
+
+    def run(self, idle_timeout=1.0):
+        """Run until every stream is done
+
+        A stream that receives nothing for idle_timeout seconds is
+        stopped and marked as timed out.
+        """
+        now = time.time()
+        active = {}
+        for stream in self._stream_list:
+            stream.start_time = now
+            stream.last_rx_time = now
+            active[stream.fileno()] = stream
+
+        while active:
+            write_fds = [fd for fd, stream in active.items()
+                         if stream.want_write()]
+            readable, writable, _ = select.select(list(active), write_fds,
+                                                  [], 0.05)
+            now = time.time()
+            for fd in writable:
+                active[fd].handle_write()
+            for fd in readable:
+                active[fd].handle_read(now)
+            for fd, stream in list(active.items()):
+                if not stream.done and \
+                        now - stream.last_rx_time > idle_timeout:
+                    stream.timed_out = True
+                if stream.done:
+                    stream.end_time = now
+                    del active[fd]
@@ -19,7 +19,15 @@
 from __future__ import absolute_import
 from __future__ import division
 from threading import Thread
-import serial
+import struct
+import time
+import info
+from serial_engine import SerialEngine, SerialStream, StreamVerifier
+from synthetic_image import SyntheticImage
+from serial_capture import (CapturingSerial, get_capture_ring,
+                            capture_failures, attach_capture)
+from timing import (Timeline, TimingStats, percentile, PHASE_SERIAL_BREAK,
+                    PHASE_FIRST_BYTE, PHASE_INIT_MSG)
 
 
 def _same(d1, d2):
@@ -45,6 +53,30 @@ standard_baud = [
     115200,
     ]
 
+# Rates above 115200, including ones commonly used for logging
+high_baud = [
+    230400,
+    460800,
+    500000,
+    576000,
+    921600,
+    1000000,
+    ]
+
+# Non-standard rates used by common devices and protocols
+odd_baud = [
+    31250,
+    74880,
+    128000,
+    153600,
+    250000,
+    ]
+
+baud_matrix = sorted(set(standard_baud + high_baud + odd_baud))
+
+# Size of the pieces echo test data is written in
+_WRITE_CHUNK_SIZE = 256
+
 
 def calc_timeout(data, baud):
     """Calculate a timeout given the data and baudrate
@@ -60,6 +92,119 @@ def calc_timeout(data, baud):
     return 12 * len(data) / float(baud) + 0.2
 
 
+def _reset_target(board, sp, test_info):
+    """Reset the target with a break and wait for it to initialize
+
+    The time taken by each phase of the reset is added to the board's
+    serial_reset_timing.
+
+    Return:
+        Timeline of the reset if the target responded, None otherwise
+    """
+    expected_resp = "{init}"
+    timeline = Timeline()
+    with timeline.phase(PHASE_SERIAL_BREAK):
+        board.send_serial_break(sp)
+    with timeline.phase(PHASE_FIRST_BYTE):
+        resp = sp.read(1)
+    if resp:
+        with timeline.phase(PHASE_INIT_MSG):
+            resp += sp.read(len(expected_resp) - 1)
+    if not _same(resp, expected_resp):
+        test_info.failure("Fail on init: %s" % resp)
+        return None
+    board.serial_reset_timing.add_timeline(timeline)
+    return timeline
+
+
+def _change_baud(board, sp, baud, test_info, reset=True):
+    """Switch the target and the port to the given baud
+
+    Unless reset is False the target is reset first, which puts it back
+    to 115200.  Without a reset the command is sent at the current baud.
+
+    Return:
+        True if the target confirmed the change, False otherwise
+    """
+    sp.timeout = 1.0
+    if reset:
+        # Set baud to 115200
+        sp.baudrate = 115200
+
+        # Reset the target and wait until it is initialized
+        if _reset_target(board, sp, test_info) is None:
+            return False
+
+    # Change baudrate to that of the test
+    command = "{baud:%i}" % baud
+    sp.write(command)
+    resp = sp.read(len(command))
+    if not _same(resp, command):
+        test_info.failure("Fail on baud command: %s" % resp)
+        return False
+    sp.baudrate = baud
+
+    # Read the response indicating that the baudrate
+    # on the target has changed
+    expected_resp = "{change}"
+    resp = sp.read(len(expected_resp))
+    if not _same(resp, expected_resp):
+        test_info.failure("Fail on baud change %s" % resp)
+        return False
+    return True
+
+
+def _open_port(port, **kwargs):
+    """Open port with all traffic recorded to the port's capture ring"""
+    return CapturingSerial(port, capture=get_capture_ring(port), **kwargs)
+
+
+def _drain(sp, max_time=1.0):
+    """Discard data until the port goes quiet"""
+    sp.timeout = 0.1
+    end_time = time.time() + max_time
+    while sp.read(4096) and time.time() < end_time:
+        pass
+
+
+def _echo_test(sp, data, timeout, test_info, name):
+    """Send data and check the echo as it arrives
+
+    Writing stops as soon as the echo differs from the data sent, so
+    a lost byte does not cost the whole timeout.  The arrival time of
+    each chunk is attached to test_info.
+
+    Return:
+        True if all data was echoed correctly, False otherwise
+    """
+    data = bytearray(data)
+    verifier = StreamVerifier(data)
+    state = {"stop": False}
+
+    def write_data():
+        for offset in range(0, len(data), _WRITE_CHUNK_SIZE):
+            if state["stop"]:
+                break
+            sp.write(bytes(data[offset:offset + _WRITE_CHUNK_SIZE]))
+
+    sp.timeout = 0.05
+    end_time = time.time() + timeout
+    write_thread = Thread(target=write_data)
+    write_thread.start()
+    while not verifier.done and time.time() < end_time:
+        resp = sp.read(max(1, min(sp.inWaiting(), verifier.remaining)))
+        if resp:
+            verifier.add(resp)
+    state["stop"] = True
+    write_thread.join()
+    if not verifier.passed:
+        # Discard the rest of the echo before the next test
+        _drain(sp)
+        verifier.report(test_info)
+    test_info.attach("serial arrivals %s" % name, verifier.arrival_list)
+    return verifier.passed
+
+
 def test_serial(workspace, parent_test):
     """Test the serial port endpoint
 
@@ -87,22 +232,13 @@ def test_serial(workspace, parent_test):
     test_data = str(bytearray(test_data))
     baud = 115200
     timeout = calc_timeout(test_data, baud)
-    with serial.Serial(port, baudrate=baud, timeout=timeout) as sp:
-
-        # Reset the target
-        sp.sendBreak()
+    with _open_port(port, baudrate=baud, timeout=timeout) as sp, \
+            capture_failures(sp.capture, test_info):
 
-        # Wait until the target is initialized
-        expected_resp = "{init}"
-        resp = sp.read(len(expected_resp))
-        if not _same(resp, expected_resp):
-            test_info.failure("Fail on init: %s" % resp)
+        # Reset the target and wait until it is initialized
+        _reset_target(workspace.board, sp, test_info)
 
-        write_thread = Thread(target=sp.write, args=(test_data,))
-        write_thread.start()
-        resp = sp.read(len(test_data))
-        write_thread.join()
-        if _same(resp, test_data):
+        if _echo_test(sp, test_data, timeout, test_info, "block"):
             test_info.info("Block test passed")
         else:
             test_info.failure("Block test failed")
@@ -112,49 +248,516 @@ def test_serial(workspace, parent_test):
         test_data = [i for i in range(0, 256)] * 4 * 4
         test_data = str(bytearray(test_data))
         for baud in standard_baud:
-            # Set baud to 115200
-            sp.baudrate = 115200
-            sp.timeout = 1.0
-
-            # Reset the target
-            sp.sendBreak()
-
-            # Wait until the target is initialized
-            expected_resp = "{init}"
-            resp = sp.read(len(expected_resp))
-            if not _same(resp, expected_resp):
-                test_info.failure("Fail on init: %s" % resp)
-                continue
-
-            # Change baudrate to that of the first test
-            command = "{baud:%i}" % baud
-            sp.write(command)
-            resp = sp.read(len(command))
-            if not _same(resp, command):
-                test_info.failure("Fail on baud command: %s" % resp)
-                continue
-
-            # Update baud for test
             test_info.info("Testing baud %i" % baud)
-            test_time = calc_timeout(test_data, baud)
-            sp.baudrate = baud
-            sp.timeout = test_time
-
-            # Read the response indicating that the baudrate
-            # on the target has changed
-            expected_resp = "{change}"
-            resp = sp.read(len(expected_resp))
-            if not _same(resp, expected_resp):
-                test_info.failure("Fail on baud change %s" % resp)
+            if not _change_baud(workspace.board, sp, baud, test_info):
                 continue
 
             # Perform test
-            write_thread = Thread(target=sp.write, args=(test_data,))
-            write_thread.start()
-            resp = sp.read(len(test_data))
-            write_thread.join()
-            resp = bytearray(resp)
-            if _same(test_data, resp):
+            if _echo_test(sp, test_data, calc_timeout(test_data, baud),
+                          test_info, "%i baud" % baud):
                 test_info.info("Pass")
             else:
                 test_info.failure("Fail on baud %s" % baud)
+
+
+# Bits sent on the wire for each byte - start, 8 data and stop bit
+BITS_PER_BYTE = 10
+
+# Frames used by the throughput benchmark are a magic value, a 32 bit
+# sequence number, a payload derived from the sequence number and a
+# checksum, so lost and repeated data can be located in the echo.
+FRAME_SIZE = 16
+_FRAME_MAGIC = b'\xA5\x5A'
+_FRAME_HEADER_SIZE = len(_FRAME_MAGIC) + 4
+
+# Largest burst written by the throughput benchmark
+MAX_BURST_SIZE = 0x10000
+
+# Number of lost or repeated regions listed in the results
+_MAX_REPORTED_ERRORS = 10
+
+
+def make_frame(seq):
+    """Return throughput benchmark frame number seq as a bytearray"""
+    frame = bytearray(_FRAME_MAGIC + struct.pack(">I", seq & 0xFFFFFFFF))
+    frame.extend((seq + i) & 0xFF for i in
+                 range(FRAME_SIZE - _FRAME_HEADER_SIZE - 1))
+    frame.append(sum(frame) & 0xFF)
+    return frame
+
+
+def make_frames(first_seq, count):
+    """Return count consecutive frames starting at first_seq"""
+    data = bytearray()
+    for seq in range(first_seq, first_seq + count):
+        data.extend(make_frame(seq))
+    return data
+
+
+class FrameAnalyzer(object):
+    """Check a stream of echoed frames for lost and repeated data
+
+    Data is tracked per frame, so any lost, repeated or corrupted byte
+    is reported as the frame containing it.  Offsets are positions in
+    the data that was sent.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._next_seq = 0
+        self.frames_received = 0
+        self.lost_list = []         # (offset, size) of lost data
+        self.repeated_list = []     # offset of each repeated frame
+        self.invalid_bytes = 0
+
+    @property
+    def bytes_received(self):
+        """Number of bytes received in valid frames"""
+        return self.frames_received * FRAME_SIZE
+
+    @property
+    def bytes_lost(self):
+        return sum(size for _, size in self.lost_list)
+
+    def add(self, data):
+        """Process data read from the port"""
+        buf = self._buf
+        buf.extend(data)
+        pos = 0
+        while len(buf) - pos >= FRAME_SIZE:
+            seq = self._parse_frame(buf, pos)
+            if seq is None:
+                # Resynchronize on the next magic value
+                next_pos = buf.find(_FRAME_MAGIC, pos + 1)
+                if next_pos < 0:
+                    next_pos = len(buf) - len(_FRAME_MAGIC) + 1
+                self.invalid_bytes += next_pos - pos
+                pos = next_pos
+                continue
+            pos += FRAME_SIZE
+            if seq < self._next_seq:
+                self.repeated_list.append(seq * FRAME_SIZE)
+                continue
+            if seq > self._next_seq:
+                self.lost_list.append((self._next_seq * FRAME_SIZE,
+                                       (seq - self._next_seq) * FRAME_SIZE))
+            self._next_seq = seq + 1
+            self.frames_received += 1
+        del buf[0:pos]
+
+    def finish(self, frames_sent):
+        """Account for frames that never arrived"""
+        if self._next_seq < frames_sent:
+            self.lost_list.append((self._next_seq * FRAME_SIZE,
+                                   (frames_sent - self._next_seq) *
+                                   FRAME_SIZE))
+            self._next_seq = frames_sent
+        self.invalid_bytes += len(self._buf)
+        self._buf = bytearray()
+
+    @staticmethod
+    def _parse_frame(buf, pos):
+        """Return the sequence number of the frame at pos or None"""
+        if buf[pos:pos + len(_FRAME_MAGIC)] != _FRAME_MAGIC:
+            return None
+        seq = struct.unpack(">I", bytes(buf[pos + len(_FRAME_MAGIC):
+                                            pos + _FRAME_HEADER_SIZE]))[0]
+        if buf[pos:pos + FRAME_SIZE] != make_frame(seq):
+            return None
+        return seq
+
+    def report(self, test_info):
+        """Add failures for lost and repeated data to test_info"""
+        if self.lost_list:
+            test_info.failure("%i bytes lost or corrupted in %i places" %
+                              (self.bytes_lost, len(self.lost_list)))
+            for offset, size in self.lost_list[0:_MAX_REPORTED_ERRORS]:
+                test_info.info("    Lost 0x%x bytes at offset 0x%x" %
+                               (size, offset))
+        if self.repeated_list:
+            test_info.failure("%i frames received more than once" %
+                              len(self.repeated_list))
+            for offset in self.repeated_list[0:_MAX_REPORTED_ERRORS]:
+                test_info.info("    Repeated frame at offset 0x%x" % offset)
+
+
+def _read_frames(sp, analyzer, done_func, idle_timeout):
+    """Read into analyzer until done_func returns True and data stops
+
+    Return:
+        Time the last byte was received or None if nothing arrived
+    """
+    last_rx_time = None
+    idle_start = time.time()
+    sp.timeout = 0.05
+    while True:
+        data = sp.read(max(1, sp.inWaiting()))
+        now = time.time()
+        if data:
+            analyzer.add(bytearray(data))
+            last_rx_time = now
+            idle_start = now
+        elif done_func() and now - idle_start > idle_timeout:
+            return last_rx_time
+
+
+def _measure_sustained(sp, baud, duration, load, test_info):
+    """Stream frames at a fraction of line rate and measure the echo"""
+    line_rate = baud / BITS_PER_BYTE
+    frame_rate = line_rate * load / FRAME_SIZE
+    frame_count = max(1, int(duration * frame_rate))
+    # Write in batches of about 10ms of data
+    batch_size = max(1, int(frame_rate / 100))
+    analyzer = FrameAnalyzer()
+    state = {"done": False}
+
+    def write_frames():
+        try:
+            seq = 0
+            while seq < frame_count:
+                # Stay at the requested rate rather than overrunning
+                # the target
+                delay = start + seq / frame_rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                count = min(batch_size, frame_count - seq)
+                sp.write(bytes(make_frames(seq, count)))
+                seq += count
+        finally:
+            state["done"] = True
+
+    sp.flushInput()
+    start = time.time()
+    write_thread = Thread(target=write_frames)
+    write_thread.start()
+    last_rx_time = _read_frames(sp, analyzer, lambda: state["done"],
+                                calc_timeout(bytearray(FRAME_SIZE *
+                                                       batch_size), baud))
+    write_thread.join()
+    analyzer.finish(frame_count)
+
+    if last_rx_time is None:
+        test_info.failure("No data received")
+        return
+    elapsed = last_rx_time - start
+    rate = analyzer.bytes_received / elapsed
+    test_info.info("Sustained %i bytes/s (%.1f%% of line rate) over %.1fs" %
+                   (rate, rate * 100 / line_rate, elapsed))
+    analyzer.report(test_info)
+
+
+def _measure_burst(sp, baud, duration, test_info):
+    """Find the largest burst the target echoes without losing data"""
+    largest = None
+    size = FRAME_SIZE * 4
+    # Bursts that take longer than the benchmark duration are skipped
+    while size <= MAX_BURST_SIZE and \
+            size * BITS_PER_BYTE / baud <= duration:
+        frame_count = size // FRAME_SIZE
+        analyzer = FrameAnalyzer()
+        sp.flushInput()
+        write_thread = Thread(target=sp.write,
+                              args=(bytes(make_frames(0, frame_count)),))
+        write_thread.start()
+        _read_frames(sp, analyzer, lambda: not write_thread.is_alive(),
+                     calc_timeout(bytearray(FRAME_SIZE), baud))
+        write_thread.join()
+        analyzer.finish(frame_count)
+        if analyzer.lost_list or analyzer.repeated_list:
+            test_info.info("Burst of %i bytes lost %i bytes" %
+                           (size, analyzer.bytes_lost))
+            break
+        largest = size
+        size *= 2
+    if largest is None:
+        test_info.failure("Data lost on the smallest burst")
+    else:
+        test_info.info("Largest burst absorbed: %i bytes" % largest)
+
+
+def test_serial_throughput(workspace, parent_test, duration=10.0,
+                           baud_list=standard_baud, load=1.0):
+    """Benchmark sustained serial throughput and data loss
+
+    Requirements:
+        -daplink-validation must be loaded for the target.
+
+    Positional arguments:
+        workspace - test configuration containing the board
+        parent_test - TestInfo to add results to
+
+    Keyword arguments:
+        duration - seconds to stream data for at each baud
+        baud_list - list of baud rates to test
+        load - fraction of the line rate to send data at
+    """
+    assert duration > 0
+    assert 0 < load <= 1.0
+    test_info = parent_test.create_subtest("Serial throughput")
+    port = workspace.board.get_serial_port()
+    test_info.info("Testing serial port %s" % port)
+
+    with _open_port(port, baudrate=115200, timeout=1.0) as sp:
+        for baud in baud_list:
+            subtest = test_info.create_subtest("Baud %i" % baud)
+            with capture_failures(sp.capture, subtest):
+                if not _change_baud(workspace.board, sp, baud, subtest):
+                    continue
+                _measure_sustained(sp, baud, duration, load, subtest)
+                _measure_burst(sp, baud, duration, subtest)
+
+
+def test_serial_soak(board_list, parent_test, baud=115200, size=0x100000,
+                     window=1024):
+    """Echo data through the serial ports of many boards at once
+
+    Requirements:
+        -daplink-validation must be loaded for every target.
+
+    Positional arguments:
+        board_list - list of boards to test together
+        parent_test - TestInfo to add results to
+
+    Keyword arguments:
+        baud - baud rate to run every port at
+        size - number of bytes to echo through each port
+        window - most bytes in flight on each port
+    """
+    test_info = parent_test.create_subtest("Serial soak")
+    engine = SerialEngine()
+    result_list = []
+    sp_list = []
+    try:
+        for index, board in enumerate(board_list):
+            port = board.get_serial_port()
+            subtest = test_info.create_subtest("%s on %s" %
+                                               (board.name, port))
+            sp = _open_port(port, baudrate=115200, timeout=1.0)
+            sp_list.append(sp)
+            with capture_failures(sp.capture, subtest):
+                if not _change_baud(board, sp, baud, subtest):
+                    continue
+            stream = SerialStream(sp, SyntheticImage(size, seed=index),
+                                  window=window)
+            engine.add_stream(stream)
+            result_list.append((stream, subtest, sp.capture,
+                                sp.capture.count))
+        test_info.info("Echoing %i bytes at %i baud on %i ports" %
+                       (size, baud, len(result_list)))
+        engine.run(calc_timeout(bytearray(window), baud))
+        for stream, subtest, capture, start in result_list:
+            stream.report(subtest)
+            if subtest.get_failed():
+                attach_capture(capture, start, subtest)
+    finally:
+        for sp in sp_list:
+            sp.close()
+
+
+# Payload sizes sent by the latency benchmark
+LATENCY_PAYLOAD_SIZES = (1, 4, 16, 64)
+
+# Upper bounds of the latency histogram bins in seconds
+_LATENCY_BINS = (0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.032, 0.064,
+                 0.128, 0.256)
+
+_LATENCY_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _report_latency(rtt_list, test_info):
+    """Add percentiles and a histogram of round-trip times to test_info"""
+    rtt_list = sorted(rtt_list)
+    test_info.info("Round trip %s max %.2fms" %
+                   (", ".join("p%g %.2fms" % (percent,
+                                               percentile(rtt_list,
+                                                          percent) * 1000)
+                              for percent in _LATENCY_PERCENTILES),
+                    rtt_list[-1] * 1000))
+    counts = [0] * (len(_LATENCY_BINS) + 1)
+    for rtt in rtt_list:
+        for index, limit in enumerate(_LATENCY_BINS):
+            if rtt < limit:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+    lower = 0
+    for index, count in enumerate(counts):
+        if index < len(_LATENCY_BINS):
+            label = "%g-%gms" % (lower * 1000, _LATENCY_BINS[index] * 1000)
+            lower = _LATENCY_BINS[index]
+        else:
+            label = ">%gms" % (lower * 1000)
+        if count:
+            bar = "#" * int(50 * count / len(rtt_list) + 0.5)
+            test_info.info("    %-12s %6i %s" % (label, count, bar))
+
+
+def _measure_latency(sp, baud, size, count, test_info):
+    """Time count round trips of a size byte payload"""
+    rtt_list = []
+    errors = 0
+    sp.timeout = calc_timeout(bytearray(size), baud)
+    for index in range(count):
+        payload = bytes(bytearray((index + i) & 0xFF for i in range(size)))
+        start = time.time()
+        sp.write(payload)
+        resp = sp.read(size)
+        rtt = time.time() - start
+        if not _same(resp, payload):
+            errors += 1
+            _drain(sp)
+            sp.timeout = calc_timeout(bytearray(size), baud)
+            continue
+        rtt_list.append(rtt)
+    if errors:
+        test_info.failure("%i of %i round trips failed" % (errors, count))
+    if rtt_list:
+        _report_latency(rtt_list, test_info)
+    return rtt_list
+
+
+def test_serial_latency(workspace, parent_test, count=1000,
+                        baud_list=standard_baud, extra_baud_list=(),
+                        size_list=LATENCY_PAYLOAD_SIZES):
+    """Measure serial round-trip latency of small payloads
+
+    Requirements:
+        -daplink-validation must be loaded for the target.
+
+    Positional arguments:
+        workspace - test configuration containing the board
+        parent_test - TestInfo to add results to
+
+    Keyword arguments:
+        count - number of round trips for each payload size and baud
+        baud_list - list of baud rates to test
+        extra_baud_list - additional, possibly non-standard, rates
+        size_list - payload sizes in bytes
+    """
+    assert count > 0
+    assert all(0 < size <= 64 for size in size_list)
+    test_info = parent_test.create_subtest("Serial latency")
+    port = workspace.board.get_serial_port()
+    test_info.info("Testing serial port %s" % port)
+
+    with _open_port(port, baudrate=115200, timeout=1.0) as sp:
+        for baud in list(baud_list) + list(extra_baud_list):
+            baud_test = test_info.create_subtest("Baud %i" % baud)
+            with capture_failures(sp.capture, baud_test):
+                if not _change_baud(workspace.board, sp, baud, baud_test):
+                    continue
+                for size in size_list:
+                    subtest = baud_test.create_subtest("%i byte payload" %
+                                                       size)
+                    rtt_list = _measure_latency(sp, baud, size, count,
+                                                subtest)
+                    subtest.attach("round trip times", rtt_list)
+
+
+def test_serial_baud_matrix(workspace, parent_test, baud_list=baud_matrix):
+    """Echo data at every baud in a matrix and find the highest that works
+
+    Requirements:
+        -daplink-validation must be loaded for the target.
+
+    The target is only reset before a baud change if the previous rate
+    failed, since after a good rate the target is ready for the next
+    baud command.
+
+    Positional arguments:
+        workspace - test configuration containing the board
+        parent_test - TestInfo to add results to
+
+    Keyword arguments:
+        baud_list - list of baud rates to test in order
+    """
+    test_info = parent_test.create_subtest("Serial baud matrix")
+    board = workspace.board
+    port = board.get_serial_port()
+    test_info.info("Testing serial port %s" % port)
+
+    test_data = bytearray(range(256)) * 4 * 4
+    passed_list = []
+    failed_list = []
+    with _open_port(port, baudrate=115200, timeout=1.0) as sp:
+        reset = True
+        for baud in baud_list:
+            subtest = test_info.create_subtest("Baud %i" % baud)
+            with capture_failures(sp.capture, subtest):
+                passed = (_change_baud(board, sp, baud, subtest, reset) and
+                          _echo_test(sp, test_data,
+                                     calc_timeout(test_data, baud),
+                                     subtest, "%i baud" % baud))
+            reset = not passed
+            if passed:
+                subtest.info("Pass")
+                passed_list.append(baud)
+            else:
+                failed_list.append(baud)
+
+    hic_name = info.get_hic_name(board.hic_id)
+    if passed_list:
+        test_info.info("Highest baud without errors on HIC %s: %i" %
+                       (hic_name, max(passed_list)))
+    else:
+        test_info.failure("No baud worked on HIC %s" % hic_name)
+    if failed_list:
+        test_info.info("Baud rates with errors: %s" %
+                       ", ".join(str(baud) for baud in failed_list))
+
+
+_RESET_PERCENTILES = (50, 90, 99)
+
+
+def test_serial_reset(workspace, parent_test, count=100):
+    """Benchmark how long the target takes to restart after a break
+
+    Requirements:
+        -daplink-validation must be loaded for the target.
+
+    Positional arguments:
+        workspace - test configuration containing the board
+        parent_test - TestInfo to add results to
+
+    Keyword arguments:
+        count - number of resets to time
+    """
+    assert count > 0
+    test_info = parent_test.create_subtest("Serial reset")
+    board = workspace.board
+    port = board.get_serial_port()
+    test_info.info("Resetting target through %s %i times" % (port, count))
+
+    stats = TimingStats()
+    total_list = []
+    errors = 0
+    with _open_port(port, baudrate=115200, timeout=1.0) as sp, \
+            capture_failures(sp.capture, test_info):
+        for _ in range(count):
+            timeline = _reset_target(board, sp, test_info)
+            if timeline is None:
+                errors += 1
+                _drain(sp)
+                continue
+            stats.add_timeline(timeline)
+            total_list.append(timeline.total)
+    if errors:
+        test_info.failure("%i of %i resets failed" % (errors, count))
+    if not total_list:
+        return
+
+    def summarize(name, duration_list):
+        duration_list = sorted(duration_list)
+        test_info.info("%s: %s, max %.2fms" %
+                       (name, ", ".join("p%g %.2fms" %
+                                        (percent,
+                                         percentile(duration_list,
+                                                    percent) * 1000)
+                                        for percent in _RESET_PERCENTILES),
+                        duration_list[-1] * 1000))
+
+    summarize("Break to ready", total_list)
+    for phase in (PHASE_SERIAL_BREAK, PHASE_FIRST_BYTE, PHASE_INIT_MSG):
+        summarize(phase, stats.get_durations(phase))
+    test_info.attach("reset times", total_list)
@@ -0,0 +1,110 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Reuse of one pyOCD session per board across tests
+
+Opening a session enumerates the USB HID devices and initializes the
+debug port, which takes far longer than most of the reads done with
+it.  A SessionPool keeps its board's session connected between uses
+and only reconnects when the session has been released.
+
+Sessions must be released before anything that makes the board
+re-enumerate, such as a mass storage load or a mode change, since the
+HID handle does not survive it.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import time
+from contextlib import contextmanager
+from pyOCD.board import MbedBoard
+
+
+class SessionPool(object):
+    """Lazily connected pyOCD session for a single board
+
+    Positional arguments:
+        unique_id - unique ID of the board to connect to
+    """
+
+    def __init__(self, unique_id):
+        self._unique_id = unique_id
+        self._session = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Clear the counts of sessions opened and reused"""
+        self.open_count = 0
+        self.open_time = 0.0
+        self.reuse_count = 0
+
+    @property
+    def connected(self):
+        return self._session is not None
+
+    def get(self):
+        """Return the connected MbedBoard, opening a session if needed"""
+        if self._session is not None:
+            self.reuse_count += 1
+            return self._session
+        start = time.time()
+        self._session = MbedBoard.chooseBoard(board_id=self._unique_id)
+        self.open_time += time.time() - start
+        self.open_count += 1
+        return self._session
+
+    def release(self, resume=True):
+        """Close the session if open, resuming the target if resume is set
+
+        Errors closing a session that has already failed are ignored.
+        """
+        session = self._session
+        if session is None:
+            return
+        self._session = None
+        try:
+            session.uninit(resume)
+        except Exception:
+            pass
+
+    @contextmanager
+    def session(self):
+        """Context manager giving the pooled session
+
+        The session stays open afterwards unless the block raises, in
+        which case it is closed so the next use reconnects.
+        """
+        session = self.get()
+        try:
+            yield session
+        except Exception:
+            self.release()
+            raise
+
+    def get_time_saved(self):
+        """Return the estimated seconds saved by reusing sessions"""
+        if self.open_count == 0:
+            return 0.0
+        return self.reuse_count * self.open_time / self.open_count
+
+    def report(self, test_info, name):
+        """Add the number of sessions opened and reused to test_info"""
+        test_info.info("%s: %i opened in %.2fs, %i reused saving about "
+                       "%.2fs" % (name, self.open_count, self.open_time,
+                                  self.reuse_count, self.get_time_saved()))
@@ -0,0 +1,210 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Lazily generated test images
+
+Images are produced on demand in blocks, so an image of any size can be
+written to the drive and checked against the target without ever being
+held in memory as a whole.  The same seed always produces the same data.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import binascii
+import random
+import six
+from hex_encoder import (HEX_RECORD_SIZE, HEX_EOF_RECORD, encode_records,
+                         encoded_size)
+
+# Size of each independently generated block of data
+BLOCK_SIZE = 0x1000
+
+# Default size of the pieces data is streamed and verified in
+DEFAULT_CHUNK_SIZE = 0x10000
+
+
+def iter_chunks(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield (offset, chunk) tuples for a bytearray or an image source"""
+    assert chunk_size > 0
+    if type(data) is bytearray:
+        for offset in range(0, len(data), chunk_size):
+            yield offset, data[offset:offset + chunk_size]
+    else:
+        for offset, chunk in data.iter_chunks(chunk_size):
+            yield offset, chunk
+
+
+def crc32(data, size=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return the crc32 of the first size bytes of data
+
+    Data can either be a bytearray or an image source.
+    """
+    if size is None:
+        size = len(data)
+    assert 0 <= size <= len(data)
+    crc = 0
+    for offset, chunk in iter_chunks(data, chunk_size):
+        if offset >= size:
+            break
+        crc = binascii.crc32(bytes(chunk[0:size - offset]), crc)
+    return crc & 0xFFFFFFFF
+
+
+def compare(expected_data, read_func, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Compare the expected data against data read back one chunk at a time
+
+    Positional arguments:
+        expected_data - a bytearray or an image source
+        read_func - function taking (offset, size) and returning a
+            bytearray, such as DaplinkBoard.read_target_memory
+
+    Return:
+        The offset of the first byte that differs, or None if all
+        data matches.
+    """
+    for offset, expected in iter_chunks(expected_data, chunk_size):
+        actual = read_func(offset, len(expected))
+        if actual == expected:
+            continue
+        for i in range(min(len(expected), len(actual))):
+            if expected[i] != actual[i]:
+                return offset + i
+        return offset + min(len(expected), len(actual))
+    return None
+
+
+class SyntheticImage(object):
+    """Deterministic, seekable binary image of any size
+
+    Data is pseudo-random and generated per block from the seed, so any
+    region can be read without generating what comes before it.  If a
+    vector table is given it is placed at the start of the image so the
+    image passes DAPLink's vector table validation.
+    """
+
+    def __init__(self, size, seed=0, vector_table=None):
+        assert isinstance(size, six.integer_types)
+        assert size > 0
+        assert vector_table is None or type(vector_table) is bytearray
+        assert vector_table is None or len(vector_table) <= size
+        self._size = size
+        self._seed = seed
+        self._vector_table = vector_table
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def seed(self):
+        return self._seed
+
+    def read(self, offset, size):
+        """Return size bytes starting at offset as a bytearray"""
+        assert 0 <= offset <= self._size
+        size = min(size, self._size - offset)
+        data = bytearray()
+        block = offset // BLOCK_SIZE
+        pos = block * BLOCK_SIZE
+        while pos < offset + size:
+            block_data = self._gen_block(block)
+            start = max(offset - pos, 0)
+            end = min(offset + size - pos, len(block_data))
+            data.extend(block_data[start:end])
+            block += 1
+            pos += BLOCK_SIZE
+        return data
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield (offset, chunk) tuples covering the whole image"""
+        for offset in range(0, self._size, chunk_size):
+            yield offset, self.read(offset, chunk_size)
+
+    def _gen_block(self, block):
+        start = block * BLOCK_SIZE
+        size = min(BLOCK_SIZE, self._size - start)
+        rand = random.Random((self._seed << 32) | block)
+        data = bytearray(binascii.unhexlify('%0*x' %
+                                            (size * 2,
+                                             rand.getrandbits(size * 8))))
+        if self._vector_table is not None and start < len(self._vector_table):
+            overlap = min(size, len(self._vector_table) - start)
+            data[0:overlap] = self._vector_table[start:start + overlap]
+        return data
+
+
+class SyntheticHexImage(object):
+    """Streamed intel hex representation of an image source
+
+    The hex text is generated a piece at a time while iterating, so
+    the full file contents never exist in memory.
+    """
+
+    def __init__(self, image, start_addr=0, record_size=HEX_RECORD_SIZE):
+        assert 0 < record_size <= 0xFF
+        self._image = image
+        self._start_addr = start_addr
+        self._record_size = record_size
+        self._size = None
+
+    def __len__(self):
+        if self._size is None:
+            size = len(HEX_EOF_RECORD)
+            for addr, length, upper_addr in self._pieces():
+                size += encoded_size(addr, length, self._record_size,
+                                     upper_addr)
+            self._size = size
+        return self._size
+
+    @property
+    def image(self):
+        """The binary image this hex file represents"""
+        return self._image
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield (offset, chunk) tuples of hex text covering the whole file"""
+        offset = 0
+        buf = bytearray()
+        for text in self._iter_text():
+            buf.extend(text)
+            while len(buf) >= chunk_size:
+                yield offset, buf[0:chunk_size]
+                del buf[0:chunk_size]
+                offset += chunk_size
+        if buf:
+            yield offset, buf
+
+    def _pieces(self):
+        """Yield (address, length, upper address) for each encoded piece"""
+        size = len(self._image)
+        # Like intelhex, only use extended address records when needed
+        upper_addr = 0 if self._start_addr + size <= 0x10000 else None
+        # Split on 64KB address boundaries, where records restart anyway
+        addr = self._start_addr
+        end = self._start_addr + size
+        while addr < end:
+            length = min(0x10000 - (addr & 0xFFFF), end - addr)
+            yield addr, length, upper_addr
+            upper_addr = (addr + length - 1) >> 16
+            addr += length
+
+    def _iter_text(self):
+        for addr, length, upper_addr in self._pieces():
+            data = self._image.read(addr - self._start_addr, length)
+            yield encode_records(addr, data, self._record_size, upper_addr)
+        yield HEX_EOF_RECORD
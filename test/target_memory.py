@@ -0,0 +1,240 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Memory layout of each target, indexed by pyOCD target type
+
+The layouts are read from the target_device structure in the target
+source of every board listed in records/board, so a board added to the
+project is covered by the HID test without code changes.  Targets
+pyOCD supports but that have no target source in this project are
+listed in _EXTRA_TARGET_LIST.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+import os
+import re
+import yaml
+
+# Size of the block written and read back by the HID test.  The odd
+# size makes the transfer end part way through a word.
+DEFAULT_BLOCK_SIZE = 0x502
+
+# HID test settings that differ from those derived from the layout.
+# Targets with more RAM are given longer block transfers.  Targets the
+# test supported before layouts were loaded keep their flash test
+# address, known to be clear of the test image.
+_TEST_OVERRIDES = {
+    'lpc1768': {'block_size': 0x1102, 'flash_test_addr': 0x10000},
+    'k22f': {'block_size': 0x8002, 'flash_test_addr': 0x10000},
+    'efm32gg': {'block_size': 0x8002},
+    'k24f': {'block_size': 0x10002},
+    'k64f': {'block_size': 0x10002, 'flash_test_addr': 0x10000},
+    'kl05z': {'flash_test_addr': 0x6000},
+    'kl46z': {'flash_test_addr': 0x10000},
+    # The upper half of flash is too few 128KB sectors for the page test
+    'stm32f411': {'flash_test_addr': 0x08020000},
+}
+
+# Target directory name in source/target to pyOCD target type, for
+# targets where the two differ
+_TARGET_DIR_TO_TYPE = {
+    'k20dx': 'k20d50m',
+    'lpc812': 'lpc800',
+    'lpc1114': 'lpc11xx_32',
+    'nrf51822': 'nrf51',
+}
+
+# Kinetis parts split RAM into two blocks at this address and a single
+# access cannot cross it, so only the upper block is used for testing
+_KINETIS_RAM_SPLIT = 0x20000000
+
+_TARGET_DEVICE_RE = re.compile(r"target_cfg_t\s+target_device\s*=\s*{")
+_FIELD_RE = re.compile(r"\.(sector_size|flash_start|flash_end|ram_start|"
+                       r"ram_end)\s*=\s*([^,]+),")
+_SIZE_MACRO_RE = re.compile(r"\b(KB|MB)\(\s*(\w+)\s*\)")
+_SIZE_MACRO_TO_SCALE = {'KB': 1024, 'MB': 1024 * 1024}
+
+
+class TargetMemory(object):
+    """Memory layout of a target and the HID test settings derived from it
+
+    Positional arguments:
+        target_type - pyOCD target type
+        ram_start, ram_end - RAM the test may overwrite
+        flash_start, flash_end - internal flash
+
+    Keyword arguments:
+        sector_size - flash sector size reported by the DAPLink target
+            code, or None if unknown
+        block_size - size of the HID block transfer test
+        flash_test_addr - start of the 3 pages erased and programmed by
+            the HID test, or None for the middle of flash
+        bin_addr - address the test binary is loaded to, or None for
+            the start of flash
+        board_list - names of the boards using this target
+    """
+
+    def __init__(self, target_type, ram_start, ram_end, flash_start,
+                 flash_end, sector_size=None, block_size=DEFAULT_BLOCK_SIZE,
+                 flash_test_addr=None, bin_addr=None, board_list=()):
+        assert ram_start < ram_end
+        assert flash_start < flash_end
+        self.target_type = target_type
+        self.ram_start = ram_start
+        self.ram_end = ram_end
+        self.flash_start = flash_start
+        self.flash_end = flash_end
+        self.sector_size = sector_size
+        self.block_size = block_size
+        if flash_test_addr is None:
+            flash_test_addr = flash_start + (flash_end - flash_start) // 2
+            if sector_size:
+                flash_test_addr -= flash_test_addr % sector_size
+        self.flash_test_addr = flash_test_addr
+        self.bin_addr = flash_start if bin_addr is None else bin_addr
+        self.board_list = list(board_list)
+        assert self.test_addr + block_size <= ram_end, \
+            "Block size 0x%x too large for %s" % (block_size, target_type)
+
+    @property
+    def test_ram_start(self):
+        """Start of the RAM a single access may cover"""
+        if self.ram_start < _KINETIS_RAM_SPLIT < self.ram_end:
+            return _KINETIS_RAM_SPLIT
+        return self.ram_start
+
+    @property
+    def test_ram_size(self):
+        """Size of the RAM starting at test_ram_start"""
+        return self.ram_end - self.test_ram_start
+
+    @property
+    def test_addr(self):
+        """Unaligned RAM address for the memory tests"""
+        return self.test_ram_start + 1
+
+    def __str__(self):
+        return ("%s: RAM 0x%08x-0x%08x, flash 0x%08x-0x%08x, block 0x%x" %
+                (self.target_type, self.ram_start, self.ram_end,
+                 self.flash_start, self.flash_end, self.block_size))
+
+
+# Targets pyOCD supports that have no target source in this project.
+# Only the memory the HID test is known to work with is listed.
+_EXTRA_TARGET_LIST = [
+    TargetMemory('lpc11u24', 0x10000000, 0x10001000, 0, 0x8000),
+    TargetMemory('kl28z', 0x20000000, 0x20001000, 0, 0x80000,
+                 flash_test_addr=0x10000),
+    TargetMemory('lpc4330', 0x10000000, 0x10002000, 0x14000000, 0x14400000,
+                 block_size=0x1102, flash_test_addr=0x14010000),
+    TargetMemory('maxwsnenv', 0x20000000, 0x20001000, 0, 0x40000,
+                 flash_test_addr=0x10000),
+    TargetMemory('max32600mbed', 0x20000000, 0x20001000, 0, 0x40000,
+                 flash_test_addr=0x10000),
+    TargetMemory('w7500', 0x20000000, 0x20002000, 0, 0x20000,
+                 block_size=0x1102, flash_test_addr=0),
+]
+
+_target_type_to_memory = None
+
+
+def _eval_size(expression):
+    """Evaluate a sum of integers and KB()/MB() macros from C source"""
+    expression = _SIZE_MACRO_RE.sub(
+        lambda match: str(int(match.group(2), 0) *
+                          _SIZE_MACRO_TO_SCALE[match.group(1)]),
+        expression)
+    return sum(int(term.strip(), 0) for term in expression.split('+'))
+
+
+def parse_target_source(path):
+    """Return a dict of the memory fields of target_device in path
+
+    None is returned if the file does not define target_device.
+    """
+    with open(path) as source_file:
+        source = source_file.read()
+    match = _TARGET_DEVICE_RE.search(source)
+    if match is None:
+        return None
+    end = source.find('};', match.end())
+    fields = {}
+    for name, value in _FIELD_RE.findall(source[match.end():end]):
+        fields[name] = _eval_size(value)
+    return fields
+
+
+def load_target_memory(daplink_dir):
+    """Return a dict of pyOCD target type to TargetMemory
+
+    When several boards use the same target with different layouts, as
+    the nRF51822 variants do, the smallest RAM and flash are used.
+    """
+    record_dir = os.path.join(daplink_dir, 'records', 'board')
+    type_to_fields = {}
+    type_to_boards = {}
+    for file_name in sorted(os.listdir(record_dir)):
+        board_name, extension = os.path.splitext(file_name)
+        if extension != '.yaml':
+            continue
+        with open(os.path.join(record_dir, file_name)) as record_file:
+            record = yaml.safe_load(record_file)
+        sources = record.get('common', {}).get('sources', {})
+        for path in sources.get('target', []):
+            # Bootloader records list the interface chip as the target
+            if not path.startswith('source/target/') or \
+                    not path.endswith('.c'):
+                continue
+            fields = parse_target_source(os.path.join(daplink_dir, path))
+            if fields is None:
+                continue
+            target_dir = os.path.basename(os.path.dirname(path))
+            target_type = _TARGET_DIR_TO_TYPE.get(target_dir, target_dir)
+            type_to_boards.setdefault(target_type, []).append(board_name)
+            if target_type in type_to_fields:
+                old = type_to_fields[target_type]
+                fields['ram_end'] = min(fields['ram_end'], old['ram_end'])
+                fields['flash_end'] = min(fields['flash_end'],
+                                          old['flash_end'])
+            type_to_fields[target_type] = fields
+
+    type_to_memory = {}
+    for memory in _EXTRA_TARGET_LIST:
+        type_to_memory[memory.target_type] = memory
+    for target_type, fields in type_to_fields.items():
+        type_to_memory[target_type] = TargetMemory(
+            target_type, fields['ram_start'], fields['ram_end'],
+            fields['flash_start'], fields['flash_end'],
+            sector_size=fields.get('sector_size'),
+            board_list=type_to_boards[target_type],
+            **_TEST_OVERRIDES.get(target_type, {}))
+    return type_to_memory
+
+
+def get_target_memory(target_type):
+    """Return the TargetMemory for a pyOCD target type or None
+
+    The layouts are loaded from the project on the first call.
+    """
+    global _target_type_to_memory
+    if _target_type_to_memory is None:
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        _target_type_to_memory = load_target_memory(os.path.dirname(test_dir))
+    return _target_type_to_memory.get(target_type)
@@ -19,11 +19,14 @@
 from __future__ import absolute_import
 
 import os
-import binascii
 import intelhex
 import cStringIO
 from msd_test import (MassStorageTester, MOCK_DIR_LIST, MOCK_FILE_LIST,
                       MOCK_DIR_LIST_AFTER, MOCK_FILE_LIST_AFTER)
+from synthetic_image import crc32
+from timing import PHASE_MODE_SWITCH
+from hex_encoder import HexCache
+from image_mutation import ImageMutator, MSG_IAP_INCOMPLETE, run_variants
 
 TRIGGER_ASSERT_FILE_NAME = "ASSERT.ACT"
 ASSERT_FILE_NAME = "ASSERT.TXT"
@@ -32,6 +35,9 @@ DAPLINK_VECTOR_TABLE_OFFSET = 0x00
 DAPLINK_BUILD_KEY_OFFSET = 0x20
 DAPLINK_HIC_ID_OFFSET = 0x24
 
+# Images are re-encoded many times with identical contents
+_hex_cache = HexCache()
+
 
 def intel_hex_get_sections(intel_hex):
     """Return list of address, size tuples"""
@@ -58,14 +64,8 @@ def intel_hex_get_sections(intel_hex):
 
 
 def bin_data_to_hex_data(addr, data):
-    """Covert binary data to a string in intel hex format"""
-    intel_hex = intelhex.IntelHex()
-    intel_hex.puts(addr, data)
-    sio = cStringIO.StringIO()
-    intel_hex.tofile(sio, format='hex')
-    hex_data = sio.getvalue()
-    hex_data = bytearray(hex_data)
-    return hex_data
+    """Covert binary data to a bytearray in intel hex format"""
+    return _hex_cache.bin_to_hex(addr, data)
 
 
 class DLMassStorageTester(MassStorageTester):
@@ -85,7 +85,8 @@ class DLMassStorageTester(MassStorageTester):
 
     def run(self):
         # Set board to the correct mode before running test
-        self.board.set_mode(self._test_mode)
+        with self._timeline.phase(PHASE_MODE_SWITCH):
+            self.board.set_mode(self._test_mode)
 
         super(DLMassStorageTester, self).run()
 
@@ -104,7 +105,7 @@ class DLMassStorageTester(MassStorageTester):
             test_info.info("CRC not in details.txt")
             return False
         actual_crc32 = int(self.board.details_txt[self._crc_tag], 16)
-        expected_crc32 = binascii.crc32(expected_data[0:-4]) & 0xFFFFFFFF
+        expected_crc32 = crc32(expected_data, len(expected_data) - 4)
         test_info.info("Expected CRC: 0x%08x, actual crc: 0x%08x" %
                        (expected_crc32, actual_crc32))
         return actual_crc32 == expected_crc32
@@ -409,6 +410,14 @@ def test_file_type(file_type, board_mode, board, parent_test,
     test.set_expected_data(raw_data)
     test.run()
 
+    # Test corrupt and edge case variants of the image
+    def tester_factory(parent_test, test_name):
+        return DLMassStorageTester(board, parent_test, test_name, board_mode)
+    mutator = ImageMutator(raw_data, data_start,
+                           incomplete_msg=MSG_IAP_INCOMPLETE)
+    run_variants(board, test_info.create_subtest("Image variants"),
+                 mutator.iter_variants(file_type), tester_factory)
+
     # Restore good image
     file_name = get_file_name()
     local_data = get_file_content(data_start, raw_data)
@@ -416,4 +425,4 @@ def test_file_type(file_type, board_mode, board, parent_test,
                                board_mode)
     test.set_programming_data(local_data, file_name)
     test.set_expected_data(raw_data)
-
+    test.run()
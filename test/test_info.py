@@ -18,11 +18,96 @@
  
 from __future__ import absolute_import
 from __future__ import print_function
+import os
 import six
 import sys
+import tempfile
+import threading
+
+
+class _SpilledMsg(object):
+    """Location of a message in an InfoSpill file"""
+
+    __slots__ = ('offset', 'length', 'is_text')
+
+    def __init__(self, offset, length, is_text):
+        self.offset = offset
+        self.length = length
+        self.is_text = is_text
+
+
+class InfoSpill(object):
+    """File holding the INFO messages of a tree beyond a budget
+
+    The first budget INFO messages added to the tree stay in memory and
+    later ones are written to a temporary file, which is deleted when
+    the InfoSpill is closed or freed.  Messages are read back one at a
+    time as they are printed.
+
+    Positional arguments:
+        budget - most INFO messages kept in memory
+
+    Keyword arguments:
+        directory - directory for the file, or None for the temporary
+            directory
+    """
+
+    def __init__(self, budget, directory=None):
+        assert budget >= 0
+        self.budget = budget
+        self.in_memory_count = 0
+        self.spilled_count = 0
+        self._directory = directory
+        self._file = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def store(self, msg):
+        """Return msg, or where it was written once over budget"""
+        if self.in_memory_count < self.budget:
+            self.in_memory_count += 1
+            return msg
+        is_text = isinstance(msg, six.text_type)
+        data = msg.encode('utf-8') if is_text else msg
+        with self._lock:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(dir=self._directory)
+            self._file.seek(self._size, os.SEEK_SET)
+            self._file.write(data)
+            spilled = _SpilledMsg(self._size, len(data), is_text)
+            self._size += len(data)
+            self.spilled_count += 1
+        return spilled
+
+    def load(self, spilled):
+        """Return a message written by store"""
+        with self._lock:
+            self._file.seek(spilled.offset, os.SEEK_SET)
+            data = self._file.read(spilled.length)
+        return data.decode('utf-8') if spilled.is_text else data
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
 
 
 class TestInfo(object):
+    """Results of a test and its subtests
+
+    Failure, warning and info counts include all subtests.  They are
+    kept up to date as entries are added, by adding each entry to the
+    counts of the test and all of its parents, so reading them does not
+    walk the tree.
+
+    After set_info_budget only a set number of INFO messages are kept
+    in memory, and later ones are kept on disk until printed.
+    """
+
+    __slots__ = ('_all', '_attachments', '_parent', '_sink', '_spill',
+                 'failures', 'warnings', 'infos', 'name')
+
     # Higher number = more severe
     SUBTEST = 0
     INFO = 1
@@ -38,10 +123,14 @@ class TestInfo(object):
 
     def __init__(self, name):
         self._all = []
+        self._parent = None
+        self._sink = None
+        self._spill = None
         self.failures = 0
         self.warnings = 0
         self.infos = 0
         self.name = name
+        self._attachments = {}
 
     def failure(self, msg):
         assert isinstance(msg, six.string_types)
@@ -102,25 +191,97 @@ class TestInfo(object):
             else:
                 fmt = prefix + self._MSG_LEVEL_TO_FMT_STR[msg_level]
                 if msg_level >= warning_level:
-                    print(fmt % msg, file=log_file)
+                    print(fmt % self._load_msg(msg), file=log_file)
 
     def get_failed(self):
-        self._update_counts()
         return self.failures != 0
 
     def get_warning(self):
-        self._update_counts()
         return self.warnings != 0
 
     def get_name(self):
         return self.name
 
+    def attach(self, name, data):
+        """Attach a named object, such as timing data, to this test"""
+        assert isinstance(name, six.string_types)
+        self._attachments[name] = data
+
+    def get_attachment(self, name, default=None):
+        return self._attachments.get(name, default)
+
+    def get_attachments(self):
+        """Return a dictionary of all attachments"""
+        return dict(self._attachments)
+
     def create_subtest(self, name):
         assert isinstance(name, six.string_types)
         test_info = TestInfo(name)
         self._add_entry(self.SUBTEST, test_info)
         return test_info
 
+    def add_subtest(self, test_info):
+        """Add an existing TestInfo, such as one run in another process"""
+        assert isinstance(test_info, TestInfo)
+        assert test_info._parent is None, "Test already has a parent"
+        self._add_entry(self.SUBTEST, test_info)
+
+    def set_event_sink(self, sink):
+        """Send events for this test and its subtests to sink
+
+        sink is an event_log.JsonLinesSink or an object with the same
+        start_test and add_entry methods.  Entries already added are
+        sent straight away.
+        """
+        self._set_sink(sink)
+        sink.start_test(self)
+
+    def set_info_budget(self, budget, directory=None):
+        """Keep at most budget INFO messages of this tree in memory
+
+        INFO messages added afterwards to this test or its subtests
+        beyond the budget are written to a file in directory, or in the
+        temporary directory if directory is None.  Failures, warnings
+        and subtests always stay in memory.
+        """
+        self._set_spill(InfoSpill(budget, directory))
+
+    def get_entries(self):
+        """Return a list of (entry_type, msg) with all messages loaded"""
+        return [(entry_type, self._load_msg(msg))
+                for entry_type, msg in self._all]
+
+    def _set_spill(self, spill):
+        self._spill = spill
+        for entry_type, msg in self._all:
+            if entry_type == self.SUBTEST:
+                msg._set_spill(spill)
+
+    def _load_msg(self, msg):
+        if isinstance(msg, _SpilledMsg):
+            return self._spill.load(msg)
+        return msg
+
+    def _set_sink(self, sink):
+        self._sink = sink
+        for entry_type, msg in self._all:
+            if entry_type == self.SUBTEST:
+                msg._set_sink(sink)
+
+    def __getstate__(self):
+        # The sink stays with the process writing the log
+        state = dict((name, getattr(self, name))
+                     for name in TestInfo.__slots__)
+        state['_sink'] = None
+        # Spilled messages are sent with the tree
+        state['_all'] = self.get_entries()
+        state['_spill'] = None
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def get_counts(self):
         """
         Return the number of events that occured
@@ -128,37 +289,42 @@ class TestInfo(object):
         Return the number of even messages as a
         tuple containing (failure_count, warning_count, info_count).
         """
-        self._update_counts()
         return self.failures, self.warnings, self.infos
 
-    def _update_counts(self):
-        self.failures, self.warnings, self.infos = 0, 0, 0
-        for msg_level, msg in self._all:
-            if msg_level == self.SUBTEST:
-                test_info = msg
-                failures, warnings, infos = test_info.get_counts()
-                self.failures += failures
-                self.warnings += warnings
-                self.infos += infos
-            else:
-                if msg_level == self.FAILURE:
-                    self.failures += 1
-                elif msg_level == self.WARNING:
-                    self.warnings += 1
-                elif msg_level == self.INFO:
-                    self.infos += 1
-                else:
-                    # Should never get here
-                    assert False
+    def _add_counts(self, failures, warnings, infos):
+        """Add to the counts of this test and all of its parents"""
+        test_info = self
+        while test_info is not None:
+            test_info.failures += failures
+            test_info.warnings += warnings
+            test_info.infos += infos
+            test_info = test_info._parent
 
     def _add_entry(self, entry_type, msg):
         if entry_type is self.SUBTEST:
             assert isinstance(msg, TestInfo)
             self._print_msg("SubTest: " + msg.get_name())
+            msg._parent = self
+            counts = msg.get_counts()
         else:
             assert isinstance(msg, six.string_types)
             self._print_msg(msg)
-        self._all.append((entry_type, msg))
+            counts = (int(entry_type == self.FAILURE),
+                      int(entry_type == self.WARNING),
+                      int(entry_type == self.INFO))
+        stored = msg
+        if self._spill is not None:
+            if entry_type is self.SUBTEST:
+                msg._set_spill(self._spill)
+            elif entry_type == self.INFO:
+                stored = self._spill.store(msg)
+        self._all.append((entry_type, stored))
+        if any(counts):
+            self._add_counts(*counts)
+        if self._sink is not None:
+            if entry_type is self.SUBTEST:
+                msg._set_sink(self._sink)
+            self._sink.add_entry(self, entry_type, msg)
 
     @staticmethod
     def _print_msg(msg):
@@ -167,6 +333,8 @@ class TestInfo(object):
 
 class TestInfoStub(TestInfo):
 
+    __slots__ = ()
+
     def __init__(self):
         super(TestInfoStub, self).__init__('stub test')
 
@@ -0,0 +1,136 @@
+#
+# DAPLink Interface Firmware
+# Copyright (c) 2009-2016, ARM Limited, All Rights Reserved
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import absolute_import
+from __future__ import division
+import time
+from contextlib import contextmanager
+
+# Phases of a mass storage load
+PHASE_MODE_SWITCH = "mode switch"
+PHASE_MOCK_FILES = "mock file setup"
+PHASE_HOST_WRITE = "host write"
+PHASE_UNMOUNT_WAIT = "unmount wait"
+PHASE_MOUNT_WAIT = "mount wait"
+PHASE_TEST_FS = "test_fs"
+PHASE_TEST_FS_CONTENTS = "test_fs_contents"
+PHASE_FAILURE_MSG = "failure message read"
+PHASE_VERIFY = "data verification"
+
+# Phases of a target reset through a break on the serial port
+PHASE_SERIAL_BREAK = "send break"
+PHASE_FIRST_BYTE = "break to first byte"
+PHASE_INIT_MSG = "first byte to init"
+
+# Name used when attaching a timeline to a TestInfo
+TIMELINE_ATTACHMENT = "timeline"
+
+
+def percentile(sorted_list, percent):
+    """Return the nearest rank percentile of a sorted list"""
+    index = int(len(sorted_list) * percent / 100.0 + 0.5) - 1
+    return sorted_list[min(max(index, 0), len(sorted_list) - 1)]
+
+
+class Timeline(object):
+    """Ordered record of how long each phase of an operation took"""
+
+    def __init__(self):
+        self._entries = []
+
+    def add(self, phase, duration):
+        """Record that phase took duration seconds"""
+        self._entries.append((phase, duration))
+
+    @contextmanager
+    def phase(self, phase):
+        """Context manager recording the time spent in the block"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(phase, time.time() - start)
+
+    def get_entries(self):
+        """Return a list of (phase, duration) tuples in the order recorded"""
+        return list(self._entries)
+
+    def get_totals(self):
+        """Return a list of (phase, total duration) tuples
+
+        Phases that occurred more than once are summed and listed in
+        the order they first occurred.
+        """
+        phase_list = []
+        totals = {}
+        for phase, duration in self._entries:
+            if phase not in totals:
+                phase_list.append(phase)
+                totals[phase] = 0
+            totals[phase] += duration
+        return [(phase, totals[phase]) for phase in phase_list]
+
+    @property
+    def total(self):
+        return sum(duration for _, duration in self._entries)
+
+    def __str__(self):
+        return ", ".join("%s %.3fs" % (phase, duration) for
+                         phase, duration in self.get_totals())
+
+
+class TimingStats(object):
+    """Per phase statistics aggregated from many timelines"""
+
+    def __init__(self):
+        self._phase_list = []
+        self._phase_to_durations = {}
+
+    def reset(self):
+        self._phase_list = []
+        self._phase_to_durations = {}
+
+    def add_timeline(self, timeline):
+        for phase, duration in timeline.get_totals():
+            if phase not in self._phase_to_durations:
+                self._phase_list.append(phase)
+                self._phase_to_durations[phase] = []
+            self._phase_to_durations[phase].append(duration)
+
+    def get_durations(self, phase):
+        """Return a list of the recorded durations of phase"""
+        return list(self._phase_to_durations.get(phase, []))
+
+    def get_phase_stats(self):
+        """Return a list of (phase, count, total, min, max) tuples"""
+        stats = []
+        for phase in self._phase_list:
+            durations = self._phase_to_durations[phase]
+            stats.append((phase, len(durations), sum(durations),
+                          min(durations), max(durations)))
+        return stats
+
+    def report(self, parent_test, name):
+        """Log the statistics to a new subtest of parent_test"""
+        test_info = parent_test.create_subtest(name)
+        for phase, count, total, min_time, max_time in self.get_phase_stats():
+            test_info.info("%s: count %i, total %.3fs, avg %.3fs, "
+                           "min %.3fs, max %.3fs" %
+                           (phase, count, total, total / count,
+                            min_time, max_time))
+        return test_info